@@ -0,0 +1,230 @@
+import asyncio
+import logging
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Q, When
+
+from .models import Chat, ChatReadCursor, Message
+from .rooms import forget_chat, use_async_orm
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+DEFAULTS = {
+    # flush as soon as this many messages are pending
+    'BATCH_SIZE': 100,
+    # ... or once the oldest pending message waited this long (seconds)
+    'FLUSH_INTERVAL': 0.05,
+    # commit batches one at a time, in the order messages were received
+    'ORDERED': True,
+    # wait for the DB commit before fanning a message out to the room
+    'STRICT': False,
+}
+
+
+def get_buffer_settings():
+    return {**DEFAULTS, **getattr(settings, 'CHAT_MESSAGE_BUFFER', {})}
+
+
+def summarize(messages):
+    """Chat id -> (messages in the batch, the last one received) for a batch."""
+    summary = {}
+    for message in messages:
+        count, _ = summary.get(message.chat_id, (0, None))
+        summary[message.chat_id] = (count + 1, message)
+    return summary
+
+
+def summary_update(count, message):
+    """
+    The inbox summary fields of a chat after `count` more messages, ending
+    with `message`. Unordered batches can commit out of order, so the last
+    message only moves forward in time.
+    """
+    newer = Q(last_message_at__isnull=True) | Q(last_message_at__lte=message.created_at)
+    return {
+        'message_count': F('message_count') + count,
+        'last_message': Case(
+            When(newer, then=message.pk), default=F('last_message'), output_field=Chat._meta.get_field('last_message'),
+        ),
+        'last_message_at': Case(When(newer, then=message.created_at), default=F('last_message_at')),
+    }
+
+
+def advance_read_cursors(messages):
+    """
+    Move the read cursor of every admin in the batch past their own
+    messages, so an admin's replies never count as unread to them.
+    """
+    senders = {message.sender_id for message in messages}
+    admins = set(User.objects.filter(pk__in=senders, is_superuser=True).values_list('pk', flat=True))
+    counts = Counter((message.chat_id, message.sender_id) for message in messages if message.sender_id in admins)
+    for (chat_id, user_id), count in counts.items():
+        _, created = ChatReadCursor.objects.get_or_create(chat_id=chat_id, user_id=user_id, defaults={'read_count': count})
+        if not created:
+            ChatReadCursor.objects.filter(chat_id=chat_id, user_id=user_id).update(read_count=F('read_count') + count)
+
+
+def write_messages(messages):
+    with transaction.atomic():
+        Message.objects.bulk_create(messages)
+        for chat_id, (count, message) in summarize(messages).items():
+            Chat.objects.filter(pk=chat_id).update(**summary_update(count, message))
+        advance_read_cursors(messages)
+
+
+class MessageWriteBuffer:
+    """
+    Per-process write-behind buffer for chat messages.
+
+    Every consumer in the process enqueues into the same buffer, pending
+    messages are persisted with a single `bulk_create` when `batch_size`
+    messages are waiting or `flush_interval` seconds have passed, along
+    with one update of the inbox summary per chat in the batch.
+    `enqueue` returns a future resolved with the saved message, so strict
+    callers can wait for the commit while relaxed ones fire and forget.
+    A failed write is logged, and raised from the futures in strict mode.
+    """
+
+    def __init__(self, batch_size, flush_interval, ordered=True, strict=False):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.ordered = ordered
+        self.strict = strict
+        self._pending = []
+        self._loop = None
+        self._lock = None
+        self._timer = None
+        self._tasks = set()
+
+    @classmethod
+    def from_settings(cls):
+        conf = get_buffer_settings()
+        return cls(
+            batch_size=conf['BATCH_SIZE'],
+            flush_interval=conf['FLUSH_INTERVAL'],
+            ordered=conf['ORDERED'],
+            strict=conf['STRICT'],
+        )
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # timers, locks and futures belong to one event loop, start over
+            # when the buffer is first used from a new one
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._timer = None
+            self._tasks = set()
+        return loop
+
+    def enqueue(self, message):
+        loop = self._bind_loop()
+        future = loop.create_future()
+        self._pending.append((message, future))
+
+        if len(self._pending) >= self.batch_size:
+            self._schedule_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self._schedule_flush)
+        return future
+
+    def _schedule_flush(self):
+        self._cancel_timer()
+        task = self._loop.create_task(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _take_pending(self):
+        batch, self._pending = self._pending, []
+        return batch
+
+    async def flush(self):
+        """
+        Persist everything pending right now, and in ordered mode also wait
+        for batches that are already being written.
+        """
+        self._bind_loop()
+        self._cancel_timer()
+        if self.ordered:
+            async with self._lock:
+                await self._write(self._take_pending())
+        else:
+            await self._write(self._take_pending())
+
+    async def _write(self, batch):
+        if not batch:
+            return
+        try:
+            await self._persist(batch)
+        except IntegrityError:
+            # a chat deleted by another worker may still be cached here,
+            # forget it and write the rest of the batch
+            batch = await self._drop_deleted_chats(batch)
+            try:
+                await self._persist(batch)
+            except Exception as exc:
+                self._fail(batch, exc)
+                return
+        except Exception as exc:
+            self._fail(batch, exc)
+            return
+
+        for message, future in batch:
+            if not future.done():
+                future.set_result(message)
+
+    async def _persist(self, batch):
+        messages = [message for message, _ in batch]
+        if not messages:
+            return
+        if use_async_orm():
+            # the async ORM has no transactions, the insert and the inbox
+            # summary go through the same atomic write_messages
+            await sync_to_async(write_messages, thread_sensitive=True)(messages)
+        else:
+            await database_sync_to_async(write_messages)(messages)
+
+    async def _drop_deleted_chats(self, batch):
+        chat_ids = {message.chat_id for message, _ in batch}
+        existing = Chat.objects.filter(pk__in=chat_ids).values_list('pk', flat=True)
+        if use_async_orm():
+            existing = {chat_id async for chat_id in existing}
+        else:
+            existing = set(await database_sync_to_async(list)(existing))
+
+        for chat_id in chat_ids - existing:
+            forget_chat(chat_id)
+        dropped = [(message, future) for message, future in batch if message.chat_id not in existing]
+        if dropped:
+            logger.warning("Dropped %d chat messages of deleted chats %s", len(dropped), sorted(chat_ids - existing))
+            self._fail(dropped, Chat.DoesNotExist("The chat of this message was deleted."), log=False)
+        return [(message, future) for message, future in batch if message.chat_id in existing]
+
+    def _fail(self, batch, exc, log=True):
+        if log:
+            logger.error("Failed to persist %d chat messages", len(batch), exc_info=exc)
+        for _, future in batch:
+            if future.done():
+                continue
+            # only strict callers wait for the write, in relaxed mode an
+            # exception would sit on a future nobody retrieves
+            if self.strict:
+                future.set_exception(exc)
+            else:
+                future.cancel()
+
+
+message_buffer = MessageWriteBuffer.from_settings()
@@ -1,13 +1,15 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
-from django.utils.timezone import now  
-from .models import Chat, Message
-from channels.db import database_sync_to_async
-from asgiref.sync import sync_to_async
+from project.middleware import compact_websockets
+from .models import Message
 from .schema import Custom_admin_consumer
+from .buffer import message_buffer
+from .rooms import client_room, resolve_chat_id, resolve_chat_room, resolve_client_chat_id
+from .events import render_sender, chat_message_event
 
 class BaseSupportChatConsumer(AsyncWebsocketConsumer):
     ROOM_GROUP_NAME = None
+    chat_id = None
 
     async def connect(self):
         self.user = self.scope.get('user')
@@ -20,6 +22,8 @@ class BaseSupportChatConsumer(AsyncWebsocketConsumer):
         await self.group_setup()
 
     async def disconnect(self, close_code):
+        # make sure nothing this connection sent is left sitting in the buffer
+        await message_buffer.flush()
         if self.ROOM_GROUP_NAME:
             await self.channel_layer.group_discard(
                 self.ROOM_GROUP_NAME,
@@ -42,34 +46,31 @@ class BaseSupportChatConsumer(AsyncWebsocketConsumer):
             }))
                 return
             
-            chat = await sync_to_async(Chat.objects.get)(room=self.ROOM_GROUP_NAME)
-                
-            await sync_to_async(Message.objects.create)(
-                    sender=self.user,
-                    chat=chat,
+            # the user may be a TokenUser, built from the token claims
+            message = Message(
+                    sender_id=self.user.id,
+                    chat_id=self.chat_id,
                     body=message
                 )
-            
-            
+            saved = message_buffer.enqueue(message)
+            if message_buffer.strict:
+                try:
+                    await saved
+                except Exception:
+                    # logged by the buffer, the connection stays open
+                    await self.send(json.dumps({
+                        'error': 'The message could not be saved.'
+                    }))
+                    return
+
             await self.channel_layer.group_send(
                     self.ROOM_GROUP_NAME,
-                    {
-                        'type': 'chat_message',
-                        'message': message,
-                        'user': self.user
-                    }
+                    chat_message_event(self.sender, message)
                 )
     @Custom_admin_consumer
     async def chat_message(self, event):
-        message = event['message']
-        user = event['user']
-        await self.send(text_data=json.dumps({
-                'message': message,
-                'user': user.id,
-                'name': user.first_name,
-                'is_admin': user.is_superuser,
-                'time': now().isoformat(),
-            }))
+        # the frame was encoded once by the sender, just pass it on
+        await self.send(text_data=event['text'])
 
     def set_room_group_name(self):
         raise NotImplementedError
@@ -78,30 +79,45 @@ class BaseSupportChatConsumer(AsyncWebsocketConsumer):
         return self.user.is_authenticated
 
     async def group_setup(self):
+        self.sender = render_sender(self.user)
         await self.channel_layer.group_add(
             self.ROOM_GROUP_NAME,
             self.channel_name
         )
         await self.accept()
+        if compact_websockets():
+            self.release_scope()
 
+    def release_scope(self):
+        # nothing in the scope is read after connect, emptied in place since
+        # the dict is also held by the frame that called the consumer
+        scope_type = self.scope['type']
+        self.scope.clear()
+        self.scope['type'] = scope_type
 
-class ClientSupportChatConsumer(BaseSupportChatConsumer):
-    @database_sync_to_async
-    def set_room_group_name(self):
-        self.ROOM_GROUP_NAME = f"chat_{self.user.id}"
 
-        Chat.objects.get_or_create(room=self.ROOM_GROUP_NAME)
+class ClientSupportChatConsumer(BaseSupportChatConsumer):
+    async def set_room_group_name(self):
+        self.ROOM_GROUP_NAME = client_room(self.user.id)
+        if self.is_valid_user():
+            self.chat_id = await resolve_client_chat_id(self.user.id)
 
     def is_valid_user(self):
         return super().is_valid_user()  and not self.user.is_superuser
 
 
 class AdminSupportChatConsumer(BaseSupportChatConsumer):
-    @database_sync_to_async
-    def set_room_group_name(self):
-        self.ROOM_GROUP_NAME = self.scope['url_route']['kwargs']['chat_name']
-        if not Chat.objects.filter(room=self.ROOM_GROUP_NAME).exists():
-            self.ROOM_GROUP_NAME = None
+    async def set_room_group_name(self):
+        # ws/chat/<chat id>/, or ws/chat/<room>/ by name
+        kwargs = self.scope['url_route']['kwargs']
+        if 'chat_id' in kwargs:
+            self.chat_id = kwargs['chat_id']
+            self.ROOM_GROUP_NAME = await resolve_chat_room(self.chat_id)
+        else:
+            self.ROOM_GROUP_NAME = kwargs['chat_name']
+            self.chat_id = await resolve_chat_id(self.ROOM_GROUP_NAME)
+        if self.chat_id is None or self.ROOM_GROUP_NAME is None:
+            self.chat_id = self.ROOM_GROUP_NAME = None
             
     def is_valid_user(self):
         return self.user.is_authenticated and self.user.is_superuser and self.ROOM_GROUP_NAME is not None 
@@ -0,0 +1,31 @@
+import json
+
+
+def render_sender(user):
+    """
+    The few user fields a chat frame needs, taken once per connection so
+    no model instance ever goes through the channel layer.
+    """
+    return {
+        'user': user.id,
+        'name': user.first_name,
+        'is_admin': user.is_superuser,
+    }
+
+
+def chat_message_event(sender, message):
+    """
+    Build the `chat_message` group event for a `Message`. The websocket
+    frame is encoded here, once, and every consumer in the group forwards
+    it as is. `id` is only known once the message is written, so it is
+    null when the event is sent ahead of the commit.
+    """
+    return {
+        'type': 'chat_message',
+        'text': json.dumps({
+            'id': message.pk,
+            'message': message.body,
+            **sender,
+            'time': message.created_at.isoformat(),
+        }),
+    }
@@ -0,0 +1,238 @@
+"""
+Load test for the support chat websockets.
+
+`run_load_test` opens `users` client connections on ws/chat/ and `admins`
+admin connections on ws/chat/<room>/, each admin in the room of another
+client. Connections go through the same stack as in production (JWT
+middleware and URL routing), in this process, over `channels.testing`,
+so what is measured is the server side of one worker without the network.
+
+Every client then sends `messages` chat messages, waiting for its own
+echo before sending the next one. A message carries its send time, so
+every copy delivered to the sender and to the admin of the room gives one
+fan-out latency sample. Memory per connection is traced with tracemalloc
+over `memory_sample` further connections, after the timed run. It counts
+the middleware, the consumer, its scope and its channel layer state, but
+not the test communicator standing in for the socket.
+
+The simulated users, superusers among them, are written to the
+configured database and deleted afterwards, even when the run fails, so
+`run_load_test` refuses to run unless DEBUG is on or `allow_db_writes`
+is given.
+
+Results are a JSON-serializable dict, see `manage.py chat_load_test`.
+"""
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+import uuid
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from project.middleware import JwtAuthMiddlewareStack
+from users.tokens import tokens_for_user
+
+from .buffer import message_buffer
+from .models import Chat
+from .rooms import use_async_orm
+from .routing import websocket_urlpatterns
+
+User = get_user_model()
+
+# seconds to wait for a connect or a frame before the run is failed
+TIMEOUT = 30
+
+# allocations made by the test communicator and by this module, left out
+# of the memory figures
+TRANSPORT = [
+    tracemalloc.Filter(False, __file__, all_frames=True),
+    tracemalloc.Filter(False, '*/asgiref/testing.py', all_frames=True),
+    tracemalloc.Filter(False, '*/channels/testing/*', all_frames=True),
+]
+TRACEBACK_FRAMES = 10
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    """Nearest-rank percentiles of `samples`, plus the max, in the same unit."""
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    result = {f'p{point}': samples[min(len(samples) - 1, len(samples) * point // 100)] for point in points}
+    result['max'] = samples[-1]
+    return result
+
+
+class LoadTest:
+    def __init__(self, users=100, admins=10, messages=10, connect_concurrency=100, memory_sample=100):
+        if admins > users:
+            raise ValueError("Every admin needs a client room, use at most as many admins as users.")
+        self.users = users
+        self.admins = admins
+        self.messages = messages
+        self.connect_concurrency = connect_concurrency
+        self.memory_sample = min(memory_sample, users)
+        self.application = JwtAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+        self.clients = []
+        self.staff = []
+        # every simulated user's email starts with it
+        self.prefix = f'loadtest-{uuid.uuid4().hex[:12]}-'
+
+    def setup(self):
+        """Create the simulated users and their access tokens."""
+        User.objects.bulk_create(
+            User(email=f'{self.prefix}{i}@example.com', first_name=f'Client {i}') for i in range(self.users)
+        )
+        User.objects.bulk_create(
+            User(email=f'{self.prefix}admin-{i}@example.com', first_name=f'Admin {i}', is_superuser=True, is_staff=True)
+            for i in range(self.admins)
+        )
+        users = User.objects.filter(email__startswith=self.prefix).order_by('pk')
+        self.clients = [(user, str(tokens_for_user(user).access_token)) for user in users if not user.is_superuser]
+        self.staff = [(user, str(tokens_for_user(user).access_token)) for user in users if user.is_superuser]
+
+    def teardown(self):
+        # by prefix, so a setup that failed halfway is cleaned up as well
+        users = User.objects.filter(email__startswith=self.prefix)
+        Chat.objects.filter(owner__in=users).delete()
+        users.delete()
+
+    async def connect(self, path, token, limit):
+        async with limit:
+            communicator = WebsocketCommunicator(self.application, f'{path}?token={token}')
+            connected, _ = await communicator.connect(timeout=TIMEOUT)
+        if not connected:
+            raise RuntimeError(f"Connection to {path} was refused")
+        return communicator
+
+    async def connect_all(self):
+        limit = asyncio.Semaphore(self.connect_concurrency)
+        clients = await asyncio.gather(*(
+            self.connect('/ws/chat/', token, limit) for _, token in self.clients
+        ))
+        # admins join the rooms once the clients created them
+        admins = await asyncio.gather(*(
+            self.connect(f'/ws/chat/chat_{user.pk}/', token, limit)
+            for (user, _), (_, token) in zip(self.clients, self.staff)
+        ))
+        return clients, admins
+
+    async def chat(self, communicator, latencies):
+        for _ in range(self.messages):
+            await communicator.send_to(text_data=json.dumps({'message': repr(time.perf_counter())}))
+            await self.receive(communicator, latencies)
+
+    async def listen(self, communicator, latencies):
+        for _ in range(self.messages):
+            await self.receive(communicator, latencies)
+
+    async def receive(self, communicator, latencies):
+        frame = json.loads(await communicator.receive_from(timeout=TIMEOUT))
+        latencies.append(time.perf_counter() - float(frame['message']))
+
+    async def run_async(self):
+        start = time.perf_counter()
+        clients, admins = await self.connect_all()
+        connect_seconds = time.perf_counter() - start
+
+        latencies = []
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(self.chat(communicator, latencies) for communicator in clients),
+            *(self.listen(communicator, latencies) for communicator in admins),
+        )
+        chat_seconds = time.perf_counter() - start
+
+        await self.disconnect_all(clients + admins)
+
+        return {
+            'connect': {
+                'connections': len(clients) + len(admins),
+                'seconds': connect_seconds,
+                'per_second': (len(clients) + len(admins)) / connect_seconds,
+            },
+            'messages': {
+                'sent': len(clients) * self.messages,
+                'delivered': len(latencies),
+                'seconds': chat_seconds,
+                'per_second': len(clients) * self.messages / chat_seconds,
+                'delivered_per_second': len(latencies) / chat_seconds,
+            },
+            'fanout_latency_ms': {name: value * 1e3 for name, value in percentiles(latencies).items()},
+            'memory': await self.measure_memory(),
+        }
+
+    async def measure_memory(self):
+        if not self.memory_sample:
+            return {}
+        limit = asyncio.Semaphore(self.connect_concurrency)
+        tokens = [token for _, token in self.clients[:self.memory_sample]]
+        # connect and drop once, so what stays allocated for good (caches,
+        # compiled url patterns) is not counted against the connections
+        await self.disconnect_all([await self.connect('/ws/chat/', tokens[0], limit)])
+
+        tracemalloc.start(TRACEBACK_FRAMES)
+        try:
+            baseline = tracemalloc.take_snapshot()
+            communicators = await asyncio.gather(*(self.connect('/ws/chat/', token, limit) for token in tokens))
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        allocated = sum(
+            stat.size_diff for stat in snapshot.filter_traces(TRANSPORT).compare_to(
+                baseline.filter_traces(TRANSPORT), 'filename',
+            )
+        )
+        await self.disconnect_all(communicators)
+        return {
+            'connections': len(communicators),
+            'bytes_per_connection': allocated / len(communicators),
+        }
+
+    async def disconnect_all(self, communicators):
+        for communicator in communicators:
+            await communicator.disconnect()
+        await message_buffer.flush()
+
+    def describe(self):
+        layer = get_channel_layer()
+        return {
+            'python': sys.version.split()[0],
+            'database': settings.DATABASES['default']['ENGINE'],
+            'channel_layer': f'{type(layer).__module__}.{type(layer).__name__}',
+            'async_orm': use_async_orm(),
+            'strict_buffer': message_buffer.strict,
+            'transport': 'channels.testing',
+        }
+
+
+def run_load_test(allow_db_writes=False, **options):
+    """Run a `LoadTest` with these options and return its results."""
+    if not (settings.DEBUG or allow_db_writes):
+        raise RuntimeError(
+            "The load test creates superusers in the configured database, "
+            "run it with DEBUG on or allow the database writes explicitly."
+        )
+    load_test = LoadTest(**options)
+    try:
+        load_test.setup()
+        results = async_to_sync(load_test.run_async)()
+    finally:
+        load_test.teardown()
+    return {
+        'config': {
+            'users': load_test.users,
+            'admins': load_test.admins,
+            'messages': load_test.messages,
+            'connect_concurrency': load_test.connect_concurrency,
+            'memory_sample': load_test.memory_sample,
+        },
+        'environment': load_test.describe(),
+        'results': results,
+    }
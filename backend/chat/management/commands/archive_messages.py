@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat.retention import archive_messages, get_retention_settings
+
+
+class Command(BaseCommand):
+    help = "Move chat messages older than the retention period to the archive table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="archive messages older than this many days")
+        parser.add_argument('--batch-size', type=int, help="messages moved per transaction")
+        parser.add_argument('--pause', type=float, help="seconds to sleep between two batches")
+        parser.add_argument('--loop', action='store_true', help="keep running, once every --interval seconds")
+        parser.add_argument('--interval', type=float, help="seconds between two runs with --loop")
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or get_retention_settings()['INTERVAL']
+        try:
+            while True:
+                moved = archive_messages(
+                    days=options['days'], batch_size=options['batch_size'], pause=options['pause'],
+                )
+                self.stdout.write(f"Archived {moved} messages")
+                self.stdout.flush()
+                if not options['loop']:
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
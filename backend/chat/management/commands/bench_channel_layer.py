@@ -0,0 +1,85 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from project.channel_layers import ChannelBroker
+
+
+def run_broker(path):
+    asyncio.run(ChannelBroker(path).serve())
+
+
+def run_worker(messages, window, results):
+    async def bench():
+        layer = get_channel_layer()
+        channel = await layer.new_channel()
+        event = {'type': 'chat_message', 'text': '{"message": "We need water at the north shelter."}'}
+        start = time.perf_counter()
+        for _ in range(messages // window):
+            for _ in range(window):
+                await layer.send(channel, event)
+            for _ in range(window):
+                await layer.receive(channel)
+        elapsed = time.perf_counter() - start
+        await layer.close()
+        return elapsed
+
+    results.put(asyncio.run(bench()))
+
+
+class Command(BaseCommand):
+    help = "Measure channel layer send/receive throughput for several worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+        parser.add_argument('--messages', type=int, default=5000,
+                            help="messages sent and received by each worker")
+        parser.add_argument('--window', type=int, default=50,
+                            help="messages in flight per worker, must stay below channel capacity")
+        parser.add_argument('--start-broker', action='store_true',
+                            help="benchmark the socket layer against a broker started for the run")
+
+    def handle(self, *args, **options):
+        broker = None
+        overrides = {}
+        if options['start_broker']:
+            path = os.path.join(tempfile.mkdtemp(), 'channels.sock')
+            broker = multiprocessing.Process(target=run_broker, args=(path,), daemon=True)
+            broker.start()
+            while not os.path.exists(path):
+                time.sleep(0.01)
+            overrides['CHANNEL_LAYERS'] = {
+                'default': {'BACKEND': 'project.channel_layers.SocketChannelLayer', 'CONFIG': {'path': path}},
+            }
+
+        try:
+            with override_settings(**overrides):
+                self.benchmark(options)
+        finally:
+            if broker is not None:
+                broker.terminate()
+
+    def benchmark(self, options):
+        layer = get_channel_layer()
+        self.stdout.write(f"layer: {type(layer).__module__}.{type(layer).__name__}")
+        self.stdout.write(f"{'workers':>8} {'msg/s total':>12} {'msg/s/worker':>13}")
+        for workers in options['workers']:
+            results = multiprocessing.Queue()
+            processes = [
+                multiprocessing.Process(target=run_worker, args=(options['messages'], options['window'], results))
+                for _ in range(workers)
+            ]
+            for process in processes:
+                process.start()
+            elapsed = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+
+            per_worker = sum(options['messages'] / seconds for seconds in elapsed) / workers
+            self.stdout.write(f"{workers:>8} {per_worker * workers:>12.0f} {per_worker:>13.0f}")
@@ -0,0 +1,45 @@
+import json
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from chat.events import chat_message_event
+from chat.models import Message
+
+
+class Command(BaseCommand):
+    help = "Compare per-recipient encoding with encode-once fan-out for chat_message."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000],
+                            help="room sizes (listeners per group_send) to measure")
+        parser.add_argument('--repeat', type=int, default=200,
+                            help="group_sends per measurement")
+
+    def handle(self, *args, **options):
+        sender = {'user': 1, 'name': 'Sam', 'is_admin': False}
+        message = Message(id=1, sender_id=1, chat_id=1, body='We need water at the north shelter.')
+
+        def per_recipient(size):
+            # what every consumer used to do on its own copy of the event
+            for _ in range(size):
+                json.dumps({
+                    'message': message.body,
+                    'user': sender['user'],
+                    'name': sender['name'],
+                    'is_admin': sender['is_admin'],
+                    'time': now().isoformat(),
+                })
+
+        def encode_once(size):
+            event = chat_message_event(sender, message)
+            for _ in range(size):
+                event['text']
+
+        self.stdout.write(f"{'room size':>10} {'per-recipient us':>18} {'encode-once us':>16} {'speedup':>8}")
+        for size in options['sizes']:
+            repeat = options['repeat']
+            old = timeit.timeit(lambda: per_recipient(size), number=repeat) / repeat * 1e6
+            new = timeit.timeit(lambda: encode_once(size), number=repeat) / repeat * 1e6
+            self.stdout.write(f"{size:>10} {old:>18.1f} {new:>16.1f} {old / new:>7.1f}x")
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from chat.buffer import message_buffer
+from chat.consumers import ClientSupportChatConsumer
+from chat.models import Chat
+from chat.rooms import room_cache
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Drive simulated websocket clients through the chat consumer, with the sync and the async ORM path."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50, help="simulated websocket clients")
+        parser.add_argument('--messages', type=int, default=20, help="messages sent by each client")
+        parser.add_argument('--modes', nargs='+', choices=['sync', 'async'], default=['sync', 'async'])
+        parser.add_argument('--strict', action='store_true',
+                            help="wait for the DB commit before the echo, so the write is on the measured path")
+
+    def handle(self, *args, **options):
+        users = [
+            User.objects.create_user(email=f'bench-{uuid.uuid4().hex}@example.com', first_name='Bench')
+            for _ in range(options['clients'])
+        ]
+        try:
+            self.stdout.write(
+                f"{options['clients']} clients x {options['messages']} messages, "
+                f"strict={options['strict']}"
+            )
+            self.stdout.write(f"{'mode':>6} {'msg/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'connect s':>10}")
+            for mode in options['modes']:
+                # every mode starts without cached chat ids and with new chats
+                room_cache.clear()
+                Chat.objects.filter(owner__in=users).delete()
+                message_buffer.strict = options['strict']
+                with override_settings(CHAT_ASYNC_ORM=mode == 'async'):
+                    connect, elapsed, latencies = async_to_sync(self.run)(users, options['messages'])
+                latencies.sort()
+                p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                self.stdout.write(
+                    f"{mode:>6} {len(latencies) / elapsed:>8.0f} {statistics.median(latencies) * 1e3:>8.2f} "
+                    f"{p99 * 1e3:>8.2f} {connect:>10.2f}"
+                )
+        finally:
+            message_buffer.strict = message_buffer.from_settings().strict
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    async def run(self, users, messages):
+        start = time.perf_counter()
+        communicators = await asyncio.gather(*(self.connect(user) for user in users))
+        connect = time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(self.chat(communicator, messages) for communicator in communicators))
+        elapsed = time.perf_counter() - start
+
+        for communicator in communicators:
+            await communicator.disconnect()
+        return connect, elapsed, [latency for client in latencies for latency in client]
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(ClientSupportChatConsumer.as_asgi(), '/ws/chat/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect(timeout=30)
+        assert connected
+        return communicator
+
+    async def chat(self, communicator, messages):
+        # each client waits for the echo of a message before sending the next
+        latencies = []
+        for i in range(messages):
+            sent = time.perf_counter()
+            await communicator.send_to(text_data=json.dumps({'message': f'bench message {i}'}))
+            await communicator.receive_from(timeout=30)
+            latencies.append(time.perf_counter() - sent)
+        return latencies
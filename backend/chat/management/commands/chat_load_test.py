@@ -0,0 +1,45 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.loadtest import run_load_test
+
+
+class Command(BaseCommand):
+    help = "Load test the chat websockets with simulated clients and admins, results are printed as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help="client connections on ws/chat/")
+        parser.add_argument('--admins', type=int, default=100,
+                            help="admin connections on ws/chat/<room>/, one per client room")
+        parser.add_argument('--messages', type=int, default=10, help="messages sent by each client")
+        parser.add_argument('--connect-concurrency', type=int, default=100,
+                            help="connection handshakes in flight at once")
+        parser.add_argument('--memory-sample', type=int, default=200,
+                            help="connections traced to measure memory per connection, 0 to skip")
+        parser.add_argument('--output', help="write the JSON results to this file instead of stdout")
+        parser.add_argument('--allow-db-writes', action='store_true',
+                            help="run with DEBUG off, the simulated users (superusers included) are written "
+                                 "to the configured database and deleted at the end")
+
+    def handle(self, *args, **options):
+        if not (settings.DEBUG or options['allow_db_writes']):
+            raise CommandError(
+                "The load test creates superusers in the configured database. "
+                "Run it with DEBUG on, or pass --allow-db-writes."
+            )
+        results = run_load_test(
+            allow_db_writes=True,
+            users=options['users'],
+            admins=options['admins'],
+            messages=options['messages'],
+            connect_concurrency=options['connect_concurrency'],
+            memory_sample=options['memory_sample'],
+        )
+        text = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(text + '\n')
+        else:
+            self.stdout.write(text)
@@ -0,0 +1,27 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from project.channel_layers import ChannelBroker
+
+
+class Command(BaseCommand):
+    help = "Run the local channel broker used by the 'socket' channel layer."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=settings.CHANNEL_BROKER_SOCKET,
+                            help="path of the Unix socket to listen on")
+
+    def handle(self, *args, **options):
+        path = options['socket']
+        broker = ChannelBroker(path)
+
+        def ready():
+            self.stdout.write(f"Channel broker listening on {path}")
+            self.stdout.flush()
+
+        try:
+            asyncio.run(broker.serve(ready=ready))
+        except KeyboardInterrupt:
+            pass
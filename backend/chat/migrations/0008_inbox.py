@@ -0,0 +1,76 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_inbox_summary(apps, schema_editor):
+    Chat = apps.get_model('chat', 'Chat')
+    Message = apps.get_model('chat', 'Message')
+    for chat in Chat.objects.all().iterator():
+        messages = Message.objects.filter(chat=chat)
+        last_message = messages.order_by('-created_at', '-id').first()
+        if last_message is not None:
+            chat.message_count = messages.count()
+            chat.last_message = last_message
+            chat.last_message_at = last_message.created_at
+            chat.save(update_fields=['message_count', 'last_message', 'last_message_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_message_history_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatReadCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['-last_message_at', '-id'], name='chat_inbox_idx'),
+        ),
+        migrations.AddField(
+            model_name='chatreadcursor',
+            name='chat',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_cursors', to='chat.chat'),
+        ),
+        migrations.AddField(
+            model_name='chatreadcursor',
+            name='last_read_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.AddField(
+            model_name='chatreadcursor',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_read_cursors', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='chatreadcursor',
+            constraint=models.UniqueConstraint(fields=('chat', 'user'), name='chat_read_cursor_unique'),
+        ),
+        migrations.RunPython(backfill_inbox_summary, migrations.RunPython.noop),
+    ]
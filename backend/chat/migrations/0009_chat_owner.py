@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:17
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+CLIENT_ROOM = re.compile(r'chat_(\d+)')
+
+
+def backfill_owners(apps, schema_editor):
+    Chat = apps.get_model('chat', 'Chat')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    owners = {}
+    for chat_id, room in Chat.objects.values_list('id', 'room').iterator():
+        match = CLIENT_ROOM.fullmatch(room)
+        if match:
+            owners[chat_id] = int(match[1])
+    existing = set(User.objects.filter(pk__in=owners.values()).values_list('pk', flat=True))
+    chats = [Chat(id=chat_id, owner_id=user_id) for chat_id, user_id in owners.items() if user_id in existing]
+    Chat.objects.bulk_update(chats, ['owner'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_inbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='owner',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='support_chat', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_owners, migrations.RunPython.noop),
+    ]
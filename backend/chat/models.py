@@ -1,22 +1,74 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 class Chat (models.Model) : 
     room = models.CharField(max_length=100, unique=True)
+    # the client the chat is with, one support chat per client
+    owner = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True, related_name='support_chat')
+    # inbox summary, moved along whenever a batch of messages is written
+    last_message = models.ForeignKey('Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    message_count = models.PositiveIntegerField(default=0)
     def __str__(self) -> str:
-        return f"{self.ticket.employee.full_name} | {self.ticket.client.full_name}"
+        return self.room
 
     class Meta:
         ordering = ['id'] 
+        indexes = [
+            # the admin inbox, most recent activity first
+            models.Index(fields=['-last_message_at', '-id'], name='chat_inbox_idx'),
+        ]
 class Message (models.Model) : 
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='chat')
     body = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # stamped when the message is received, not when its batch is written
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     class Meta:
         ordering = ('-created_at',)
+        indexes = [
+            # history pages are keyset reads on (created_at, id) within a chat
+            models.Index(fields=['chat', 'created_at', 'id'], name='chat_message_history_idx'),
+            # the archiver takes the oldest messages first, see chat/retention.py
+            models.Index(fields=['created_at', 'id'], name='chat_message_age_idx'),
+        ]
         
     def __str__(self) -> str:
-        return self.body
\ No newline at end of file
+        return self.body
+
+
+class ArchivedMessage(models.Model):
+    """
+    A message moved out of `Message` once it passed the retention period,
+    with its id, so history cursors keep pointing at it.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='archived_messages')
+    body = models.TextField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['chat', 'created_at', 'id'], name='chat_archive_history_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return self.body
+
+
+class ChatReadCursor(models.Model):
+    """How far an admin has read a chat, as the chat's message count at the time."""
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='read_cursors')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_read_cursors')
+    read_count = models.PositiveIntegerField(default=0)
+    last_read_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chat', 'user'], name='chat_read_cursor_unique'),
+        ]
@@ -0,0 +1,143 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from heapq import merge
+from itertools import islice
+from operator import attrgetter
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class MessageKeysetPagination(BasePagination):
+    """
+    Keyset pagination for chat history on `(created_at, id)`.
+
+    Pages are read with a range condition on the `(chat, created_at, id)`
+    index instead of OFFSET, and there is no COUNT(*). By default pages go
+    from the newest message backwards:
+
+    - `?before=<message id>` starts right after (older than) that message
+    - `?since=<message id>` returns only messages newer than that one,
+      oldest first, so a client can catch up without gaps
+    - `?cursor=` is set on the `next` link and continues in the same direction
+
+    When the view has a `get_archive_queryset()`, the archived messages of
+    the chat are read the same way and merged into the page.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    OLDER = 'o'
+    NEWER = 'n'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        # messages past the retention period are read from the archive, see chat/retention.py
+        querysets = [queryset]
+        if hasattr(view, 'get_archive_queryset'):
+            querysets.append(view.get_archive_queryset())
+        position, self.direction = self.decode_position(request, querysets)
+
+        pages = [self.read_page(queryset, position) for queryset in querysets]
+        key = attrgetter('created_at', 'pk')
+        results = list(islice(merge(*pages, key=key, reverse=self.direction == self.OLDER), self.page_size + 1))
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def read_page(self, queryset, position):
+        if self.direction == self.NEWER:
+            queryset = queryset.order_by('created_at', 'id')
+            if position:
+                created_at, pk = position
+                queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+        else:
+            queryset = queryset.order_by('-created_at', '-id')
+            if position:
+                created_at, pk = position
+                queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        return list(queryset[:self.page_size + 1])
+
+    def decode_position(self, request, querysets):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            try:
+                direction, created_at, pk = urlsafe_b64decode(cursor.encode()).decode().split('|')
+                position = datetime.fromisoformat(created_at), int(pk)
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+            if direction not in (self.OLDER, self.NEWER):
+                raise NotFound(self.invalid_cursor_message)
+            return position, direction
+
+        for param, direction in (('since', self.NEWER), ('before', self.OLDER)):
+            message_id = request.query_params.get(param)
+            if message_id:
+                position = None
+                if message_id.isdigit():
+                    # the message may have been archived since the client saw it
+                    for queryset in querysets:
+                        position = queryset.filter(pk=message_id).values_list('created_at', 'id').first()
+                        if position is not None:
+                            break
+                if position is None:
+                    raise NotFound(f"Unknown message id in '{param}'")
+                return position, direction
+
+        return None, self.OLDER
+
+    def encode_cursor(self, message):
+        token = f"{self.direction}|{message.created_at.isoformat()}|{message.pk}"
+        return urlsafe_b64encode(token.encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        for param in ('since', 'before'):
+            url = remove_query_param(url, param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': name,
+                'required': False,
+                'in': 'query',
+                'description': description,
+                'schema': {'type': schema_type},
+            }
+            for name, schema_type, description in (
+                (self.cursor_query_param, 'string', 'The pagination cursor value.'),
+                ('before', 'integer', 'Only messages older than this message id, newest first.'),
+                ('since', 'integer', 'Only messages newer than this message id, oldest first.'),
+            )
+        ]
+
+
+class ChatInboxPagination(CursorPagination):
+    """Most recently active chats first, read along the `chat_inbox_idx` index."""
+
+    ordering = ('-last_message_at', '-id')
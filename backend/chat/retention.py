@@ -0,0 +1,102 @@
+"""
+Retention of chat messages.
+
+Messages older than `DAYS` are moved from `Message` to `ArchivedMessage`
+by `archive_messages`, which `manage.py archive_messages` runs once or,
+with `--loop`, on a schedule. Each batch is its own short transaction:
+the oldest `BATCH_SIZE` messages are read along `chat_message_age_idx`,
+copied and deleted by primary key, so only those rows are locked and
+only for that long, and the archiver sleeps `PAUSE` seconds between
+batches to leave room to the websocket writes.
+
+Messages an inbox points at, a chat's last message or an admin's last
+read one, stay in `Message` whatever their age, and so does a message
+whose id is already taken in the archive (ids handed out again after a
+sequence reset): it is never copied over the archived one, nor deleted. Archived messages keep
+their id, and `MessageKeysetPagination` reads both tables, so history
+pages and `since`/`before` ids span the archive without the client
+knowing.
+
+The hot table is not partitioned: Postgres wants the partition key in
+the primary key, i.e. a `(id, created_at)` key Django can't model
+before composite primary keys (5.2), and SQLite has no partitioning.
+The archive table plays the cold partition instead.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedMessage, Chat, ChatReadCursor, Message
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULTS = {
+    # messages older than this many days are archived
+    'DAYS': 90,
+    # messages moved per transaction
+    'BATCH_SIZE': 1000,
+    # seconds to sleep between two batches
+    'PAUSE': 0.1,
+    # seconds between two runs of `archive_messages --loop`
+    'INTERVAL': 3600,
+}
+
+ARCHIVED_FIELDS = ('id', 'sender_id', 'chat_id', 'body', 'created_at')
+
+
+def get_retention_settings():
+    return {**DEFAULTS, **getattr(settings, 'CHAT_MESSAGE_RETENTION', {})}
+
+
+def archivable_messages(cutoff):
+    """
+    Messages created before `cutoff` that no inbox points at and whose id
+    is free in the archive, oldest first.
+    """
+    return (
+        Message.objects.filter(created_at__lt=cutoff)
+        .exclude(pk__in=Chat.objects.filter(last_message__isnull=False).values('last_message'))
+        .exclude(pk__in=ChatReadCursor.objects.filter(last_read_message__isnull=False).values('last_read_message'))
+        .exclude(pk__in=ArchivedMessage.objects.values('pk'))
+        .order_by('created_at', 'id')
+    )
+
+
+def archive_batch(cutoff, batch_size):
+    """Move up to `batch_size` messages older than `cutoff`, return how many moved."""
+    with transaction.atomic():
+        # skip_locked: a concurrent archiver takes the next rows instead
+        rows = list(
+            archivable_messages(cutoff).select_for_update(skip_locked=True).values_list(*ARCHIVED_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        # no ignore_conflicts: every row deleted below must have been copied,
+        # a conflict fails and rolls back the whole batch
+        ArchivedMessage.objects.bulk_create([ArchivedMessage(**dict(zip(ARCHIVED_FIELDS, row))) for row in rows])
+        Message.objects.filter(pk__in=[row[0] for row in rows]).delete()
+    return len(rows)
+
+
+def archive_messages(days=None, batch_size=None, pause=None):
+    """Archive every message older than `days`, batch by batch, return how many moved."""
+    options = get_retention_settings()
+    days = options['DAYS'] if days is None else days
+    batch_size = options['BATCH_SIZE'] if batch_size is None else batch_size
+    pause = options['PAUSE'] if pause is None else pause
+
+    cutoff = timezone.now() - timedelta(days=days)
+    total = 0
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            break
+        time.sleep(pause)
+    logger.info("Archived %d chat messages older than %s", total, cutoff.isoformat())
+    return total
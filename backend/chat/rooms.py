@@ -0,0 +1,136 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from .models import Chat
+
+
+class RoomCache:
+    """
+    Process-wide LRU cache of room name -> chat id, or chat id -> room name.
+    Room names never change meaning, so reconnecting clients can skip the
+    chat lookup entirely. Entries are dropped when their chat is deleted
+    in this process, when a write for it fails in this one (see
+    chat/buffer.py), and in any case after `ttl` seconds, which bounds how
+    long a chat deleted by another worker can still be served.
+    """
+
+    def __init__(self, maxsize=4096, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, room):
+        with self._lock:
+            value, expires = self._entries.get(room, (None, None))
+            if value is None:
+                return None
+            if expires <= time.monotonic():
+                del self._entries[room]
+                return None
+            self._entries.move_to_end(room)
+            return value
+
+    def set(self, room, chat_id):
+        with self._lock:
+            self._entries[room] = (chat_id, time.monotonic() + self.ttl)
+            self._entries.move_to_end(room)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, room):
+        with self._lock:
+            self._entries.pop(room, None)
+
+    def discard_value(self, value):
+        with self._lock:
+            for key in [key for key, (cached, _) in self._entries.items() if cached == value]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+room_cache = RoomCache(
+    getattr(settings, 'CHAT_ROOM_CACHE_SIZE', 4096), getattr(settings, 'CHAT_ROOM_CACHE_TTL', 300),
+)
+chat_room_cache = RoomCache(
+    getattr(settings, 'CHAT_ROOM_CACHE_SIZE', 4096), getattr(settings, 'CHAT_ROOM_CACHE_TTL', 300),
+)
+
+
+def forget_chat(chat_id, room=None):
+    """Drop a chat that no longer exists from both caches."""
+    if room is None:
+        room_cache.discard_value(chat_id)
+    else:
+        room_cache.discard(room)
+    chat_room_cache.discard(chat_id)
+
+
+def use_async_orm():
+    """
+    Whether chat reads go through Django's async ORM (`aget_or_create`,
+    `afirst`, ...) rather than `database_sync_to_async`. The latter also
+    closes stale connections around every call, the async ORM leaves that
+    to CONN_MAX_AGE and the server. Message writes need a transaction, they
+    run the same `write_messages` either way (see chat/buffer.py).
+    """
+    return getattr(settings, 'CHAT_ASYNC_ORM', False)
+
+
+def client_room(user_id):
+    """The room, and channel layer group, of a client's support chat."""
+    return f'chat_{user_id}'
+
+
+async def _first(queryset):
+    if use_async_orm():
+        return await queryset.afirst()
+    return await database_sync_to_async(queryset.first)()
+
+
+async def _get_or_create(**kwargs):
+    if use_async_orm():
+        chat, _ = await Chat.objects.aget_or_create(**kwargs)
+    else:
+        chat, _ = await database_sync_to_async(Chat.objects.get_or_create)(**kwargs)
+    return chat
+
+
+async def resolve_chat_id(room):
+    """Return the id of the chat for `room`, or None if it doesn't exist."""
+    chat_id = room_cache.get(room)
+    if chat_id is None:
+        chat_id = await _first(Chat.objects.filter(room=room).values_list('id', flat=True))
+        if chat_id is not None:
+            room_cache.set(room, chat_id)
+    return chat_id
+
+
+async def resolve_client_chat_id(user_id):
+    """Return the id of the client's chat, created on first use."""
+    room = client_room(user_id)
+    chat_id = room_cache.get(room)
+    if chat_id is None:
+        chat_id = (await _get_or_create(owner_id=user_id, defaults={'room': room})).id
+        room_cache.set(room, chat_id)
+    return chat_id
+
+
+async def resolve_chat_room(chat_id):
+    """Return the room of the chat with this id, or None if it doesn't exist."""
+    room = chat_room_cache.get(chat_id)
+    if room is None:
+        room = await _first(Chat.objects.filter(pk=chat_id).values_list('room', flat=True))
+        if room is not None:
+            chat_room_cache.set(chat_id, room)
+    return room
@@ -4,5 +4,6 @@ from .consumers import ClientSupportChatConsumer, AdminSupportChatConsumer
 
 websocket_urlpatterns = [
     path('ws/chat/', ClientSupportChatConsumer.as_asgi()),
+    path('ws/chat/<int:chat_id>/', AdminSupportChatConsumer.as_asgi()),
     path('ws/chat/<str:chat_name>/', AdminSupportChatConsumer.as_asgi()),
 ]
\ No newline at end of file
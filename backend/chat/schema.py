@@ -1,6 +1,6 @@
 from drf_spectacular.utils import extend_schema, OpenApiParameter, inline_serializer,OpenApiExample
 from rest_framework import serializers
-from .serializers import MessageSerializer
+from .serializers import MessageSerializer, ChatInboxSerializer, ChatReadCursorSerializer
 from drf_spectacular_websocket.decorators import extend_ws_schema
 
 Custom_admin_consumer = extend_ws_schema(
@@ -18,8 +18,14 @@ Custom_admin_consumer = extend_ws_schema(
             name='ChatMessageResponse',
         
             fields={
+                'id': serializers.IntegerField(
+                    allow_null=True, help_text="null unless CHAT_MESSAGE_BUFFER['STRICT'] is on, see chat/buffer.py",
+                ),
                 'message': serializers.CharField(),
-                'user': serializers.CharField(),
+                'user': serializers.IntegerField(),
+                'name': serializers.CharField(),
+                'is_admin': serializers.BooleanField(),
+                'time': serializers.DateTimeField(),
             },
         ),
     },
@@ -47,3 +53,15 @@ custom_chat_messages_list_schema = extend_schema(
     responses=MessageSerializer
 )
 
+
+custom_chat_inbox_schema = extend_schema(
+    description="This Endpoint is protected . \n you should be an `admin`. <br> Chats with messages, most recent activity first, with the last message and how many messages the requesting admin hasn't read.",
+    responses=ChatInboxSerializer
+)
+
+
+custom_chat_mark_read_schema = extend_schema(
+    description="This Endpoint is protected . \n you should be an `admin`. <br> Marks every message of the chat so far as read by the requesting admin.",
+    request=None,
+    responses=ChatReadCursorSerializer
+)
@@ -1,9 +1,10 @@
 from rest_framework import serializers
 from .models import * 
 class ChatSerializer(serializers.ModelSerializer):
+    # pinned, so what is added to Chat (owner, inbox summary) stays off the chat list
     class Meta:
         model = Chat
-        fields = '__all__'
+        fields = ['id', 'room']
         
         
 class MessageSerializer(serializers.ModelSerializer):
@@ -14,4 +15,25 @@ class MessageSerializer(serializers.ModelSerializer):
         fields = ['id','body', 'sender', 'chat_room', 'created_at']
 
     def get_chat_room(self, obj):
-        return obj.chat.room
\ No newline at end of file
+        return obj.chat.room
+
+
+class InboxMessageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Message
+        fields = ['id', 'body', 'sender', 'created_at']
+
+
+class ChatInboxSerializer(serializers.ModelSerializer):
+    last_message = InboxMessageSerializer(read_only=True)
+    unread_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Chat
+        fields = ['id', 'room', 'last_message', 'last_message_at', 'message_count', 'unread_count']
+
+
+class ChatReadCursorSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChatReadCursor
+        fields = ['chat', 'read_count', 'last_read_message', 'updated_at']
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Chat
+from .rooms import forget_chat
+
+
+@receiver(post_delete, sender=Chat)
+def forget_deleted_chat(sender, instance, **kwargs):
+    forget_chat(instance.pk, instance.room)
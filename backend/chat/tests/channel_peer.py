@@ -0,0 +1,59 @@
+"""
+A second worker process for the channel layer integration test.
+
+Runs a real AdminSupportChatConsumer on ws/chat/<room>/, through the
+socket channel layer. The test database lives in the memory of the test
+process, so this one migrates a temporary SQLite file of its own and
+mirrors the chat there under the same id. Prints `ready` once the admin
+is connected, then the first frame the admin receives, then answers it.
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+TIMEOUT = 10
+
+
+def setup_database(chat_id, room):
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+    from chat.models import Chat
+
+    call_command('migrate', verbosity=0)
+    Chat.objects.create(id=chat_id, room=room)
+    return get_user_model().objects.create_user(
+        email='peer-admin@example.com', first_name='Ada', is_staff=True, is_superuser=True,
+    )
+
+
+async def main(chat_id, room):
+    from channels.db import database_sync_to_async
+    from channels.routing import URLRouter
+    from channels.testing import WebsocketCommunicator
+    from chat.routing import websocket_urlpatterns
+
+    admin = await database_sync_to_async(setup_database)(chat_id, room)
+    communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{room}/')
+    communicator.scope['user'] = admin
+    connected, _ = await communicator.connect(timeout=TIMEOUT)
+    assert connected
+    print('ready', flush=True)
+
+    print(await communicator.receive_from(timeout=TIMEOUT), flush=True)
+
+    await communicator.send_to(text_data=json.dumps({'message': 'on my way'}))
+    # the admin's own copy of the answer, sent back through the broker
+    await communicator.receive_from(timeout=TIMEOUT)
+    await communicator.disconnect()
+
+
+if __name__ == '__main__':
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings.debug')
+    from django.conf import settings
+    import django
+    with tempfile.TemporaryDirectory() as directory:
+        settings.DATABASES['default']['NAME'] = os.path.join(directory, 'peer.sqlite3')
+        django.setup()
+        asyncio.run(main(int(sys.argv[1]), sys.argv[2]))
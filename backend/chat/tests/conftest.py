@@ -2,6 +2,9 @@ from rest_framework.test import APIClient
 import pytest
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from channels.testing import WebsocketCommunicator
+from chat.consumers import ClientSupportChatConsumer, AdminSupportChatConsumer
+from chat.rooms import chat_room_cache, room_cache
 
 User = get_user_model()
 
@@ -23,3 +26,36 @@ def authenticate(api_client):
         
     return do_authenticate
 
+
+@pytest.fixture(autouse=True)
+def clear_room_cache():
+    # chat ids are reused between tests once the database is flushed
+    room_cache.clear()
+    chat_room_cache.clear()
+    yield
+    room_cache.clear()
+    chat_room_cache.clear()
+
+
+@pytest.fixture
+def connect_client():
+    async def do_connect(user):
+        communicator = WebsocketCommunicator(ClientSupportChatConsumer.as_asgi(), '/ws/chat/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        assert connected
+        return communicator
+
+    return do_connect
+
+
+@pytest.fixture
+def connect_admin():
+    async def do_connect(user, room):
+        communicator = WebsocketCommunicator(AdminSupportChatConsumer.as_asgi(), f'/ws/chat/{room}/')
+        communicator.scope['user'] = user
+        communicator.scope['url_route'] = {'kwargs': {'chat_name': room}}
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    return do_connect
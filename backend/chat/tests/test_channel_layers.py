@@ -0,0 +1,115 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import pytest
+from asgiref.sync import async_to_sync
+from channels.exceptions import ChannelFull
+from model_bakery import baker
+from django.conf import settings as django_settings
+from django.contrib.auth import get_user_model
+from chat.models import Chat
+from project.channel_layers import SocketChannelLayer
+
+User = get_user_model()
+
+
+def start_process(args, socket_path):
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': 'project.settings.debug',
+        'CHANNEL_LAYER': 'socket',
+        'CHANNEL_BROKER_SOCKET': socket_path,
+    }
+    return subprocess.Popen(
+        [sys.executable, *args],
+        cwd=django_settings.BASE_DIR,
+        env=env,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+
+
+@pytest.fixture
+def channel_broker():
+    socket_path = os.path.join(tempfile.mkdtemp(), 'channels.sock')
+    broker = start_process(['manage.py', 'run_channel_broker'], socket_path)
+    assert 'listening' in broker.stdout.readline()
+    yield socket_path
+    broker.terminate()
+    broker.wait(timeout=10)
+
+
+@pytest.fixture
+def socket_layer(channel_broker, settings):
+    settings.CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'project.channel_layers.SocketChannelLayer',
+            'CONFIG': {'path': channel_broker},
+        },
+    }
+    return channel_broker
+
+
+class TestSocketChannelLayer:
+    def test_group_send_reaches_every_member(self, channel_broker):
+        first = SocketChannelLayer(channel_broker)
+        second = SocketChannelLayer(channel_broker)
+
+        async def run():
+            channels = [await first.new_channel(), await second.new_channel()]
+            await first.group_add('room', channels[0])
+            await second.group_add('room', channels[1])
+            await first.group_send('room', {'type': 'chat_message', 'text': 'hi'})
+            received = [await first.receive(channels[0]), await second.receive(channels[1])]
+            await first.close()
+            await second.close()
+            return received
+
+        assert async_to_sync(run)() == [{'type': 'chat_message', 'text': 'hi'}] * 2
+
+    def test_full_channel_raises_channel_full(self, channel_broker):
+        layer = SocketChannelLayer(channel_broker)
+
+        async def run():
+            channel = await layer.new_channel()
+            try:
+                for _ in range(101):
+                    await layer.send(channel, {'type': 'ping'})
+            finally:
+                await layer.close()
+
+        with pytest.raises(ChannelFull):
+            async_to_sync(run)()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestCrossProcessChat:
+    def test_client_and_admin_consumers_in_different_processes(self, socket_layer, connect_client):
+        user = baker.make(User, first_name='Sam')
+        chat = baker.make(Chat, room=f'chat_{user.id}', owner=user)
+        # a real AdminSupportChatConsumer, in a worker process of its own
+        peer = start_process(['-m', 'chat.tests.channel_peer', str(chat.id), chat.room], socket_layer)
+        try:
+            assert peer.stdout.readline().strip() == 'ready'
+
+            async def run():
+                client = await connect_client(user)
+                await client.send_to(text_data=json.dumps({'message': 'help'}))
+                own_frame = json.loads(await client.receive_from())
+                reply_frame = json.loads(await client.receive_from(timeout=10))
+                await client.disconnect()
+                return own_frame, reply_frame
+
+            own_frame, reply_frame = async_to_sync(run)()
+            admin_frame = json.loads(peer.stdout.readline())
+            assert peer.wait(timeout=10) == 0
+        finally:
+            peer.kill()
+
+        # the admin consumer got the client's frame as the client did
+        assert admin_frame == own_frame
+        assert (admin_frame['message'], admin_frame['user'], admin_frame['is_admin']) == ('help', user.id, False)
+        # and the frame its own consumer encoded came back to the client
+        assert (reply_frame['message'], reply_frame['name'], reply_frame['is_admin']) == ('on my way', 'Ada', True)
@@ -1,8 +1,15 @@
 import pytest
+from base64 import urlsafe_b64encode
 from rest_framework import status
+from datetime import timedelta
 from model_bakery import baker
 from django.contrib.auth import get_user_model
-from chat.models import Chat
+from django.db import connection
+from django.utils import timezone
+from chat.buffer import write_messages
+from chat.models import Chat, ChatReadCursor, Message
+from chat.pagination import MessageKeysetPagination
+from chat.views import ChatInboxView
 
 User = get_user_model()
 
@@ -46,4 +53,178 @@ class TestChatListView:
 
         # Assert the response
         assert response.status_code == status.HTTP_200_OK
-        assert response.data['count'] == 0  # Ensure an empty list is returned
\ No newline at end of file
+        assert response.data['count'] == 0  # Ensure an empty list is returned
+
+    def test_chats_list_only_id_and_room(self, api_client, authenticate):
+        authenticate(is_staff=True)
+        baker.make(Chat, room='chat_1', owner=baker.make(User), message_count=3)
+
+        response = api_client.get('/chats/')
+        assert set(response.data['results'][0]) == {'id', 'room'}
+
+@pytest.mark.django_db
+class TestChatMessagesPagination:
+    @pytest.fixture(autouse=True)
+    def small_pages(self, monkeypatch):
+        monkeypatch.setattr(MessageKeysetPagination, 'page_size', 2)
+
+    def make_messages(self, user, count):
+        chat = baker.make(Chat, room=f'chat_{user.id}', owner=user)
+        return [baker.make(Message, chat=chat, sender=user, body=str(i)) for i in range(count)]
+
+    def test_pages_follow_the_cursor_newest_first(self, api_client, authenticate):
+        user = authenticate()
+        messages = self.make_messages(user, 5)
+
+        seen = []
+        url = '/chats/messages/'
+        while url:
+            response = api_client.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            assert 'count' not in response.data
+            seen += [message['id'] for message in response.data['results']]
+            url = response.data['next']
+
+        assert seen == [message.id for message in reversed(messages)]
+
+    def test_since_returns_only_newer_messages(self, api_client, authenticate):
+        user = authenticate()
+        messages = self.make_messages(user, 4)
+
+        response = api_client.get('/chats/messages/', {'since': messages[1].id})
+        assert [message['id'] for message in response.data['results']] == [messages[2].id, messages[3].id]
+        assert response.data['next'] is None
+
+    def test_before_returns_only_older_messages(self, api_client, authenticate):
+        user = authenticate()
+        messages = self.make_messages(user, 4)
+
+        response = api_client.get('/chats/messages/', {'before': messages[2].id})
+        assert [message['id'] for message in response.data['results']] == [messages[1].id, messages[0].id]
+
+    def test_message_from_another_chat_returns_404(self, api_client, authenticate):
+        authenticate()
+        other = baker.make(Message)
+
+        response = api_client.get('/chats/messages/', {'since': other.id})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_history_is_found_by_owner(self, api_client, authenticate):
+        user = authenticate()
+        # only the owner ties a chat to its client, not the room name
+        chat = baker.make(Chat, room='renamed', owner=user)
+        message = baker.make(Message, chat=chat, sender=user)
+
+        response = api_client.get('/chats/messages/')
+        assert [item['id'] for item in response.data['results']] == [message.id]
+
+    @pytest.mark.parametrize('cursor', ['not-a-cursor', urlsafe_b64encode(b'x|2024-01-01T00:00:00+00:00|1').decode()])
+    def test_invalid_cursor_returns_404(self, api_client, authenticate, cursor):
+        authenticate()
+        response = api_client.get('/chats/messages/', {'cursor': cursor})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestChatInbox:
+    def send(self, chat, *bodies, at=None):
+        client = baker.make(User)
+        messages = [Message(chat=chat, sender=client, body=body) for body in bodies]
+        if at is not None:
+            for message in messages:
+                message.created_at = at
+        write_messages(messages)
+        return messages
+
+    def test_writing_messages_moves_the_summary_along(self):
+        chat = baker.make(Chat)
+        self.send(chat, 'one', 'two')
+        *_, last = self.send(chat, 'three')
+
+        chat.refresh_from_db()
+        assert (chat.message_count, chat.last_message, chat.last_message_at) == (3, last, last.created_at)
+
+    def test_older_batch_does_not_replace_the_last_message(self):
+        chat = baker.make(Chat)
+        [last] = self.send(chat, 'new')
+        self.send(chat, 'late', at=last.created_at - timedelta(seconds=1))
+
+        chat.refresh_from_db()
+        assert (chat.message_count, chat.last_message) == (2, last)
+
+    def test_if_user_is_not_admin_returns_403(self, api_client, authenticate):
+        authenticate()
+        assert api_client.get('/chats/inbox/').status_code == status.HTTP_403_FORBIDDEN
+        assert api_client.post(f'/chats/{baker.make(Chat).id}/read/').status_code == status.HTTP_403_FORBIDDEN
+
+    def test_chats_are_sorted_by_recent_activity(self, api_client, authenticate):
+        authenticate(is_staff=True)
+        now = timezone.now()
+        older, newer = baker.make(Chat, _quantity=2)
+        baker.make(Chat)  # no messages yet
+        self.send(newer, 'hello', at=now)
+        self.send(older, 'hi', at=now - timedelta(minutes=5))
+
+        response = api_client.get('/chats/inbox/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [chat['id'] for chat in response.data['results']] == [newer.id, older.id]
+        assert response.data['results'][0]['last_message']['body'] == 'hello'
+
+    def test_unread_counts_are_per_admin(self, api_client, authenticate):
+        admin = authenticate(is_staff=True)
+        other_admin = baker.make(User, is_staff=True)
+        chat = baker.make(Chat)
+        self.send(chat, 'one', 'two')
+
+        response = api_client.post(f'/chats/{chat.id}/read/')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['read_count'] == 2
+        self.send(chat, 'three')
+
+        assert api_client.get('/chats/inbox/').data['results'][0]['unread_count'] == 1
+        api_client.force_authenticate(user=other_admin)
+        assert api_client.get('/chats/inbox/').data['results'][0]['unread_count'] == 3
+        assert ChatReadCursor.objects.get(user=admin).last_read_message.body == 'two'
+
+    def test_admin_replies_are_not_unread_to_their_sender(self, api_client, authenticate):
+        admin = authenticate(is_staff=True)
+        User.objects.filter(pk=admin.pk).update(is_superuser=True)
+        other_admin = baker.make(User, is_staff=True, is_superuser=True)
+        chat = baker.make(Chat)
+        self.send(chat, 'help')
+        write_messages([Message(chat=chat, sender=admin, body='on my way'), Message(chat=chat, sender=admin, body='5 min')])
+
+        assert api_client.get('/chats/inbox/').data['results'][0]['unread_count'] == 1
+        api_client.force_authenticate(user=other_admin)
+        assert api_client.get('/chats/inbox/').data['results'][0]['unread_count'] == 3
+
+        api_client.force_authenticate(user=admin)
+        api_client.post(f'/chats/{chat.id}/read/')
+        write_messages([Message(chat=chat, sender=admin, body='here')])
+        assert api_client.get('/chats/inbox/').data['results'][0]['unread_count'] == 0
+
+    def test_page_is_one_query_however_many_chats(self, api_client, authenticate, django_assert_num_queries):
+        admin = authenticate(is_staff=True)
+        for chat in baker.make(Chat, _quantity=20):
+            self.send(chat, 'help')
+            baker.make(ChatReadCursor, chat=chat, user=admin, read_count=1)
+
+        with django_assert_num_queries(1):
+            response = api_client.get('/chats/inbox/')
+        assert len(response.data['results']) == 20
+
+    @pytest.mark.skipif(connection.vendor != 'sqlite', reason="reads SQLite's query plan")
+    def test_inbox_is_read_in_index_order(self, rf, authenticate):
+        request = rf.get('/chats/inbox/')
+        request.user = authenticate(is_staff=True)
+        view = ChatInboxView(request=request)
+        queryset = view.get_queryset().order_by(*view.pagination_class.ordering)[:50]
+
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        assert 'chat_inbox_idx' in plan
+        assert 'TEMP B-TREE' not in plan
+
@@ -0,0 +1,367 @@
+import importlib
+import json
+import msgpack
+import pytest
+from asgiref.sync import async_to_sync
+from model_bakery import baker
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
+from chat.buffer import MessageWriteBuffer, message_buffer
+from chat.models import Chat, Message
+from chat.rooms import RoomCache, chat_room_cache, room_cache
+from chat.routing import websocket_urlpatterns
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.apps import apps as django_apps
+from chat.events import render_sender, chat_message_event
+from rest_framework_simplejwt.models import TokenUser
+from users.tokens import tokens_for_user
+
+User = get_user_model()
+
+
+def fail_write(messages):
+    raise DatabaseError("database is down")
+
+
+@pytest.mark.django_db(transaction=True)
+class TestMessageWriteBuffer:
+    def test_messages_are_written_in_one_batch(self):
+        user = baker.make(User)
+        chat = baker.make(Chat, room=f'chat_{user.id}')
+        buffer = MessageWriteBuffer(batch_size=10, flush_interval=60)
+
+        async def run():
+            futures = [buffer.enqueue(Message(sender=user, chat=chat, body=str(i))) for i in range(3)]
+            await buffer.flush()
+            return [await future for future in futures]
+
+        with CaptureQueriesContext(connection) as queries:
+            saved = async_to_sync(run)()
+
+        inserts = [query for query in queries if query['sql'].startswith('INSERT')]
+        assert len(inserts) == 1
+
+        assert [message.body for message in saved] == ['0', '1', '2']
+        assert all(message.pk for message in saved)
+
+    def test_batch_is_flushed_when_size_is_reached(self):
+        user = baker.make(User)
+        chat = baker.make(Chat, room=f'chat_{user.id}')
+        buffer = MessageWriteBuffer(batch_size=2, flush_interval=60)
+
+        async def run():
+            futures = [buffer.enqueue(Message(sender=user, chat=chat, body=str(i))) for i in range(2)]
+            return [await future for future in futures]
+
+        async_to_sync(run)()
+        assert Message.objects.filter(chat=chat).count() == 2
+
+    def test_ordered_mode_keeps_receive_order(self):
+        user = baker.make(User)
+        chat = baker.make(Chat, room=f'chat_{user.id}')
+        buffer = MessageWriteBuffer(batch_size=2, flush_interval=0.01)
+
+        async def run():
+            futures = [buffer.enqueue(Message(sender=user, chat=chat, body=str(i))) for i in range(5)]
+            await buffer.flush()
+            return [await future for future in futures]
+
+        async_to_sync(run)()
+        bodies = Message.objects.filter(chat=chat).order_by('id').values_list('body', flat=True)
+        assert list(bodies) == ['0', '1', '2', '3', '4']
+
+    @pytest.mark.parametrize('async_orm', [True, False])
+    def test_messages_and_inbox_summary_are_written_together(self, monkeypatch, settings, async_orm):
+        settings.CHAT_ASYNC_ORM = async_orm
+        user = baker.make(User)
+        chat = baker.make(Chat, room=f'chat_{user.id}')
+        buffer = MessageWriteBuffer(batch_size=10, flush_interval=60, strict=True)
+
+        def fail_summary(count, message):
+            raise DatabaseError("connection lost")
+
+        monkeypatch.setattr('chat.buffer.summary_update', fail_summary)
+
+        async def run():
+            future = buffer.enqueue(Message(sender=user, chat=chat, body='help'))
+            await buffer.flush()
+            return future
+
+        assert isinstance(async_to_sync(run)().exception(), DatabaseError)
+        # the insert was rolled back with the summary update
+        assert not Message.objects.exists()
+
+    @pytest.mark.parametrize('strict', [True, False])
+    def test_failed_write_is_logged_and_raised_only_when_strict(self, monkeypatch, caplog, strict):
+        monkeypatch.setattr('chat.buffer.write_messages', fail_write)
+        buffer = MessageWriteBuffer(batch_size=10, flush_interval=60, strict=strict)
+
+        async def run():
+            future = buffer.enqueue(Message(body='lost'))
+            await buffer.flush()
+            return future
+
+        future = async_to_sync(run)()
+        assert 'Failed to persist 1 chat messages' in caplog.text
+        if strict:
+            assert isinstance(future.exception(), DatabaseError)
+        else:
+            # nobody waits on it, so nothing is left to be "never retrieved"
+            assert future.cancelled()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestSupportChatConsumer:
+    def test_message_is_persisted_on_disconnect(self, connect_client):
+        user = baker.make(User, first_name='Sam')
+
+        async def run():
+            communicator = await connect_client(user)
+            await communicator.send_to(text_data=json.dumps({'message': 'help'}))
+            response = json.loads(await communicator.receive_from())
+            await communicator.disconnect()
+            return response
+
+        response = async_to_sync(run)()
+        assert response['message'] == 'help'
+        assert response['user'] == user.id
+        assert Message.objects.get(chat__room=f'chat_{user.id}').body == 'help'
+
+    def test_token_user_from_claims_can_chat(self, connect_client, settings):
+        settings.STATELESS_WEBSOCKET_AUTH = {'ENABLED': True}
+        user = baker.make(User, first_name='Sam')
+        principal = TokenUser(tokens_for_user(user).access_token)
+
+        async def run():
+            communicator = await connect_client(principal)
+            await communicator.send_to(text_data=json.dumps({'message': 'help'}))
+            response = json.loads(await communicator.receive_from())
+            await communicator.disconnect()
+            return response
+
+        response = async_to_sync(run)()
+        assert (response['user'], response['name'], response['is_admin']) == (user.id, 'Sam', False)
+        assert Message.objects.get(chat__room=f'chat_{user.id}').sender == user
+
+    def test_relaxed_mode_fans_out_before_the_id_is_known(self, monkeypatch, connect_client):
+        user = baker.make(User)
+        monkeypatch.setattr(message_buffer, 'strict', False)
+
+        async def run():
+            communicator = await connect_client(user)
+            await communicator.send_to(text_data=json.dumps({'message': 'help'}))
+            frame = json.loads(await communicator.receive_from())
+            await communicator.disconnect()
+            return frame
+
+        frame = async_to_sync(run)()
+        stored = Message.objects.get(chat__room=f'chat_{user.id}')
+        # the default: no id, but the time is the one stored with the message
+        assert frame['id'] is None
+        assert frame['time'] == stored.created_at.isoformat()
+
+    def test_strict_mode_writes_before_fan_out(self, monkeypatch, connect_client):
+        user = baker.make(User)
+        monkeypatch.setattr(message_buffer, 'strict', True)
+        monkeypatch.setattr(message_buffer, 'flush_interval', 0.01)
+
+        async def run():
+            communicator = await connect_client(user)
+            await communicator.send_to(text_data=json.dumps({'message': 'help'}))
+            frame = json.loads(await communicator.receive_from())
+            stored = await Message.objects.aget(chat__room=f'chat_{user.id}')
+            await communicator.disconnect()
+            return frame, stored
+
+        frame, stored = async_to_sync(run)()
+        assert frame['id'] == stored.id
+        assert frame['time'] == stored.created_at.isoformat()
+
+    def test_async_orm_path_creates_chat_and_writes_messages(self, monkeypatch, connect_client, settings):
+        settings.CHAT_ASYNC_ORM = True
+        user = baker.make(User)
+        monkeypatch.setattr(message_buffer, 'strict', True)
+        monkeypatch.setattr(message_buffer, 'flush_interval', 0.01)
+
+        async def run():
+            communicator = await connect_client(user)
+            await communicator.send_to(text_data=json.dumps({'message': 'help'}))
+            frame = json.loads(await communicator.receive_from())
+            await communicator.disconnect()
+            return frame
+
+        frame = async_to_sync(run)()
+        message = Message.objects.get(chat__room=f'chat_{user.id}')
+        assert (frame['id'], message.body) == (message.id, 'help')
+
+    def test_strict_write_failure_sends_an_error_frame(self, monkeypatch, connect_client):
+        user = baker.make(User)
+        monkeypatch.setattr('chat.buffer.write_messages', fail_write)
+        monkeypatch.setattr(message_buffer, 'strict', True)
+        monkeypatch.setattr(message_buffer, 'flush_interval', 0.01)
+
+        async def run():
+            communicator = await connect_client(user)
+            await communicator.send_to(text_data=json.dumps({'message': 'help'}))
+            error = json.loads(await communicator.receive_from())
+            # the socket is still open and usable
+            await communicator.send_to(text_data=json.dumps({'message': ' '}))
+            follow_up = json.loads(await communicator.receive_from())
+            await communicator.disconnect()
+            return error, follow_up
+
+        error, follow_up = async_to_sync(run)()
+        assert error == {'error': 'The message could not be saved.'}
+        assert 'error' in follow_up
+        assert not Message.objects.exists()
+
+    def test_empty_message_returns_error(self, connect_client):
+        user = baker.make(User)
+
+        async def run():
+            communicator = await connect_client(user)
+            await communicator.send_to(text_data=json.dumps({'message': '  '}))
+            response = json.loads(await communicator.receive_from())
+            await communicator.disconnect()
+            return response
+
+        assert 'error' in async_to_sync(run)()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestRoomResolution:
+    def test_client_chat_is_created_once_and_cached(self, connect_client):
+        user = baker.make(User)
+
+        async def run():
+            communicator = await connect_client(user)
+            await communicator.disconnect()
+
+        async_to_sync(run)()
+        chat = Chat.objects.get(owner=user)
+        assert chat.room == f'chat_{user.id}'
+        assert room_cache.get(chat.room) == chat.id
+
+        with CaptureQueriesContext(connection) as queries:
+            async_to_sync(run)()
+        assert not [query for query in queries if 'chat_chat' in query['sql']]
+
+    def test_admin_connects_to_existing_chat(self, connect_admin):
+        admin = baker.make(User, is_superuser=True)
+        chat = baker.make(Chat, room='chat_42')
+
+        async def run():
+            communicator, connected = await connect_admin(admin, chat.room)
+            await communicator.disconnect()
+            return connected
+
+        assert async_to_sync(run)()
+        assert room_cache.get(chat.room) == chat.id
+
+    @pytest.mark.parametrize('known', [True, False])
+    def test_admin_connects_by_chat_id(self, known):
+        admin = baker.make(User, is_superuser=True)
+        chat = baker.make(Chat, room='chat_42')
+        chat_id = chat.id if known else chat.id + 1
+
+        async def run():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{chat_id}/')
+            communicator.scope['user'] = admin
+            connected, _ = await communicator.connect()
+            await communicator.disconnect()
+            return connected
+
+        assert async_to_sync(run)() == known
+        assert chat_room_cache.get(chat_id) == (chat.room if known else None)
+
+    def test_admin_is_rejected_for_unknown_chat(self, connect_admin):
+        admin = baker.make(User, is_superuser=True)
+
+        async def run():
+            communicator, connected = await connect_admin(admin, 'chat_404')
+            await communicator.disconnect()
+            return connected
+
+        assert not async_to_sync(run)()
+        assert room_cache.get('chat_404') is None
+
+    def test_chat_deleted_by_another_worker_is_dropped_on_write(self):
+        user = baker.make(User)
+        live = baker.make(Chat, room=f'chat_{user.id}')
+        gone = baker.make(Chat, room='chat_gone')
+        room_cache.set(gone.room, gone.id)
+        chat_room_cache.set(gone.id, gone.room)
+        # deleted without this process' signal handlers knowing
+        Chat.objects.filter(pk=gone.pk)._raw_delete(Chat.objects.db)
+        buffer = MessageWriteBuffer(batch_size=10, flush_interval=60)
+
+        async def run():
+            futures = [buffer.enqueue(Message(sender=user, chat_id=chat.id, body=chat.room)) for chat in (live, gone)]
+            await buffer.flush()
+            return futures
+
+        kept, dropped = async_to_sync(run)()
+        assert kept.result().pk and dropped.cancelled()
+        assert list(Message.objects.values_list('body', flat=True)) == [live.room]
+        assert (room_cache.get(gone.room), chat_room_cache.get(gone.id)) == (None, None)
+
+    def test_cached_rooms_expire(self):
+        cache = RoomCache(ttl=0)
+        cache.set('chat_1', 1)
+        assert cache.get('chat_1') is None
+        assert len(cache) == 0
+
+    def test_deleted_chat_is_dropped_from_cache(self):
+        chat = baker.make(Chat, room='chat_7')
+        chat_id = chat.id
+        room_cache.set(chat.room, chat.id)
+        chat_room_cache.set(chat.id, chat.room)
+        chat.delete()
+        assert room_cache.get('chat_7') is None
+        assert chat_room_cache.get(chat_id) is None
+
+
+@pytest.mark.django_db
+class TestChatOwnerBackfill:
+    def test_owners_are_read_from_room_names(self):
+        backfill_owners = importlib.import_module('chat.migrations.0009_chat_owner').backfill_owners
+        user = baker.make(User)
+        client_chat = baker.make(Chat, room=f'chat_{user.id}')
+        orphan_chat = baker.make(Chat, room=f'chat_{user.id + 1000}')
+        other_chat = baker.make(Chat, room='lobby')
+
+        backfill_owners(django_apps, None)
+
+        for chat in (client_chat, orphan_chat, other_chat):
+            chat.refresh_from_db()
+        assert (client_chat.owner, orphan_chat.owner, other_chat.owner) == (user, None, None)
+        assert str(client_chat) == f'chat_{user.id}'
+
+
+@pytest.mark.django_db(transaction=True)
+class TestChatMessageEvent:
+    def test_event_is_msgpack_serializable(self):
+        user = baker.make(User, first_name='Sam')
+        event = chat_message_event(render_sender(user), Message(sender=user, body='help'))
+        assert msgpack.unpackb(msgpack.packb(event)) == event
+
+    def test_client_and_admin_receive_the_same_frame(self, connect_client, connect_admin):
+        user = baker.make(User, first_name='Sam')
+        admin = baker.make(User, is_superuser=True)
+
+        async def run():
+            client = await connect_client(user)
+            admin_communicator, _ = await connect_admin(admin, f'chat_{user.id}')
+            await client.send_to(text_data=json.dumps({'message': 'help'}))
+            frames = [await client.receive_from(), await admin_communicator.receive_from()]
+            await client.disconnect()
+            await admin_communicator.disconnect()
+            return frames
+
+        client_frame, admin_frame = async_to_sync(run)()
+        assert client_frame == admin_frame
+        frame = json.loads(client_frame)
+        assert frame['name'] == 'Sam'
+        assert frame['is_admin'] is False
@@ -0,0 +1,73 @@
+import json
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from chat import loadtest
+from chat.loadtest import percentiles, run_load_test
+from chat.models import Chat, Message
+
+User = get_user_model()
+
+
+def test_percentiles_are_nearest_rank():
+    samples = list(range(1, 101))
+    assert percentiles(samples) == {'p50': 51, 'p90': 91, 'p99': 100, 'max': 100}
+    assert percentiles([]) == {}
+
+
+@pytest.mark.django_db(transaction=True)
+class TestChatLoadTest:
+    def test_every_message_reaches_the_sender_and_the_admin(self):
+        report = run_load_test(users=4, admins=2, messages=3, memory_sample=2, allow_db_writes=True)
+
+        results = report['results']
+        assert results['connect']['connections'] == 6
+        assert results['messages']['sent'] == 12
+        # an echo for every message, and a copy for each of the two admins
+        assert results['messages']['delivered'] == 12 + 2 * 3
+        assert 0 < results['fanout_latency_ms']['p50'] <= results['fanout_latency_ms']['max']
+        assert results['memory']['connections'] == 2
+        assert results['memory']['bytes_per_connection'] > 0
+
+    def test_simulated_users_are_removed(self):
+        run_load_test(users=2, admins=1, messages=1, memory_sample=0, allow_db_writes=True)
+        assert not User.objects.exists()
+        assert not Chat.objects.exists()
+        assert not Message.objects.exists()
+
+    def test_users_are_removed_when_setup_fails(self, monkeypatch):
+        def broken_tokens(user):
+            raise RuntimeError("signing key missing")
+
+        monkeypatch.setattr(loadtest, 'tokens_for_user', broken_tokens)
+        with pytest.raises(RuntimeError, match="signing key missing"):
+            run_load_test(users=2, admins=1, messages=1, memory_sample=0, allow_db_writes=True)
+        assert not User.objects.exists()
+
+    def test_refuses_to_write_to_the_database_unless_allowed(self, settings):
+        settings.DEBUG = False
+        with pytest.raises(RuntimeError):
+            run_load_test(users=2, admins=1, messages=1, memory_sample=0)
+        with pytest.raises(CommandError, match='--allow-db-writes'):
+            call_command('chat_load_test', users=2, admins=1, messages=1, memory_sample=0)
+        assert not User.objects.exists()
+
+    def test_command_writes_json(self, tmp_path):
+        output = tmp_path / 'results.json'
+        call_command(
+            'chat_load_test', users=2, admins=1, messages=1, memory_sample=0, output=str(output), allow_db_writes=True,
+        )
+
+        report = json.loads(output.read_text())
+        assert report['config']['users'] == 2
+        assert report['environment']['transport'] == 'channels.testing'
+        assert report['results']['memory'] == {}
+
+    def test_compact_mode_needs_less_memory_per_connection(self, settings):
+        def bytes_per_connection(compact):
+            settings.COMPACT_WEBSOCKETS = compact
+            report = run_load_test(users=100, admins=0, messages=0, memory_sample=100, allow_db_writes=True)
+            return report['results']['memory']['bytes_per_connection']
+
+        full, compact = bytes_per_connection(False), bytes_per_connection(True)
+        assert compact < 0.85 * full
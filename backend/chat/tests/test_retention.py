@@ -0,0 +1,120 @@
+import pytest
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.utils import timezone
+from model_bakery import baker
+from chat.models import ArchivedMessage, Chat, ChatReadCursor, Message
+from chat.pagination import MessageKeysetPagination
+from chat.retention import archive_batch, archive_messages
+
+User = get_user_model()
+
+
+@pytest.fixture
+def make_messages():
+    def do_make(user, ages_in_days):
+        chat = Chat.objects.filter(owner=user).first() or baker.make(Chat, room=f'chat_{user.id}', owner=user)
+        now = timezone.now()
+        return [
+            baker.make(Message, chat=chat, sender=user, body=str(age), created_at=now - timedelta(days=age))
+            for age in ages_in_days
+        ]
+
+    return do_make
+
+
+@pytest.mark.django_db
+class TestArchiveMessages:
+    def test_old_messages_are_moved_with_their_id(self, make_messages):
+        user = baker.make(User)
+        old, recent = make_messages(user, [100, 1])
+
+        assert archive_messages(days=90, pause=0) == 1
+
+        assert list(Message.objects.values_list('id', flat=True)) == [recent.id]
+        archived = ArchivedMessage.objects.get()
+        assert (archived.id, archived.chat_id, archived.sender_id, archived.body, archived.created_at) == (
+            old.id, old.chat_id, old.sender_id, old.body, old.created_at,
+        )
+
+    def test_messages_are_moved_in_batches_oldest_first(self, make_messages):
+        user = baker.make(User)
+        messages = make_messages(user, [95, 94, 93, 92, 91])
+        cutoff = timezone.now() - timedelta(days=90)
+
+        assert archive_batch(cutoff, 2) == 2
+        assert set(ArchivedMessage.objects.values_list('id', flat=True)) == {messages[0].id, messages[1].id}
+        assert archive_messages(days=90, batch_size=2, pause=0) == 3
+        assert not Message.objects.exists()
+
+    def test_messages_an_inbox_points_at_are_kept(self, make_messages):
+        user = baker.make(User)
+        admin = baker.make(User, is_superuser=True)
+        read, other, last = make_messages(user, [120, 110, 100])
+        Chat.objects.filter(pk=last.chat_id).update(last_message=last, last_message_at=last.created_at)
+        baker.make(ChatReadCursor, chat=last.chat, user=admin, last_read_message=read)
+
+        assert archive_messages(days=90, pause=0) == 1
+
+        assert set(Message.objects.values_list('id', flat=True)) == {read.id, last.id}
+        assert list(ArchivedMessage.objects.values_list('id', flat=True)) == [other.id]
+
+    def test_message_whose_id_is_taken_in_the_archive_is_kept(self, make_messages):
+        user = baker.make(User)
+        colliding, old = make_messages(user, [120, 100])
+        taken = baker.make(ArchivedMessage, id=colliding.id, chat=colliding.chat, body='another message')
+
+        assert archive_messages(days=90, pause=0) == 1
+
+        assert list(Message.objects.values_list('id', flat=True)) == [colliding.id]
+        assert ArchivedMessage.objects.get(pk=taken.pk).body == 'another message'
+        assert ArchivedMessage.objects.filter(pk=old.pk).exists()
+
+    def test_command_archives_messages(self, make_messages):
+        user = baker.make(User)
+        make_messages(user, [40, 20])
+
+        call_command('archive_messages', days=30, pause=0)
+        assert (Message.objects.count(), ArchivedMessage.objects.count()) == (1, 1)
+
+
+@pytest.mark.django_db
+class TestArchivedHistory:
+    @pytest.fixture(autouse=True)
+    def small_pages(self, monkeypatch):
+        monkeypatch.setattr(MessageKeysetPagination, 'page_size', 2)
+
+    def test_pages_run_on_into_the_archive(self, api_client, authenticate, make_messages):
+        user = authenticate()
+        messages = make_messages(user, [200, 150, 100, 10, 5])
+        archive_messages(days=90, pause=0)
+
+        seen = []
+        url = '/chats/messages/'
+        while url:
+            response = api_client.get(url)
+            seen += [message['id'] for message in response.data['results']]
+            url = response.data['next']
+
+        assert seen == [message.id for message in reversed(messages)]
+        assert response.data['results'][-1]['chat_room'] == f'chat_{user.id}'
+
+    def test_since_and_before_accept_archived_ids(self, api_client, authenticate, make_messages):
+        user = authenticate()
+        messages = make_messages(user, [200, 150, 100, 10])
+        archive_messages(days=90, pause=0)
+
+        response = api_client.get('/chats/messages/', {'since': messages[0].id})
+        assert [message['id'] for message in response.data['results']] == [messages[1].id, messages[2].id]
+        response = api_client.get('/chats/messages/', {'before': messages[2].id})
+        assert [message['id'] for message in response.data['results']] == [messages[1].id, messages[0].id]
+
+    def test_admin_history_includes_the_archive(self, api_client, authenticate, make_messages):
+        authenticate(is_staff=True)
+        client = baker.make(User)
+        messages = make_messages(client, [100, 1])
+        archive_messages(days=90, pause=0)
+
+        response = api_client.get(f'/chats/{messages[0].chat_id}/messages/')
+        assert [message['id'] for message in response.data['results']] == [messages[1].id, messages[0].id]
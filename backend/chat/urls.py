@@ -1,10 +1,12 @@
-from .views import ChatListView , ChatMessagesDetailView, ChatAdminMessagesDetailView   
+from .views import ChatListView , ChatMessagesDetailView, ChatAdminMessagesDetailView, ChatInboxView, ChatMarkReadView
 
 from django.urls import path
 
 urlpatterns = [
     path('', ChatListView.as_view(), name='chat-list'),
+    path('inbox/', ChatInboxView.as_view(), name='chat-inbox'),
     path('messages/', ChatMessagesDetailView.as_view(), name='messages-list'),
     path('<int:pk>/messages/', ChatAdminMessagesDetailView.as_view(), name='messages-list'),
+    path('<int:pk>/read/', ChatMarkReadView.as_view(), name='chat-mark-read'),
     
 ]
\ No newline at end of file
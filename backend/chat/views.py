@@ -1,8 +1,12 @@
-from rest_framework.generics import ListAPIView 
+from django.db.models import F, FilteredRelation, IntegerField, Q, Subquery
+from django.db.models.functions import Coalesce
+from rest_framework.generics import GenericAPIView, ListAPIView 
 from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
 from .permissions import IsAuthenticatedAndNotAdmin
-from .models import Chat, Message
-from .serializers import ChatSerializer , MessageSerializer
+from .models import ArchivedMessage, Chat, ChatReadCursor, Message
+from .serializers import ChatSerializer , MessageSerializer, ChatInboxSerializer, ChatReadCursorSerializer
+from .pagination import MessageKeysetPagination, ChatInboxPagination
 from .schema import *
 
 @custom_chat_list_schema
@@ -15,16 +19,62 @@ class ChatListView(ListAPIView):
 class ChatMessagesDetailView(ListAPIView):
     queryset = Message.objects.all().select_related('chat')
     serializer_class = MessageSerializer
+    pagination_class = MessageKeysetPagination
     permission_classes = [IsAuthenticatedAndNotAdmin]
     def get_queryset(self):
-        return super().get_queryset().filter(chat__room=f'chat_{self.request.user.id}')
+        return self.filter_chat(super().get_queryset())
+
+    def get_archive_queryset(self):
+        return self.filter_chat(ArchivedMessage.objects.select_related('chat'))
+
+    def filter_chat(self, queryset):
+        # the chat by its unique owner, then its messages by chat id, both index lookups
+        chat = Chat.objects.filter(owner=self.request.user).values('pk')[:1]
+        return queryset.filter(chat_id=Subquery(chat))
 
 
 @custom_chat_list_schema
 class ChatAdminMessagesDetailView(ListAPIView):
     queryset = Message.objects.all().select_related('chat')
     serializer_class = MessageSerializer
+    pagination_class = MessageKeysetPagination
     permission_classes = [IsAdminUser]
     def get_queryset(self):
-        return super().get_queryset().filter(chat__id=self.kwargs['pk'])
-    
+        return super().get_queryset().filter(chat_id=self.kwargs['pk'])
+
+    def get_archive_queryset(self):
+        return ArchivedMessage.objects.select_related('chat').filter(chat_id=self.kwargs['pk'])
+
+
+@custom_chat_inbox_schema
+class ChatInboxView(ListAPIView):
+    serializer_class = ChatInboxSerializer
+    pagination_class = ChatInboxPagination
+    permission_classes = [IsAdminUser]
+
+    def get_queryset(self):
+        # the admin's read cursor is joined in, not looked up per chat
+        return (
+            Chat.objects.filter(last_message_at__isnull=False)
+            .select_related('last_message')
+            .annotate(read_cursor=FilteredRelation('read_cursors', condition=Q(read_cursors__user=self.request.user)))
+            .annotate(unread_count=F('message_count') - Coalesce(
+                F('read_cursor__read_count'), 0, output_field=IntegerField(),
+            ))
+        )
+
+
+@custom_chat_mark_read_schema
+class ChatMarkReadView(GenericAPIView):
+    queryset = Chat.objects.all()
+    serializer_class = ChatReadCursorSerializer
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, pk):
+        chat = self.get_object()
+        cursor, _ = ChatReadCursor.objects.update_or_create(
+            chat=chat,
+            user=request.user,
+            defaults={'read_count': chat.message_count, 'last_read_message_id': chat.last_message_id},
+        )
+        return Response(self.get_serializer(cursor).data)
@@ -0,0 +1,77 @@
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .. import geo
+
+
+class GeoFilterBackend(BaseFilterBackend):
+    """
+    Area search on emergencies with coordinates:
+    - `?lat=&lng=&radius=<km>` within a radius, nearest first, with `distance`
+    - `?bbox=<min_lng>,<min_lat>,<max_lng>,<max_lat>` inside a bounding box
+    """
+
+    max_radius_km = 500
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        if 'bbox' in params:
+            min_lng, min_lat, max_lng, max_lat = self.parse_floats('bbox', params['bbox'], 4)
+            if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lng <= max_lng <= 180):
+                raise ValidationError({'bbox': "Expected min_lng,min_lat,max_lng,max_lat with min <= max."})
+            queryset = self.within(queryset, (min_lat, min_lng, max_lat, max_lng))
+
+        if {'lat', 'lng', 'radius'} & params.keys():
+            lat, lng, radius = (self.parse_floats(name, params.get(name, ''), 1)[0] for name in ('lat', 'lng', 'radius'))
+            if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+                raise ValidationError({'lat': "Coordinates out of range."})
+            if not 0 < radius <= self.max_radius_km:
+                raise ValidationError({'radius': f"Must be between 0 and {self.max_radius_km} km."})
+            queryset = (
+                self.within(queryset, *geo.radius_bboxes(lat, lng, radius))
+                .annotate(distance=geo.distance_km(lat, lng))
+                .filter(distance__lte=radius)
+                .order_by('distance', '-created_at')
+            )
+
+        return queryset
+
+    def within(self, queryset, *boxes):
+        # the cells narrow the scan down through the geohash index,
+        # the ranges drop the rows of those cells that are outside the box;
+        # several boxes (a radius across the antimeridian) are OR'ed
+        query = Q()
+        for min_lat, min_lng, max_lat, max_lng in boxes:
+            query |= geo.cells_q(geo.covering_cells(min_lat, min_lng, max_lat, max_lng)) & Q(
+                latitude__range=(min_lat, max_lat),
+                longitude__range=(min_lng, max_lng),
+            )
+        return queryset.filter(query)
+
+    def parse_floats(self, name, value, count):
+        try:
+            numbers = [float(part) for part in value.split(',')]
+        except ValueError:
+            numbers = []
+        if len(numbers) != count:
+            raise ValidationError({name: "Invalid value." if count == 1 else f"Expected {count} comma-separated numbers."})
+        return numbers
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': name,
+                'required': False,
+                'in': 'query',
+                'description': description,
+                'schema': {'type': schema_type},
+            }
+            for name, schema_type, description in (
+                ('lat', 'number', 'Latitude of the radius search center.'),
+                ('lng', 'number', 'Longitude of the radius search center.'),
+                ('radius', 'number', f'Radius in km (max {self.max_radius_km}), results are sorted by distance.'),
+                ('bbox', 'string', 'min_lng,min_lat,max_lng,max_lat'),
+            )
+        ]
@@ -0,0 +1,67 @@
+import hashlib
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.response import Response
+
+from ..cache import get_cache, get_cache_settings, get_generations
+
+
+class CachedResponseMixin:
+    """
+    Serve GET responses of a read-only view from the cache.
+
+    The key is built from the generations returned by
+    `get_cache_generation_keys()` (see emergency/cache.py), the full URL,
+    the negotiated media type and `get_cache_variant()`. The ETag is the
+    same key, so a matching `If-None-Match` gets a 304 before anything is
+    queried or serialized.
+    """
+
+    def get_cache_generation_keys(self):
+        raise NotImplementedError
+
+    def get_cache_variant(self):
+        """Anything besides the URL the response depends on."""
+        return ''
+
+    def get_response_cache_key(self, request):
+        generations = get_generations(*self.get_cache_generation_keys())
+        raw = '|'.join([
+            *map(str, generations),
+            request.accepted_media_type,
+            self.get_cache_variant(),
+            request.build_absolute_uri(),
+        ])
+        return f'emergency:response:{hashlib.sha1(raw.encode()).hexdigest()}'
+
+    def get(self, request, *args, **kwargs):
+        key = self.get_response_cache_key(request)
+        etag = quote_etag(key.rsplit(':', 1)[1])
+
+        if self.etag_matches(request, etag):
+            response = HttpResponseNotModified()
+        else:
+            cached = get_cache().get(key)
+            if cached is not None:
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+            else:
+                self.response_cache_key = key
+                response = super().get(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+        return response
+
+    def etag_matches(self, request, etag):
+        # If-None-Match uses the weak comparison
+        tags = parse_etags(request.headers.get('If-None-Match', ''))
+        return etag in (tag.removeprefix('W/') for tag in tags)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, 'response_cache_key', None)
+        if key and isinstance(response, Response) and response.status_code == 200:
+            response.render()
+            get_cache().set(key, (response.content, response['Content-Type']), get_cache_settings()['TIMEOUT'])
+        return response
@@ -0,0 +1,7 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ResolvedEmergencyPagination(CursorPagination):
+    """Most recently resolved first, read along the `emergency_resolved_idx` index."""
+
+    ordering = ('-resolved_at', '-id')
@@ -0,0 +1,6 @@
+from rest_framework.permissions import BasePermission
+
+
+class IsStaffOrReporter(BasePermission):
+    def has_object_permission(self, request, view, obj):
+        return request.user.is_staff or obj.user_id == request.user.pk
@@ -1,15 +1,51 @@
+from django.db import transaction
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
-from ..models import Emergency, EmergencyImage
+from ..models import Emergency, EmergencyImage, MAX_IMAGES
+from ..images import store_uploads, delete_stored
+from ..processing import RENDITIONS, image_queue
+
+
+def choose_rendition(request):
+    """
+    Pick the image rendition for a client: an explicit `?rendition=`, then
+    the `Save-Data` and viewport width client hints, else the preview.
+    """
+    requested = request.query_params.get('rendition')
+    if requested in (*RENDITIONS, 'original'):
+        return requested
+    if request.headers.get('Save-Data', '').lower() == 'on':
+        return 'thumbnail'
+    width = request.headers.get('Sec-CH-Viewport-Width') or request.headers.get('Viewport-Width')
+    if width and width.isdigit():
+        for rendition, max_side in RENDITIONS.items():
+            if int(width) <= max_side:
+                return rendition
+        return 'original'
+    return 'preview'
 
 
 class EmergencyImageSerializer(serializers.ModelSerializer):
     """
     Serializer for the EmergencyImage model.
+    `image` is the rendition picked by the view (see `choose_rendition`),
+    or the original upload while renditions are still being generated.
     """
+    image = serializers.SerializerMethodField()
+
     class Meta:
         model = EmergencyImage
         fields = ['id', 'image']
 
+    @extend_schema_field(OpenApiTypes.URI)
+    def get_image(self, obj):
+        rendition = self.context.get('rendition', 'preview')
+        image = getattr(obj, rendition) if rendition in RENDITIONS else None
+        url = (image or obj.image).url
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
 
 class MinimalEmergencySerializer(serializers.ModelSerializer):
     """
@@ -20,6 +56,7 @@ class MinimalEmergencySerializer(serializers.ModelSerializer):
     - image (the first image, if any)
     """
     image = serializers.SerializerMethodField()
+    distance = serializers.SerializerMethodField()
     user_first_name = serializers.ReadOnlyField(source='user.first_name')
     user_last_name = serializers.ReadOnlyField(source='user.last_name')
     class Meta:
@@ -29,16 +66,36 @@ class MinimalEmergencySerializer(serializers.ModelSerializer):
             'emergency_type',
             'created_at',
             'location',
+            'latitude',
+            'longitude',
+            'distance',
             'image',
             'user_first_name',
             'user_last_name',
+            'status',
+            'acknowledged_at',
+            'resolved_at',
             ] 
 
+    @extend_schema_field(OpenApiTypes.FLOAT)
+    def get_distance(self, obj):
+        """
+        Distance in km from the center of a radius search, None otherwise.
+        """
+        distance = getattr(obj, 'distance', None)
+        return round(distance, 3) if distance is not None else None
+
     def get_image(self, obj):
         """
         Return the URL of the first image associated with this Emergency, or None if no images exist.
+        Read from the denormalized cover columns, no extra query. The thumbnail
+        is served once it has been generated.
         """
-        return first_image.image.url if (first_image := obj.images.first()) else None
+        cover = obj.cover_thumbnail or obj.cover_image
+        if not cover:
+            return None
+        request = self.context.get('request')
+        return request.build_absolute_uri(cover.url) if request else cover.url
 
 
 class EmergencyDetailSerializer(serializers.ModelSerializer):
@@ -60,9 +117,14 @@ class EmergencyDetailSerializer(serializers.ModelSerializer):
             'description',
             'created_at',
             'location',
+            'latitude',
+            'longitude',
             'user_first_name',
             'user_last_name',
             'images',
+            'status',
+            'acknowledged_at',
+            'resolved_at',
         ]
 
 
@@ -72,6 +134,7 @@ class CreateEmergencySerializer(serializers.ModelSerializer):
     - emergency_type
     - description
     - location
+    - latitude, longitude (optional, both or neither)
     - images (list of file uploads, optional)
     (User is set automatically in the view, not posted by the client)
     """
@@ -87,13 +150,40 @@ class CreateEmergencySerializer(serializers.ModelSerializer):
             'emergency_type',
             'description',
             'location',
+            'latitude',
+            'longitude',
             'images',
         ]
 
+    def validate(self, attrs):
+        if (attrs.get('latitude') is None) != (attrs.get('longitude') is None):
+            raise serializers.ValidationError("latitude and longitude must be sent together.")
+        return super().validate(attrs)
+
+    def validate_images(self, value):
+        if len(value) > MAX_IMAGES:
+            raise serializers.ValidationError(f"Cannot upload more than {MAX_IMAGES} images for this emergency.")
+        return value
+
     def create(self, validated_data):
         images_data = validated_data.pop('images', [])
-        # We'll set user in the view's perform_create
-        emergency = Emergency.objects.create(**validated_data)
-        for image_file in images_data:
-            EmergencyImage.objects.create(emergency=emergency, image=image_file)
+        # files are written in parallel before the transaction opens,
+        # then the emergency and all its image rows go in together
+        names = store_uploads(images_data)
+        try:
+            with transaction.atomic():
+                # We'll set user in the view's perform_create
+                emergency = Emergency.objects.create(
+                    **validated_data,
+                    image_count=len(names),
+                    cover_image=names[0] if names else '',
+                )
+                EmergencyImage.objects.bulk_create(
+                    EmergencyImage(emergency=emergency, image=name) for name in names
+                )
+        except Exception:
+            delete_stored(names)
+            raise
+        image_ids = list(emergency.images.values_list('id', flat=True)) if names else []
+        transaction.on_commit(lambda: image_queue.enqueue(image_ids))
         return emergency
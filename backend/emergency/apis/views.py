@@ -1,15 +1,26 @@
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
 from rest_framework import generics, permissions
-from ..models import Emergency
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from ..models import Emergency, EmergencyStatus
 from .serializers import (
     MinimalEmergencySerializer,
     EmergencyDetailSerializer,
     CreateEmergencySerializer,
+    choose_rendition,
 )
-from ..schema import emergency_create_schema
+from ..schema import emergency_create_schema, emergency_transition_schema
+from .filters import GeoFilterBackend
+from ..feed import publish_emergency
+from ..cache import LIST_GENERATION_KEY, detail_generation_key
+from .mixins import CachedResponseMixin
+from .pagination import ResolvedEmergencyPagination
+from .permissions import IsStaffOrReporter
 from django_filters.rest_framework import DjangoFilterBackend
 
 
-class EmergencyListView(generics.ListAPIView):
+class EmergencyListView(CachedResponseMixin, generics.ListAPIView):
     """
     GET /emergency/
     Returns a minimal list of Emergency objects:
@@ -17,25 +28,82 @@ class EmergencyListView(generics.ListAPIView):
       - emergency_type
       - description
       - first image (if any)
+    Only open and acknowledged emergencies are listed, resolved ones are
+    under /emergency/resolved/.
+    Supports radius (`lat`, `lng`, `radius`) and `bbox` area search.
+    Responses are cached until any emergency changes.
     """
-    queryset = Emergency.objects.all().order_by('-created_at').select_related('user')
+    queryset = Emergency.objects.active().order_by('-created_at').select_related('user')
     serializer_class = MinimalEmergencySerializer
     # permission_classes = [permissions.IsAuthenticated]  
+    filter_backends = [DjangoFilterBackend, GeoFilterBackend]
+    filterset_fields = ['emergency_type']
+
+    def get_cache_generation_keys(self):
+        return [LIST_GENERATION_KEY]
+
+
+class ResolvedEmergencyListView(CachedResponseMixin, generics.ListAPIView):
+    """
+    GET /emergency/resolved/
+    Resolved emergencies, most recently resolved first, in the format of
+    the list. Cursor paginated along `emergency_resolved_idx`.
+    """
+    queryset = Emergency.objects.resolved().select_related('user')
+    serializer_class = MinimalEmergencySerializer
+    pagination_class = ResolvedEmergencyPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['emergency_type']
 
+    def get_cache_generation_keys(self):
+        return [LIST_GENERATION_KEY]
 
-class EmergencyDetailView(generics.RetrieveAPIView):
+
+class ReportedEmergencyListView(generics.ListAPIView):
+    """
+    GET /emergency/mine/
+    The requesting user's own emergencies, whatever their status, newest
+    first, in the format of the list. Read along `emergency_user_idx`.
+    Not cached, the shared response cache is keyed on the URL only.
+    """
+    serializer_class = MinimalEmergencySerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Emergency.objects.filter(user=self.request.user).order_by('-created_at').select_related('user')
+
+
+class EmergencyDetailView(CachedResponseMixin, generics.RetrieveAPIView):
     """
     GET /emergency/<pk>/
     Returns a detailed view of a single Emergency:
       - all images
       - user_first_name, user_last_name
       - lat, lgt, etc.
+    Responses are cached per rendition until the emergency changes.
     """
     queryset = Emergency.objects.all().select_related('user')
     serializer_class = EmergencyDetailSerializer
     # permission_classes = [permissions.IsAuthenticated]  # Lock it down if needed
+    client_hints = ['Save-Data', 'Viewport-Width', 'Sec-CH-Viewport-Width']
+
+    def get_cache_generation_keys(self):
+        return [detail_generation_key(self.kwargs['pk'])]
+
+    def get_cache_variant(self):
+        return choose_rendition(self.request)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['rendition'] = choose_rendition(self.request)
+        return context
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        # image URLs depend on these headers
+        response['Accept-CH'] = ', '.join(self.client_hints)
+        patch_vary_headers(response, self.client_hints)
+        return response
 
 
 @emergency_create_schema
@@ -50,4 +118,35 @@ class EmergencyCreateView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        emergency = serializer.save(user=self.request.user)
+        # the same absolute URLs as the list
+        data = MinimalEmergencySerializer(emergency, context=self.get_serializer_context()).data
+        # the emergency is saved whatever happens to the feed, a failed push
+        # is logged instead of turning the response into a 500
+        transaction.on_commit(lambda: publish_emergency(emergency, data), robust=True)
+
+
+class EmergencyTransitionView(generics.GenericAPIView):
+    """
+    POST /emergency/<pk>/acknowledge/ and /emergency/<pk>/resolve/
+    Moves the emergency along open -> acknowledged -> resolved, recording
+    when. Responds 400 when the emergency is already past that status.
+    """
+    queryset = Emergency.objects.all().select_related('user')
+    serializer_class = EmergencyDetailSerializer
+    status = None
+
+    def get_permissions(self):
+        if self.status == EmergencyStatus.ACKNOWLEDGED:
+            return [permissions.IsAdminUser()]
+        # reporters can close their own emergency
+        return [permissions.IsAuthenticated(), IsStaffOrReporter()]
+
+    @emergency_transition_schema
+    def post(self, request, pk):
+        emergency = self.get_object()
+        if not emergency.transition(self.status):
+            raise ValidationError(
+                {'status': f"Cannot go from {emergency.get_status_display()} to {EmergencyStatus(self.status).label}."}
+            )
+        return Response(self.get_serializer(emergency).data)
@@ -0,0 +1,75 @@
+"""
+Generation counters for the cached emergency responses.
+
+Cached list and detail responses are keyed on a generation number that
+is bumped whenever the data behind them changes, so entries are never
+served stale and never have to be found and deleted: a bump simply makes
+every key built from the old number unreachable.
+
+- the list generation changes with any emergency or image
+- each emergency has its own generation for its detail page
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+DEFAULTS = {
+    'CACHE': 'default',
+    # only bounds memory, entries are invalidated through the generations
+    'TIMEOUT': 3600,
+}
+
+LIST_GENERATION_KEY = 'emergency:generation:list'
+
+
+def get_cache_settings():
+    return {**DEFAULTS, **getattr(settings, 'EMERGENCY_RESPONSE_CACHE', {})}
+
+
+def get_cache():
+    return caches[get_cache_settings()['CACHE']]
+
+
+def detail_generation_key(emergency_id):
+    return f'emergency:generation:{emergency_id}'
+
+
+def get_generations(*keys):
+    cache = get_cache()
+    found = cache.get_many(keys)
+    missing = {key: initial_generation() for key in keys if key not in found}
+    for key, value in missing.items():
+        # another worker may have started this counter in the meantime
+        if not cache.add(key, value, timeout=None):
+            value = cache.get(key, value)
+        found[key] = value
+    return [found[key] for key in keys]
+
+
+def initial_generation():
+    # a counter that was evicted must not start again at a number whose
+    # responses may still be cached, so start from the clock
+    return time.time_ns() // 1000
+
+
+def bump(keys):
+    cache = get_cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, initial_generation(), timeout=None)
+
+
+def invalidate_emergency(emergency_id):
+    """
+    Drop the cached responses showing this emergency. Called again once
+    the transaction commits, or a request reading the old rows in the
+    meantime could cache them under the new generation.
+    """
+    keys = [LIST_GENERATION_KEY, detail_generation_key(emergency_id)]
+    bump(keys)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: bump(keys))
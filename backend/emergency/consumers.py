@@ -0,0 +1,97 @@
+import json
+from channels.generic.websocket import AsyncWebsocketConsumer
+from . import geo
+from .feed import subscription_groups
+from .models import EmergencyType
+from .apis.filters import GeoFilterBackend
+from .schema import emergency_feed_schema
+
+MAX_RADIUS_KM = GeoFilterBackend.max_radius_km
+
+
+class EmergencyFeedConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes new emergencies to the client as they are created, so clients
+    no longer have to poll the emergency list. Nothing is checked about
+    the user, the list is public as well.
+    """
+    subscribed_groups = ()
+    # the (min_lat, min_lng, max_lat, max_lng) boxes and (lat, lng, radius) of the current subscription
+    areas = None
+    circle = None
+
+    async def connect(self):
+        await self.accept()
+        await self.subscribe(EmergencyType.values)
+
+    async def disconnect(self, close_code):
+        await self.join([])
+
+    @emergency_feed_schema
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+            if not isinstance(data, dict):
+                raise ValueError("Expected a JSON object.")
+            types, areas, circle = self.parse_subscription(data)
+        except json.JSONDecodeError:
+            await self.send(json.dumps({'error': 'Invalid JSON format.'}))
+            return
+        except ValueError as exc:
+            await self.send(json.dumps({'error': str(exc)}))
+            return
+
+        await self.subscribe(types, areas, circle)
+        await self.send(json.dumps({'subscribed': data}))
+
+    def parse_subscription(self, data):
+        types = data.get('types') or EmergencyType.values
+        if not isinstance(types, list) or not set(types) <= set(EmergencyType.values):
+            raise ValueError(f"types must be a list of {', '.join(EmergencyType.values)}.")
+
+        try:
+            if 'bbox' in data:
+                min_lng, min_lat, max_lng, max_lat = map(float, data['bbox'])
+                if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lng <= max_lng <= 180):
+                    raise ValueError
+                return types, [(min_lat, min_lng, max_lat, max_lng)], None
+            if {'lat', 'lng', 'radius'} & data.keys():
+                lat, lng, radius = (float(data[name]) for name in ('lat', 'lng', 'radius'))
+                if not (-90 <= lat <= 90 and -180 <= lng <= 180 and 0 < radius <= MAX_RADIUS_KM):
+                    raise ValueError
+                return types, geo.radius_bboxes(lat, lng, radius), (lat, lng, radius)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(
+                "Expected bbox as [min_lng, min_lat, max_lng, max_lat], "
+                f"or lat, lng and radius (at most {MAX_RADIUS_KM} km)."
+            )
+        return types, None, None
+
+    async def subscribe(self, types, areas=None, circle=None):
+        self.areas = areas
+        self.circle = circle
+        await self.join(subscription_groups(types, *areas or ()))
+
+    async def join(self, groups):
+        current = set(self.subscribed_groups)
+        for group in current - set(groups):
+            await self.channel_layer.group_discard(group, self.channel_name)
+        for group in set(groups) - current:
+            await self.channel_layer.group_add(group, self.channel_name)
+        self.subscribed_groups = groups
+
+    async def emergency_created(self, event):
+        # the groups cover whole geohash cells, so drop what is outside the exact area
+        if self.areas is not None:
+            lat, lng = event['latitude'], event['longitude']
+            if lat is None or lng is None:
+                return
+            if not any(
+                min_lat <= lat <= max_lat and min_lng <= lng <= max_lng
+                for min_lat, min_lng, max_lat, max_lng in self.areas
+            ):
+                return
+            if self.circle is not None and geo.haversine_km(self.circle[0], self.circle[1], lat, lng) > self.circle[2]:
+                return
+        # the frame was encoded once by the publisher, just pass it on
+        await self.send(text_data=event['text'])
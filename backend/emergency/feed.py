@@ -0,0 +1,62 @@
+"""
+Groups and events for the live emergency feed (`ws/emergency/`).
+
+A new emergency is sent to one group per type and, when it has
+coordinates, to the group of its geohash cell at `FEED_PRECISION`.
+Subscribers with an area join the cell groups that cover it, the others
+join the type groups, so each subscriber is in exactly one group an
+emergency can be sent to and never gets it twice.
+"""
+import json
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from . import geo
+
+# ~39km x 20km cells
+FEED_PRECISION = 4
+# areas needing more cells than this listen on the type groups instead
+MAX_FEED_CELLS = 64
+
+
+def type_group(emergency_type):
+    return f"emergency_feed_{emergency_type}"
+
+
+def cell_group(emergency_type, cell):
+    return f"emergency_feed_{emergency_type}_{cell}"
+
+
+def subscription_groups(types, *bboxes):
+    """The groups to join for `types` inside any of `bboxes` (min_lat, min_lng, max_lat, max_lng)."""
+    if not bboxes or sum(geo.grid_size(*bbox, FEED_PRECISION) for bbox in bboxes) > MAX_FEED_CELLS:
+        return [type_group(emergency_type) for emergency_type in types]
+    cells = sorted({cell for bbox in bboxes for cell in geo.cells_at(*bbox, FEED_PRECISION)})
+    return [cell_group(emergency_type, cell) for emergency_type in types for cell in cells]
+
+
+def emergency_event(emergency, data):
+    """
+    The `emergency_created` group event. `data` is encoded here once and
+    forwarded as is, the coordinates are kept apart so consumers can drop
+    it when it falls outside their exact area.
+    """
+    return {
+        'type': 'emergency_created',
+        'latitude': emergency.latitude,
+        'longitude': emergency.longitude,
+        'text': json.dumps(data),
+    }
+
+
+def publish_emergency(emergency, data):
+    event = emergency_event(emergency, data)
+    groups = [type_group(emergency.emergency_type)]
+    if emergency.geohash:
+        groups.append(cell_group(emergency.emergency_type, emergency.geohash[:FEED_PRECISION]))
+
+    channel_layer = get_channel_layer()
+    send = async_to_sync(channel_layer.group_send)
+    for group in groups:
+        send(group, event)
@@ -0,0 +1,125 @@
+"""
+Geohash helpers for searching emergencies by area without PostGIS.
+
+Every emergency with coordinates stores its geohash in an indexed column.
+An area is turned into a handful of geohash cells that cover it, each cell
+is a range scan on that index, and the exact distance is only computed
+for the rows inside those cells.
+"""
+import math
+
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 9  # ~5m cells
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def encode(lat, lng, precision=PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = bit_count = 0
+    even = True
+    while len(chars) < precision:
+        bounds, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            bounds[0] = mid
+        else:
+            bits = bits * 2
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell."""
+    bits = precision * 5
+    return 180 / 2 ** (bits // 2), 360 / 2 ** ((bits + 1) // 2)
+
+
+def covering_cells(min_lat, min_lng, max_lat, max_lng, max_cells=32):
+    """
+    The geohash cells, at the finest precision that needs at most
+    `max_cells` of them, that together cover the bounding box.
+    """
+    for precision in range(PRECISION, 0, -1):
+        if grid_size(min_lat, min_lng, max_lat, max_lng, precision) <= max_cells:
+            break
+    return cells_at(min_lat, min_lng, max_lat, max_lng, precision)
+
+
+def grid_size(min_lat, min_lng, max_lat, max_lng, precision):
+    """Upper bound on the number of cells of `precision` the box touches."""
+    height, width = cell_size(precision)
+    return (int((max_lat - min_lat) / height) + 2) * (int((max_lng - min_lng) / width) + 2)
+
+
+def cells_at(min_lat, min_lng, max_lat, max_lng, precision):
+    """The geohash cells of `precision` that the bounding box touches."""
+    height, width = cell_size(precision)
+    rows = int((max_lat - min_lat) / height) + 2
+    cols = int((max_lng - min_lng) / width) + 2
+    # sample no further apart than one cell, so every cell the box touches is hit
+    return sorted({
+        encode(min(min_lat + row * height, max_lat), min(min_lng + col * width, max_lng), precision)
+        for row in range(rows)
+        for col in range(cols)
+    })
+
+
+def cells_q(cells, field='geohash'):
+    """Match rows inside any of the cells, as index range scans."""
+    query = Q()
+    for cell in cells:
+        # '~' sorts after every geohash character
+        query |= Q(**{f'{field}__gte': cell, f'{field}__lt': cell + '~'})
+    return query
+
+
+def radius_bboxes(lat, lng, radius_km):
+    """
+    Bounding boxes (min_lat, min_lng, max_lat, max_lng) that together cover
+    the circle of `radius_km` around (lat, lng).
+
+    Longitudes wrap: a circle crossing the antimeridian gives two boxes,
+    one on each side of ±180°, and one reaching a pole spans every longitude.
+    """
+    dlat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    if min_lat == -90.0 or max_lat == 90.0:
+        return [(min_lat, -180.0, max_lat, 180.0)]
+    dlng = radius_km / (KM_PER_DEGREE * math.cos(math.radians(lat)))
+    west, east = lng - dlng, lng + dlng
+    if dlng >= 180:
+        return [(min_lat, -180.0, max_lat, 180.0)]
+    if west < -180:
+        return [(min_lat, west + 360, max_lat, 180.0), (min_lat, -180.0, max_lat, east)]
+    if east > 180:
+        return [(min_lat, west, max_lat, 180.0), (min_lat, -180.0, max_lat, east - 360)]
+    return [(min_lat, west, max_lat, east)]
+
+
+def distance_km(lat, lng, lat_field='latitude', lng_field='longitude'):
+    """Haversine distance from (lat, lng) as a database expression."""
+    dlat = Radians(F(lat_field) - Value(lat)) / 2
+    dlng = Radians(F(lng_field) - Value(lng)) / 2
+    a = Power(Sin(dlat), 2) + math.cos(math.radians(lat)) * Cos(Radians(F(lat_field))) * Power(Sin(dlng), 2)
+    # Least() guards asin against rounding just above 1 for antipodal points
+    return 2 * EARTH_RADIUS_KM * ASin(Least(Sqrt(a), Value(1.0)), output_field=FloatField())
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Haversine distance in Python, for points already in memory."""
+    dlat = math.radians(lat2 - lat1) / 2
+    dlng = math.radians(lng2 - lng1) / 2
+    a = math.sin(dlat) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(a), 1.0))
@@ -0,0 +1,61 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .models import EmergencyImage
+
+# formats kept as uploaded, anything else (e.g. MPO from phone cameras) is stored as JPEG
+KEPT_FORMATS = {'JPEG', 'PNG', 'WEBP'}
+
+
+def strip_metadata(upload):
+    """
+    Re-encode an uploaded image without its metadata, so the stored
+    original carries no EXIF (GPS position, device) either. The EXIF
+    orientation is baked into the pixels before the tags are dropped.
+    """
+    upload.seek(0)
+    with Image.open(upload) as original:
+        fmt = original.format if original.format in KEPT_FORMATS else 'JPEG'
+        image = ImageOps.exif_transpose(original)
+        image.info.pop('exif', None)
+        if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        image.save(output, format=fmt, **({'quality': 90} if fmt in ('JPEG', 'WEBP') else {}))
+    return ContentFile(output.getvalue(), name=upload.name)
+
+
+def store_uploads(files):
+    """
+    Write uploaded images to storage concurrently, without their metadata
+    (see `strip_metadata`), and return their stored names, in upload order. If any write fails, the files that did get
+    stored are removed before the error is raised.
+    """
+    if not files:
+        return []
+    field = EmergencyImage._meta.get_field('image')
+
+    def store(upload):
+        name = field.generate_filename(None, upload.name)
+        return field.storage.save(name, strip_metadata(upload), max_length=field.max_length)
+
+    workers = min(len(files), getattr(settings, 'EMERGENCY_IMAGE_UPLOAD_WORKERS', 4))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(store, upload) for upload in files]
+
+    names = [future.result() for future in futures if not future.exception()]
+    errors = [future.exception() for future in futures if future.exception()]
+    if errors:
+        delete_stored(names)
+        raise errors[0]
+    return names
+
+
+def delete_stored(names):
+    storage = EmergencyImage._meta.get_field('image').storage
+    for name in names:
+        storage.delete(name)
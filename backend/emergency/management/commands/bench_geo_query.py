@@ -0,0 +1,74 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from emergency import geo
+from emergency.apis.filters import GeoFilterBackend
+from emergency.models import Emergency
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Time radius searches through the geohash index against a full scan, on synthetic rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--radius', type=float, default=5, help="search radius in km")
+        parser.add_argument('--queries', type=int, default=20)
+        parser.add_argument('--keep', action='store_true', help="keep the synthetic rows instead of rolling back")
+
+    def handle(self, *args, **options):
+        rng = random.Random(1)
+        # rows spread over a 4x4 degree area, roughly 440 x 380 km
+        area = (29.5, 33.5, 33.5, 37.5)
+
+        with transaction.atomic():
+            self.populate(options['rows'], area, rng)
+            centers = [(rng.uniform(area[0], area[2]), rng.uniform(area[1], area[3])) for _ in range(options['queries'])]
+
+            backend = GeoFilterBackend()
+            radius = options['radius']
+            indexed = self.time_queries(centers, lambda lat, lng: (
+                backend.within(Emergency.objects.all(), *geo.radius_bboxes(lat, lng, radius))
+                .annotate(distance=geo.distance_km(lat, lng))
+                .filter(distance__lte=radius)
+            ))
+            scan = self.time_queries(centers, lambda lat, lng: (
+                Emergency.objects.annotate(distance=geo.distance_km(lat, lng)).filter(distance__lte=radius)
+            ))
+
+            self.stdout.write(f"{options['rows']} rows, radius {radius} km, {len(centers)} queries")
+            self.stdout.write(f"{'':>14} {'median ms':>10} {'max ms':>8} {'avg hits':>9}")
+            for label, (timings, hits) in (('geohash index', indexed), ('full scan', scan)):
+                self.stdout.write(f"{label:>14} {statistics.median(timings):>10.1f} {max(timings):>8.1f} {hits:>9.1f}")
+
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+    def populate(self, rows, area, rng, batch_size=10_000):
+        user = User.objects.create_user(email=f'bench-{uuid.uuid4().hex}@example.com')
+        start = time.perf_counter()
+        for offset in range(0, rows, batch_size):
+            batch = []
+            for _ in range(min(batch_size, rows - offset)):
+                lat, lng = rng.uniform(area[0], area[2]), rng.uniform(area[1], area[3])
+                batch.append(Emergency(
+                    description='synthetic', location='synthetic', user=user,
+                    latitude=lat, longitude=lng, geohash=geo.encode(lat, lng),
+                ))
+            Emergency.objects.bulk_create(batch)
+        self.stdout.write(f"inserted {rows} rows in {time.perf_counter() - start:.1f}s")
+
+    def time_queries(self, centers, build):
+        timings, hits = [], []
+        for lat, lng in centers:
+            start = time.perf_counter()
+            hits.append(len(build(lat, lng).values_list('id', flat=True)))
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings, statistics.mean(hits)
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from emergency.images import strip_metadata
+from emergency.models import EmergencyImage
+from emergency.processing import process_image
+
+
+class Command(BaseCommand):
+    help = "Generate missing renditions, e.g. for uploads lost when a worker restarted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--strip-originals', action='store_true',
+                            help="also rewrite every stored original without its EXIF, for uploads stored before it was stripped at ingest")
+
+    def handle(self, *args, **options):
+        if options['strip_originals']:
+            self.strip_originals()
+
+        pending = EmergencyImage.objects.filter(thumbnail='').values_list('id', flat=True)
+        processed = 0
+        for image_id in pending.iterator():
+            try:
+                process_image(image_id)
+            except Exception as exc:
+                self.stderr.write(f"image {image_id}: {exc}")
+            else:
+                processed += 1
+        self.stdout.write(f"Processed {processed} images")
+
+    def strip_originals(self):
+        stripped = 0
+        for image in EmergencyImage.objects.only('image').iterator():
+            storage = image.image.storage
+            try:
+                with storage.open(image.image.name, 'rb') as original:
+                    clean = strip_metadata(original)
+                # same name, so the stored paths and cover_image stay valid
+                storage.delete(image.image.name)
+                saved = storage.save(image.image.name, clean)
+                assert saved == image.image.name, f"stored as {saved}"
+            except Exception as exc:
+                self.stderr.write(f"image {image.pk}: {exc}")
+            else:
+                stripped += 1
+        self.stdout.write(f"Stripped {stripped} originals")
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+def backfill_image_fields(apps, schema_editor):
+    Emergency = apps.get_model('emergency', 'Emergency')
+    EmergencyImage = apps.get_model('emergency', 'EmergencyImage')
+    for emergency in Emergency.objects.all().iterator():
+        images = list(EmergencyImage.objects.filter(emergency=emergency).order_by('pk').values_list('image', flat=True))
+        if images:
+            emergency.image_count = len(images)
+            emergency.cover_image = images[0]
+            emergency.save(update_fields=['image_count', 'cover_image'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0005_remove_emergency_lat_remove_emergency_lgt_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emergency',
+            name='cover_image',
+            field=models.ImageField(blank=True, editable=False, upload_to='emergency/images'),
+        ),
+        migrations.AddField(
+            model_name='emergency',
+            name='image_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_image_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0006_emergency_image_count_cover_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emergency',
+            name='cover_thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to='emergency/renditions'),
+        ),
+        migrations.AddField(
+            model_name='emergencyimage',
+            name='preview',
+            field=models.ImageField(blank=True, editable=False, upload_to='emergency/renditions'),
+        ),
+        migrations.AddField(
+            model_name='emergencyimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to='emergency/renditions'),
+        ),
+    ]
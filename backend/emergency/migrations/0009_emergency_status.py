@@ -0,0 +1,42 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0008_emergency_coordinates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emergency',
+            name='acknowledged_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='emergency',
+            name='resolved_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='emergency',
+            name='status',
+            field=models.CharField(choices=[('O', 'Open'), ('A', 'Acknowledged'), ('R', 'Resolved')], default='O', editable=False, max_length=1),
+        ),
+        migrations.AddIndex(
+            model_name='emergency',
+            index=models.Index(condition=models.Q(('resolved_at__isnull', True)), fields=['-created_at'], name='emergency_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emergency',
+            index=models.Index(condition=models.Q(('resolved_at__isnull', False)), fields=['-resolved_at', '-id'], name='emergency_resolved_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='emergency',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('resolved_at__isnull', False), ('status', 'R')), models.Q(models.Q(('status', 'R'), _negated=True), ('resolved_at__isnull', True)), _connector='OR'), name='emergency_resolved_at_matches_status'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0009_emergency_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emergency',
+            index=models.Index(condition=models.Q(('resolved_at__isnull', True)), fields=['emergency_type', '-created_at'], name='emergency_active_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emergency',
+            index=models.Index(condition=models.Q(('resolved_at__isnull', False)), fields=['emergency_type', '-resolved_at', '-id'], name='emergency_resolved_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emergency',
+            index=models.Index(fields=['user', '-created_at'], name='emergency_user_idx'),
+        ),
+        # the plain user_id index goes once emergency_user_idx covers it
+        migrations.AlterField(
+            model_name='emergency',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
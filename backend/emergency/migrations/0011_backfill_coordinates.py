@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:05
+
+import re
+
+from django.db import migrations
+
+from emergency import geo
+
+# "31.5017, 34.4668": the only form of `location` coordinates can be read from
+COORDINATES = re.compile(r'^\s*(-?\d{1,3}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)\s*$')
+
+
+def backfill_coordinates(apps, schema_editor):
+    # emergencies created before 0008 only have the free-text `location`;
+    # the ones where it is a "lat, lng" pair get their coordinates and
+    # geohash, the others stay out of area searches until they are edited
+    Emergency = apps.get_model('emergency', 'Emergency')
+    rows = Emergency.objects.filter(latitude__isnull=True, longitude__isnull=True).values_list('pk', 'location')
+    for pk, location in rows.iterator():
+        match = COORDINATES.match(location)
+        if not match:
+            continue
+        lat, lng = map(float, match.groups())
+        if -90 <= lat <= 90 and -180 <= lng <= 180:
+            Emergency.objects.filter(pk=pk).update(latitude=lat, longitude=lng, geohash=geo.encode(lat, lng))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0010_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_coordinates, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,17 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Case, Q, When, Value
 from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from . import geo
+from .cache import invalidate_emergency
 
 
 
 User = get_user_model()
 
+MAX_IMAGES = 5
 
 
 class EmergencyType(models.TextChoices):
@@ -14,6 +20,29 @@ class EmergencyType(models.TextChoices):
     MEDICAL_HELP = "M", "Medical Help"
 
 
+class EmergencyStatus(models.TextChoices):
+    OPEN = "O", "Open"
+    ACKNOWLEDGED = "A", "Acknowledged"
+    RESOLVED = "R", "Resolved"
+
+
+# status -> the statuses it can be reached from
+TRANSITIONS = {
+    EmergencyStatus.ACKNOWLEDGED: [EmergencyStatus.OPEN],
+    EmergencyStatus.RESOLVED: [EmergencyStatus.OPEN, EmergencyStatus.ACKNOWLEDGED],
+}
+
+
+class EmergencyQuerySet(models.QuerySet):
+    # "active" is spelled `resolved_at IS NULL`, the condition of the partial
+    # indexes: a literal the planner can match, unlike a bound status value
+    def active(self):
+        return self.filter(resolved_at__isnull=True)
+
+    def resolved(self):
+        return self.filter(resolved_at__isnull=False)
+
+
 class Emergency(models.Model):
     emergency_type = models.CharField(
         max_length=1,
@@ -23,9 +52,85 @@ class Emergency(models.Model):
     description = models.TextField()
     created_at = models.DateTimeField(auto_now_add=1)
     location = models.CharField(max_length=300)
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    # derived from latitude/longitude, area searches are range scans on it (see geo.py)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
+    # indexed as the prefix of emergency_user_idx
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    # kept up to date by EmergencyImage, so lists never have to look at images
+    image_count = models.PositiveSmallIntegerField(default=0, editable=False)
+    cover_image = models.ImageField(upload_to='emergency/images', blank=True, editable=False)
+    cover_thumbnail = models.ImageField(upload_to='emergency/renditions', blank=True, editable=False)
+    status = models.CharField(
+        max_length=1,
+        choices=EmergencyStatus.choices,
+        default=EmergencyStatus.OPEN,
+        editable=False,
+    )
+    acknowledged_at = models.DateTimeField(null=True, blank=True, editable=False)
+    resolved_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = EmergencyQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        # one index per filter and order of the lists, so pages are read in
+        # order from the index instead of sorted, see tests/test_query_plans.py
+        indexes = [
+            # the default list only ever reads the active rows, so the index
+            # stays the size of the working set however much history piles up
+            models.Index(fields=['-created_at'], condition=Q(resolved_at__isnull=True), name='emergency_active_idx'),
+            models.Index(
+                fields=['emergency_type', '-created_at'], condition=Q(resolved_at__isnull=True),
+                name='emergency_active_type_idx',
+            ),
+            models.Index(fields=['-resolved_at', '-id'], condition=Q(resolved_at__isnull=False), name='emergency_resolved_idx'),
+            models.Index(
+                fields=['emergency_type', '-resolved_at', '-id'], condition=Q(resolved_at__isnull=False),
+                name='emergency_resolved_type_idx',
+            ),
+            # a reporter's own emergencies, newest first
+            models.Index(fields=['user', '-created_at'], name='emergency_user_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(status=EmergencyStatus.RESOLVED, resolved_at__isnull=False)
+                | ~Q(status=EmergencyStatus.RESOLVED) & Q(resolved_at__isnull=True),
+                name='emergency_resolved_at_matches_status',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        has_coordinates = self.latitude is not None and self.longitude is not None
+        self.geohash = geo.encode(self.latitude, self.longitude) if has_coordinates else ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
+
+    def transition(self, status):
+        """
+        Move to `status` with one conditional UPDATE, so two admins can't
+        both resolve the same emergency. Returns False, leaving the row
+        alone, when the current status doesn't lead to `status`.
+        """
+        now = timezone.now()
+        timestamps = {
+            EmergencyStatus.ACKNOWLEDGED: {'acknowledged_at': now},
+            EmergencyStatus.RESOLVED: {'resolved_at': now},
+        }[status]
+        updated = Emergency.objects.filter(pk=self.pk, status__in=TRANSITIONS[status]).update(
+            status=status, **timestamps,
+        )
+        if not updated:
+            return False
+        self.status = status
+        for field, value in timestamps.items():
+            setattr(self, field, value)
+        # .update() sends no post_save
+        invalidate_emergency(self.pk)
+        return True
 
 
 class EmergencyImage(models.Model):
@@ -34,7 +139,33 @@ class EmergencyImage(models.Model):
     image = models.ImageField(
         upload_to='emergency/images',
         )
+    # downscaled, EXIF-free copies written by emergency.processing
+    thumbnail = models.ImageField(upload_to='emergency/renditions', blank=True, editable=False)
+    preview = models.ImageField(upload_to='emergency/renditions', blank=True, editable=False)
     def save(self, *args, **kwargs):
-        if EmergencyImage.objects.filter(emergency=self.emergency).count() >= 5:
-            raise ValidationError("Cannot upload more than 5 images for this emergency.")
-        super().save(*args, **kwargs)
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+
+        uploading = not self.image._committed
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                # the cap check and the counter bump are one conditional UPDATE,
+                # concurrent uploads can't both take the last slot
+                reserved = Emergency.objects.filter(
+                    pk=self.emergency_id, image_count__lt=MAX_IMAGES
+                ).update(
+                    image_count=F('image_count') + 1,
+                    cover_image=Case(
+                        When(cover_image='', then=Value(self.image.name)),
+                        default=F('cover_image'),
+                        output_field=models.CharField(),
+                    ),
+                )
+                if not reserved:
+                    raise ValidationError("Cannot upload more than 5 images for this emergency.")
+        except Exception:
+            # don't leave the file of a rejected upload behind
+            if uploading and self.image._committed:
+                self.image.storage.delete(self.image.name)
+            raise
@@ -0,0 +1,130 @@
+import io
+import logging
+import posixpath
+import queue
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from PIL import Image, ImageOps, features
+
+from .cache import invalidate_emergency
+from .models import Emergency, EmergencyImage
+
+logger = logging.getLogger(__name__)
+
+
+# rendition name -> longest side in pixels
+RENDITIONS = {
+    'thumbnail': 320,
+    'preview': 1280,
+}
+
+DEFAULTS = {
+    'WORKERS': 2,
+    # process in the calling thread, for tests and management commands
+    'EAGER': False,
+}
+
+
+def get_processing_settings():
+    return {**DEFAULTS, **getattr(settings, 'EMERGENCY_IMAGE_PROCESSING', {})}
+
+
+def render(image, max_side):
+    """
+    Downscale `image` to fit in `max_side` and encode it as WebP, or JPEG
+    where Pillow has no WebP support. No EXIF is written, so GPS tags from
+    the phone never reach a rendition.
+    """
+    image = image.copy()
+    image.thumbnail((max_side, max_side))
+
+    fmt, extension = ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+    output = io.BytesIO()
+    image.save(output, format=fmt, quality=80)
+    return output.getvalue(), extension
+
+
+def process_image(image_id):
+    """
+    Generate the renditions of one EmergencyImage and record them on it,
+    and on its emergency when it is the cover.
+    """
+    image = EmergencyImage.objects.filter(pk=image_id).first()
+    if image is None:
+        return
+
+    stem = posixpath.splitext(posixpath.basename(image.image.name))[0]
+    stored = {}
+    with image.image.open('rb') as source, Image.open(source) as original:
+        # bake the EXIF orientation into the pixels before the tags are dropped
+        upright = ImageOps.exif_transpose(original).convert('RGB')
+        for rendition, max_side in RENDITIONS.items():
+            data, extension = render(upright, max_side)
+            field = image._meta.get_field(rendition)
+            name = field.generate_filename(image, f"{stem}_{rendition}.{extension}")
+            stored[rendition] = field.storage.save(name, ContentFile(data), max_length=field.max_length)
+
+    EmergencyImage.objects.filter(pk=image.pk).update(**stored)
+    Emergency.objects.filter(pk=image.emergency_id, cover_image=image.image.name).update(
+        cover_thumbnail=stored['thumbnail'],
+    )
+    invalidate_emergency(image.emergency_id)
+
+
+class ImageProcessingQueue:
+    """
+    In-process work queue for image renditions, no broker needed. Worker
+    threads start on first use. Anything lost with the process (restarts,
+    crashes) is picked up by `manage.py process_emergency_images`.
+    """
+
+    def __init__(self, workers=2, eager=False):
+        self.workers = workers
+        self.eager = eager
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        conf = get_processing_settings()
+        return cls(workers=conf['WORKERS'], eager=conf['EAGER'])
+
+    def enqueue(self, image_ids):
+        if self.eager:
+            for image_id in image_ids:
+                process_image(image_id)
+            return
+        self._start()
+        for image_id in image_ids:
+            self._queue.put(image_id)
+
+    def join(self):
+        self._queue.join()
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'emergency-images-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            image_id = self._queue.get()
+            try:
+                close_old_connections()
+                process_image(image_id)
+            except Exception:
+                logger.exception("Failed to process emergency image %s", image_id)
+            finally:
+                close_old_connections()
+                self._queue.task_done()
+
+
+image_queue = ImageProcessingQueue.from_settings()
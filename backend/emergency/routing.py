@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .consumers import EmergencyFeedConsumer
+
+websocket_urlpatterns = [
+    path('ws/emergency/', EmergencyFeedConsumer.as_asgi()),
+]
@@ -1,4 +1,5 @@
 from drf_spectacular.utils import extend_schema, inline_serializer
+from drf_spectacular_websocket.decorators import extend_ws_schema
 from rest_framework import serializers
 
 
@@ -13,6 +14,8 @@ emergency_create_schema = extend_schema(
             ),
             "description": serializers.CharField(help_text="Details about the emergency."),
             'location': serializers.CharField(),
+            'latitude': serializers.FloatField(required=False, help_text="Optional, sent together with longitude."),
+            'longitude': serializers.FloatField(required=False, help_text="Optional, sent together with latitude."),
 
             "images": serializers.ListField(
                 child=serializers.FileField(),
@@ -30,6 +33,8 @@ emergency_create_schema = extend_schema(
                 "description": serializers.CharField(),
                 "created_at": serializers.DateTimeField(),
                 'location': serializers.CharField(),
+                'latitude': serializers.FloatField(allow_null=True),
+                'longitude': serializers.FloatField(allow_null=True),
                 "images": serializers.ListField(
                     child=inline_serializer(
                         name="CreatedEmergencyImageItem",
@@ -44,3 +49,43 @@ emergency_create_schema = extend_schema(
         )
     }
 )
+
+
+emergency_transition_schema = extend_schema(
+    description=(
+        "Move an emergency to the next status, open -> acknowledged -> resolved. "
+        "Acknowledging is for admins, resolving for admins and the reporter. "
+        "Responds 400 when the emergency is already past that status."
+    ),
+    request=None,
+)
+
+
+emergency_feed_schema = extend_ws_schema(
+    description=(
+        "Live feed of new emergencies, `ws://emergency/`. Every type is sent until the client subscribes. "
+        "A subscription replaces the previous one: `types` (default all) and optionally an area, "
+        "either `bbox` = [min_lng, min_lat, max_lng, max_lat] or `lat`, `lng` and `radius` in km. "
+        "Each new emergency is pushed in the format of the `/emergency/` list items."
+    ),
+    type='send',
+    summary='subscribing to new emergencies',
+    request=inline_serializer(
+        name='EmergencyFeedSubscription',
+        fields={
+            'types': serializers.ListField(child=serializers.ChoiceField(choices=["D", "O", "M"]), required=False),
+            'bbox': serializers.ListField(child=serializers.FloatField(), min_length=4, max_length=4, required=False),
+            'lat': serializers.FloatField(required=False),
+            'lng': serializers.FloatField(required=False),
+            'radius': serializers.FloatField(required=False),
+        },
+    ),
+    responses={
+        200: inline_serializer(
+            name='EmergencyFeedSubscribed',
+            fields={
+                'subscribed': serializers.DictField(),
+            },
+        ),
+    },
+)
@@ -0,0 +1,62 @@
+from django.db.models import F, Case, CharField, When, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.contrib.auth import get_user_model
+
+from .models import Emergency, EmergencyImage
+from .processing import image_queue
+from .cache import invalidate_emergency
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Emergency)
+@receiver(post_delete, sender=Emergency)
+def invalidate_cached_emergency(sender, instance, **kwargs):
+    invalidate_emergency(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_author(sender, instance, created, update_fields=None, **kwargs):
+    # responses show the author's name, logins only touch last_login
+    if created or update_fields is not None and not {'first_name', 'last_name'} & set(update_fields):
+        return
+    for emergency_id in Emergency.objects.filter(user=instance).values_list('pk', flat=True):
+        invalidate_emergency(emergency_id)
+
+
+@receiver(post_save, sender=EmergencyImage)
+@receiver(post_delete, sender=EmergencyImage)
+def invalidate_cached_image(sender, instance, **kwargs):
+    invalidate_emergency(instance.emergency_id)
+
+
+@receiver(post_save, sender=EmergencyImage)
+def process_new_image(sender, instance, created, **kwargs):
+    # bulk uploads don't send post_save, CreateEmergencySerializer queues those itself
+    if created:
+        transaction.on_commit(lambda: image_queue.enqueue([instance.pk]))
+
+
+@receiver(post_delete, sender=EmergencyImage)
+def release_image_slot(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Emergency):
+        # the emergency itself is being deleted
+        return
+    next_image = EmergencyImage.objects.filter(emergency=OuterRef('pk')).order_by('pk')
+
+    def replace_if_cover(field, next_value):
+        # both SET expressions see the row as it was before the update
+        return Case(
+            When(cover_image=instance.image.name, then=Coalesce(Subquery(next_image.values(next_value)[:1]), Value(''))),
+            default=F(field),
+            output_field=CharField(),
+        )
+
+    Emergency.objects.filter(pk=instance.emergency_id, image_count__gt=0).update(
+        image_count=F('image_count') - 1,
+        cover_image=replace_if_cover('cover_image', 'image'),
+        cover_thumbnail=replace_if_cover('cover_thumbnail', 'thumbnail'),
+    )
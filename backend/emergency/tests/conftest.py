@@ -1,6 +1,10 @@
+import re
 from rest_framework.test import APIClient
 import pytest
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from emergency.cache import get_cache
 
 User = get_user_model()
 
@@ -22,3 +26,69 @@ def authenticate(api_client):
         
     return do_authenticate
 
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    # emergency ids are reused between tests once the database is flushed
+    get_cache().clear()
+    yield
+    get_cache().clear()
+
+
+def explain(sql):
+    """The query plan of `sql` as text, on SQLite or Postgres."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # a test table is small enough for a sequential scan to win,
+            # what matters is whether an index can serve the query at all
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}')
+        else:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+
+def scans_table(plan):
+    return 'SCAN emergency_emergency\n' in f'{plan}\n' or 'Seq Scan on emergency_emergency' in plan
+
+
+def sorts(plan):
+    return 'TEMP B-TREE' in plan if connection.vendor == 'sqlite' else re.search(r'\bSort\b', plan) is not None
+
+
+@pytest.fixture
+def query_plans(api_client):
+    """
+    GET a url and return the plans of the queries it made on the emergency
+    table, as the view made them, filters and ordering included.
+    """
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        pytest.skip(f"no query plan checks for {connection.vendor}")
+
+    def get_plans(url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.get(url, params)
+        assert response.status_code == 200
+        return [
+            explain(query['sql']) for query in queries
+            if query['sql'].startswith('SELECT') and 'FROM "emergency_emergency"' in query['sql']
+        ]
+
+    return get_plans
+
+
+@pytest.fixture
+def assert_index_scan(query_plans):
+    """
+    Assert the emergency queries of a GET all go through an index of the
+    table and sort nothing, and that the page is read along `index`.
+    COUNT queries are free to pick the smallest index that fits.
+    """
+    def check(url, index, params=None):
+        plans = query_plans(url, params)
+        for plan in plans:
+            assert not scans_table(plan) and not sorts(plan), plan
+        assert any(index in plan for plan in plans), plans
+
+    return check
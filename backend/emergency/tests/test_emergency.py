@@ -1,7 +1,21 @@
 # tests/test_jwt_token_obtain.py
+import importlib
+import io
+from math import asin, cos, radians, sin, sqrt
+from random import Random
 import pytest
+from PIL import Image
+from django.apps import apps as django_apps
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from model_bakery import baker
 from rest_framework import status
+from emergency import geo
+from emergency.models import Emergency, EmergencyImage, EmergencyStatus
+from emergency.processing import image_queue
 
 
 @pytest.mark.django_db
@@ -60,4 +74,442 @@ class TestEmergencyCreate:
             'image1.jpg', 'image2.jpg', 'image3.jpg', 'image4.jpg', 'image5.jpg', 'image6.jpg'
         ]})
         assert response.status_code == status.HTTP_400_BAD_REQUEST
-        assert 'images' in response.data
\ No newline at end of file
+        assert 'images' in response.data
+
+@pytest.mark.django_db
+class TestEmergencyListQueries:
+    def test_list_query_count_does_not_grow_with_images(self, api_client, django_assert_num_queries):
+        for emergency in baker.make('emergency.Emergency', _quantity=10):
+            baker.make('emergency.EmergencyImage', emergency=emergency, image=f'emergency/images/{emergency.id}-a.jpg')
+            baker.make('emergency.EmergencyImage', emergency=emergency, image=f'emergency/images/{emergency.id}-b.jpg')
+
+        # one COUNT for the paginator, one SELECT for the page
+        with django_assert_num_queries(2):
+            response = api_client.get('/emergency/')
+
+        assert response.status_code == status.HTTP_200_OK
+        for item in response.data['results']:
+            assert item['image'].endswith(f"/emergency/images/{item['id']}-a.jpg")
+
+    def test_emergency_without_images_has_no_image(self, api_client):
+        baker.make('emergency.Emergency')
+        response = api_client.get('/emergency/')
+        assert response.data['results'][0]['image'] is None
+
+
+@pytest.mark.django_db
+class TestEmergencyResponseCache:
+    def test_repeated_list_is_served_without_queries(self, api_client, django_assert_num_queries):
+        baker.make('emergency.Emergency', _quantity=3)
+        first = api_client.get('/emergency/')
+
+        with django_assert_num_queries(0):
+            second = api_client.get('/emergency/')
+
+        assert second.status_code == status.HTTP_200_OK
+        assert second.content == first.content
+        assert second['ETag'] == first['ETag']
+
+    def test_matching_etag_returns_304(self, api_client, django_assert_num_queries):
+        emergency = baker.make('emergency.Emergency')
+        etag = api_client.get(f'/emergency/{emergency.id}/')['ETag']
+
+        with django_assert_num_queries(0):
+            response = api_client.get(f'/emergency/{emergency.id}/', HTTP_IF_NONE_MATCH=f'W/{etag}')
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response['ETag'] == etag
+
+    def test_filters_and_renditions_are_cached_apart(self, api_client):
+        emergency = baker.make('emergency.Emergency', emergency_type='D')
+        assert api_client.get('/emergency/', {'emergency_type': 'D'}).json()['count'] == 1
+        assert api_client.get('/emergency/', {'emergency_type': 'M'}).json()['count'] == 0
+
+        preview = api_client.get(f'/emergency/{emergency.id}/')['ETag']
+        assert api_client.get(f'/emergency/{emergency.id}/', HTTP_SAVE_DATA='on')['ETag'] != preview
+
+    def test_changes_invalidate_list_and_detail(self, api_client):
+        emergency = baker.make('emergency.Emergency', location='old')
+        other = baker.make('emergency.Emergency')
+        list_etag = api_client.get('/emergency/')['ETag']
+        detail_etag = api_client.get(f'/emergency/{emergency.id}/')['ETag']
+        other_etag = api_client.get(f'/emergency/{other.id}/')['ETag']
+
+        emergency.location = 'new'
+        emergency.save()
+
+        response = api_client.get('/emergency/', HTTP_IF_NONE_MATCH=list_etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert 'new' in [item['location'] for item in response.json()['results']]
+        assert api_client.get(f'/emergency/{emergency.id}/').json()['location'] == 'new'
+        assert api_client.get(f'/emergency/{emergency.id}/')['ETag'] != detail_etag
+        assert api_client.get(f'/emergency/{other.id}/', HTTP_IF_NONE_MATCH=other_etag).status_code == status.HTTP_304_NOT_MODIFIED
+
+        baker.make('emergency.EmergencyImage', emergency=emergency, image='emergency/images/a.jpg')
+        assert api_client.get(f'/emergency/{emergency.id}/').json()['images']
+
+        emergency.user.first_name = 'Renamed'
+        emergency.user.save()
+        assert api_client.get(f'/emergency/{emergency.id}/').json()['user_first_name'] == 'Renamed'
+
+        emergency.delete()
+        assert api_client.get(f'/emergency/{emergency.id}/').status_code == status.HTTP_404_NOT_FOUND
+        assert api_client.get('/emergency/').json()['count'] == 1
+
+
+@pytest.mark.django_db
+class TestEmergencyImageCounters:
+    def test_adding_images_updates_count_and_cover(self):
+        emergency = baker.make('emergency.Emergency')
+        first = baker.make('emergency.EmergencyImage', emergency=emergency, image='emergency/images/a.jpg')
+        baker.make('emergency.EmergencyImage', emergency=emergency, image='emergency/images/b.jpg')
+
+        emergency.refresh_from_db()
+        assert emergency.image_count == 2
+        assert emergency.cover_image.name == first.image.name
+
+    def test_sixth_image_is_rejected(self):
+        emergency = baker.make('emergency.Emergency')
+        for i in range(5):
+            baker.make('emergency.EmergencyImage', emergency=emergency, image=f'emergency/images/{i}.jpg')
+
+        with pytest.raises(ValidationError):
+            baker.make('emergency.EmergencyImage', emergency=emergency, image='emergency/images/6.jpg')
+
+        emergency.refresh_from_db()
+        assert emergency.image_count == 5
+        assert emergency.images.count() == 5
+
+    def test_deleting_cover_moves_it_to_next_image(self):
+        emergency = baker.make('emergency.Emergency')
+        first = baker.make('emergency.EmergencyImage', emergency=emergency, image='emergency/images/a.jpg')
+        second = baker.make('emergency.EmergencyImage', emergency=emergency, image='emergency/images/b.jpg')
+
+        first.delete()
+        emergency.refresh_from_db()
+        assert emergency.image_count == 1
+        assert emergency.cover_image.name == second.image.name
+
+        second.delete()
+        emergency.refresh_from_db()
+        assert emergency.image_count == 0
+        assert not emergency.cover_image
+
+
+def make_image(name='photo.jpg', size=(64, 48)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, format='JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@pytest.mark.django_db
+class TestEmergencyImageUpload:
+    @pytest.fixture(autouse=True)
+    def media_root(self, settings, tmp_path):
+        settings.MEDIA_ROOT = tmp_path
+        return tmp_path
+
+    def test_images_are_stored_with_one_insert(self, api_client, authenticate):
+        authenticate()
+        data = {
+            'emergency_type': 'M', 'description': 'test_description', 'location': 'test_location',
+            'images': [make_image('a.jpg'), make_image('b.jpg'), make_image('c.jpg')],
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.post('/emergency/create/', data, format='multipart')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        image_inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "emergency_emergencyimage"')]
+        assert len(image_inserts) == 1
+
+        emergency = Emergency.objects.get()
+        names = list(emergency.images.order_by('pk').values_list('image', flat=True))
+        assert [name.rsplit('/', 1)[-1] for name in names] == ['a.jpg', 'b.jpg', 'c.jpg']
+        assert emergency.image_count == 3
+        assert emergency.cover_image.name == names[0]
+        assert all(emergency.cover_image.storage.exists(name) for name in names)
+
+    def test_failed_storage_write_leaves_nothing_behind(self, api_client, authenticate, media_root, monkeypatch):
+        authenticate()
+        storage = EmergencyImage._meta.get_field('image').storage
+        save = storage.save
+
+        def flaky_save(name, content, max_length=None):
+            if name.endswith('b.jpg'):
+                raise OSError("disk full")
+            return save(name, content, max_length=max_length)
+
+        monkeypatch.setattr(storage, 'save', flaky_save)
+        data = {
+            'emergency_type': 'M', 'description': 'test_description', 'location': 'test_location',
+            'images': [make_image('a.jpg'), make_image('b.jpg')],
+        }
+        with pytest.raises(OSError):
+            api_client.post('/emergency/create/', data, format='multipart')
+
+        assert not Emergency.objects.exists()
+        assert not [path for path in media_root.rglob('*') if path.is_file()]
+
+
+def make_photo_with_exif(name='photo.jpg'):
+    exif = Image.Exif()
+    exif[0x0112] = 6  # orientation: rotated 90 degrees
+    exif[0x010F] = 'PhoneMaker'
+    exif[0x8825] = {1: 'N', 2: (31.0, 30.0, 6.12), 3: 'E', 4: (34.0, 28.0, 0.48)}  # GPS position
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), 'blue').save(buffer, format='JPEG', exif=exif)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@pytest.mark.django_db
+class TestEmergencyImageRenditions:
+    @pytest.fixture(autouse=True)
+    def media_root(self, settings, tmp_path):
+        settings.MEDIA_ROOT = tmp_path
+        return tmp_path
+
+    def upload(self, api_client, django_capture_on_commit_callbacks, monkeypatch):
+        monkeypatch.setattr(image_queue, 'eager', True)
+        data = {
+            'emergency_type': 'M', 'description': 'test_description', 'location': 'test_location',
+            'images': [make_photo_with_exif()],
+        }
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post('/emergency/create/', data, format='multipart')
+        assert response.status_code == status.HTTP_201_CREATED
+        return Emergency.objects.get()
+
+    def test_renditions_are_downscaled_and_exif_free(self, api_client, authenticate, django_capture_on_commit_callbacks, monkeypatch):
+        authenticate()
+        emergency = self.upload(api_client, django_capture_on_commit_callbacks, monkeypatch)
+        image = emergency.images.get()
+
+        with image.thumbnail.open('rb') as thumbnail, Image.open(thumbnail) as rendered:
+            assert rendered.size == (240, 320)
+            assert not rendered.getexif()
+        with image.preview.open('rb') as preview, Image.open(preview) as rendered:
+            assert rendered.size == (480, 640)
+        assert emergency.cover_thumbnail.name == image.thumbnail.name
+
+    def test_list_serves_thumbnail_and_detail_follows_client_hints(self, api_client, authenticate, django_capture_on_commit_callbacks, monkeypatch):
+        authenticate()
+        emergency = self.upload(api_client, django_capture_on_commit_callbacks, monkeypatch)
+        image = emergency.images.get()
+
+        listed = api_client.get('/emergency/').data['results'][0]
+        assert listed['image'] == f'http://testserver{image.thumbnail.url}'
+
+        detail = api_client.get(f'/emergency/{emergency.id}/')
+        assert detail.data['images'][0]['image'].endswith(image.preview.url)
+        assert 'Save-Data' in detail['Vary']
+
+        detail = api_client.get(f'/emergency/{emergency.id}/', HTTP_SAVE_DATA='on')
+        assert detail.data['images'][0]['image'].endswith(image.thumbnail.url)
+
+        detail = api_client.get(f'/emergency/{emergency.id}/', {'rendition': 'original'})
+        assert detail.data['images'][0]['image'].endswith(image.image.url)
+
+    def test_original_is_stored_without_exif(self, api_client, authenticate, media_root):
+        authenticate()
+        data = {
+            'emergency_type': 'M', 'description': 'test_description', 'location': 'test_location',
+            'images': [make_photo_with_exif()],
+        }
+        # no renditions yet, the original is what gets served
+        response = api_client.post('/emergency/create/', data, format='multipart')
+        assert response.status_code == status.HTTP_201_CREATED
+        emergency = Emergency.objects.get()
+
+        served = api_client.get(f'/emergency/{emergency.id}/', {'rendition': 'original'}).data['images'][0]['image']
+        listed = api_client.get('/emergency/').data['results'][0]['image']
+        assert served == listed == f'http://testserver{emergency.cover_image.url}'
+        content = (media_root / emergency.cover_image.name).read_bytes()
+        assert b'Exif' not in content and b'PhoneMaker' not in content
+        with Image.open(io.BytesIO(content)) as stored:
+            assert not stored.getexif()
+            # upright, as the orientation tag had it
+            assert stored.size == (480, 640)
+
+    def test_originals_stored_before_stripping_can_be_rewritten(self, media_root):
+        photo = make_photo_with_exif()
+        image = baker.make('emergency.EmergencyImage', image=photo)
+        assert b'PhoneMaker' in (media_root / image.image.name).read_bytes()
+
+        call_command('process_emergency_images', strip_originals=True, stdout=io.StringIO())
+
+        image.refresh_from_db()
+        content = (media_root / image.image.name).read_bytes()
+        assert b'Exif' not in content and b'PhoneMaker' not in content
+        assert image.thumbnail
+
+
+@pytest.mark.django_db
+class TestEmergencyGeoSearch:
+    GAZA = (31.5017, 34.4668)
+    KHAN_YOUNIS = (31.3402, 34.3063)
+    RAFAH = (31.2969, 34.2455)
+
+    def make_at(self, point):
+        return baker.make('emergency.Emergency', latitude=point[0], longitude=point[1])
+
+    def test_geohash_is_derived_from_coordinates(self):
+        emergency = baker.make('emergency.Emergency', latitude=57.64911, longitude=10.40744)
+        assert emergency.geohash == 'u4pruydqq'
+        assert baker.make('emergency.Emergency').geohash == ''
+
+    def test_radius_search_returns_nearest_first(self, api_client):
+        gaza, khan_younis, rafah = map(self.make_at, (self.GAZA, self.KHAN_YOUNIS, self.RAFAH))
+        baker.make('emergency.Emergency')
+
+        response = api_client.get('/emergency/', {'lat': 31.50, 'lng': 34.46, 'radius': 25})
+        assert response.status_code == status.HTTP_200_OK
+        assert [item['id'] for item in response.data['results']] == [gaza.id, khan_younis.id]
+        assert response.data['results'][0]['distance'] < 1
+        assert 20 < response.data['results'][1]['distance'] < 25
+
+    def test_bbox_search(self, api_client):
+        gaza, khan_younis, rafah = map(self.make_at, (self.GAZA, self.KHAN_YOUNIS, self.RAFAH))
+        response = api_client.get('/emergency/', {'bbox': '34.2,31.2,34.35,31.35'})
+        assert sorted(item['id'] for item in response.data['results']) == sorted([khan_younis.id, rafah.id])
+
+    def test_radius_search_matches_brute_force(self, api_client):
+        random = Random(7)
+        center = (31.4, 34.4)
+        points = [(center[0] + random.uniform(-0.3, 0.3), center[1] + random.uniform(-0.3, 0.3)) for _ in range(200)]
+        emergencies = [self.make_at(point) for point in points]
+
+        def haversine(a, b):
+            dlat, dlng = radians(b[0] - a[0]), radians(b[1] - a[1])
+            h = sin(dlat / 2) ** 2 + cos(radians(a[0])) * cos(radians(b[0])) * sin(dlng / 2) ** 2
+            return 2 * 6371.0088 * asin(sqrt(h))
+
+        expected = {e.id for e, point in zip(emergencies, points) if haversine(center, point) <= 15}
+        response = api_client.get('/emergency/', {'lat': center[0], 'lng': center[1], 'radius': 15})
+        found = {item['id'] for item in response.data['results']}
+        while response.data['next']:
+            response = api_client.get(response.data['next'])
+            found |= {item['id'] for item in response.data['results']}
+        assert found == expected
+
+    def test_radius_boxes_wrap_at_the_antimeridian(self):
+        assert len(geo.radius_bboxes(31.5, 34.4, 50)) == 1
+        east, west = geo.radius_bboxes(-17.7, 179.9, 50)
+        assert east[1] < 180 and east[3] == 180.0
+        assert west[1] == -180.0 and -180 < west[3] < -179
+        assert geo.radius_bboxes(89.9, 10, 50) == [(89.9 - 50 / geo.KM_PER_DEGREE, -180.0, 90.0, 180.0)]
+
+    def test_radius_search_across_the_antimeridian(self, api_client):
+        # Fiji straddles the line: both points are ~20km from the center
+        suva_side, taveuni_side, far = map(self.make_at, ((-17.7, 179.8), (-17.7, -179.8), (-17.7, -178.0)))
+
+        response = api_client.get('/emergency/', {'lat': -17.7, 'lng': 179.99, 'radius': 30})
+        assert [item['id'] for item in response.data['results']] == [suva_side.id, taveuni_side.id]
+        response = api_client.get('/emergency/', {'lat': -17.7, 'lng': -179.99, 'radius': 30})
+        assert [item['id'] for item in response.data['results']] == [taveuni_side.id, suva_side.id]
+
+    @pytest.mark.parametrize('params', [
+        {'lat': 31.5, 'lng': 34.4},
+        {'lat': 'x', 'lng': 34.4, 'radius': 5},
+        {'lat': 95, 'lng': 34.4, 'radius': 5},
+        {'lat': 31.5, 'lng': 34.4, 'radius': 5000},
+        {'bbox': '34.2,31.2'},
+        {'bbox': '34.4,31.2,34.2,31.35'},
+    ])
+    def test_invalid_geo_params_return_400(self, api_client, params):
+        response = api_client.get('/emergency/', params)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_create_with_coordinates(self, api_client, authenticate):
+        authenticate()
+        response = api_client.post('/emergency/create/', {
+            'emergency_type': 'M', 'description': 'test_description', 'location': 'test_location',
+            'latitude': self.GAZA[0], 'longitude': self.GAZA[1],
+        })
+        assert response.status_code == status.HTTP_201_CREATED
+        assert Emergency.objects.get().geohash.startswith('sv8e')
+
+    def test_create_with_only_latitude_returns_400(self, api_client, authenticate):
+        authenticate()
+        response = api_client.post('/emergency/create/', {
+            'emergency_type': 'M', 'description': 'test_description', 'location': 'test_location',
+            'latitude': self.GAZA[0],
+        })
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestEmergencyLifecycle:
+    def test_emergency_is_acknowledged_then_resolved(self, api_client, authenticate):
+        authenticate(is_staff=True)
+        emergency = baker.make('emergency.Emergency')
+        assert emergency.status == EmergencyStatus.OPEN
+
+        response = api_client.post(f'/emergency/{emergency.id}/acknowledge/')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['status'] == EmergencyStatus.ACKNOWLEDGED
+        assert response.data['acknowledged_at'] is not None
+
+        response = api_client.post(f'/emergency/{emergency.id}/resolve/')
+        assert response.data['status'] == EmergencyStatus.RESOLVED
+        emergency.refresh_from_db()
+        assert emergency.resolved_at >= emergency.acknowledged_at
+
+    def test_resolved_emergency_cannot_move_again(self, api_client, authenticate):
+        authenticate(is_staff=True)
+        emergency = baker.make('emergency.Emergency')
+        assert emergency.transition(EmergencyStatus.RESOLVED)
+
+        for action in ('acknowledge', 'resolve'):
+            response = api_client.post(f'/emergency/{emergency.id}/{action}/')
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_only_admins_acknowledge_and_reporters_resolve_their_own(self, api_client, authenticate):
+        user = authenticate()
+        own = baker.make('emergency.Emergency', user=user)
+        other = baker.make('emergency.Emergency')
+
+        assert api_client.post(f'/emergency/{own.id}/acknowledge/').status_code == status.HTTP_403_FORBIDDEN
+        assert api_client.post(f'/emergency/{other.id}/resolve/').status_code == status.HTTP_403_FORBIDDEN
+        assert api_client.post(f'/emergency/{own.id}/resolve/').status_code == status.HTTP_200_OK
+
+    def test_resolved_emergencies_move_to_their_own_list(self, api_client):
+        active = baker.make('emergency.Emergency')
+        resolved = baker.make('emergency.Emergency', _quantity=3)
+        assert api_client.get('/emergency/').json()['count'] == 4
+
+        for emergency in resolved:
+            emergency.transition(EmergencyStatus.RESOLVED)
+
+        # the transitions are updates, the cached list is still invalidated
+        assert [item['id'] for item in api_client.get('/emergency/').json()['results']] == [active.id]
+        response = api_client.get('/emergency/resolved/')
+        assert 'count' not in response.json()
+        assert [item['id'] for item in response.json()['results']] == [emergency.id for emergency in reversed(resolved)]
+
+    def test_reporters_list_their_own_emergencies(self, api_client, authenticate):
+        user = authenticate()
+        own = baker.make('emergency.Emergency', user=user, _quantity=2)
+        own[0].transition(EmergencyStatus.RESOLVED)
+        baker.make('emergency.Emergency')
+
+        response = api_client.get('/emergency/mine/')
+        assert [item['id'] for item in response.json()['results']] == [own[1].id, own[0].id]
+
+
+@pytest.mark.django_db
+class TestEmergencyCoordinatesBackfill:
+    def test_coordinates_are_read_from_location_pairs(self):
+        backfill = importlib.import_module('emergency.migrations.0011_backfill_coordinates').backfill_coordinates
+        pair = baker.make(Emergency, location=' 31.5017 , 34.4668')
+        text = baker.make(Emergency, location='Al-Shifa hospital, Gaza')
+        out_of_range = baker.make(Emergency, location='95.0, 34.4')
+        located = baker.make(Emergency, location='0, 0', latitude=31.3402, longitude=34.3063)
+
+        backfill(django_apps, None)
+
+        for emergency in (pair, text, out_of_range, located):
+            emergency.refresh_from_db()
+        assert (pair.latitude, pair.longitude, pair.geohash) == (31.5017, 34.4668, geo.encode(31.5017, 34.4668))
+        assert (text.latitude, text.geohash) == (None, '')
+        assert (out_of_range.latitude, out_of_range.geohash) == (None, '')
+        assert (located.latitude, located.longitude) == (31.3402, 34.3063)
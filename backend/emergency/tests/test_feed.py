@@ -0,0 +1,159 @@
+import io
+import json
+import pytest
+from PIL import Image
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.files.uploadedfile import SimpleUploadedFile
+from channels.testing import WebsocketCommunicator
+from emergency.consumers import EmergencyFeedConsumer
+from emergency.feed import FEED_PRECISION, MAX_FEED_CELLS, subscription_groups, type_group
+from emergency.models import Emergency, EmergencyType
+from emergency.processing import image_queue
+
+GAZA = (31.5017, 34.4668)
+RAFAH = (31.2969, 34.2455)
+
+
+async def subscribe(subscription=None):
+    communicator = WebsocketCommunicator(EmergencyFeedConsumer.as_asgi(), '/ws/emergency/')
+    connected, _ = await communicator.connect()
+    assert connected
+    if subscription is not None:
+        await communicator.send_to(text_data=json.dumps(subscription))
+        assert 'subscribed' in json.loads(await communicator.receive_from())
+    return communicator
+
+
+class TestSubscriptionGroups:
+    def test_small_area_joins_cell_groups(self):
+        bbox = (GAZA[0] - 0.05, GAZA[1] - 0.05, GAZA[0] + 0.05, GAZA[1] + 0.05)
+        groups = subscription_groups(['D'], bbox)
+        assert 0 < len(groups) <= MAX_FEED_CELLS
+        assert all(group.startswith('emergency_feed_D_') and len(group) == len('emergency_feed_D_') + FEED_PRECISION for group in groups)
+
+    def test_boxes_on_both_sides_of_the_antimeridian_join_both_cells(self):
+        groups = subscription_groups(['D'], (-17.8, 179.9, -17.6, 180.0), (-17.8, -180.0, -17.6, -179.9))
+        assert {group[len('emergency_feed_D_'):][0] for group in groups} == {'2', 'r'}
+
+    def test_large_area_falls_back_to_type_groups(self):
+        assert subscription_groups(['D', 'M'], (-60, -120, 60, 120)) == [type_group('D'), type_group('M')]
+
+
+@pytest.mark.django_db
+class TestEmergencyFeed:
+    def create(self, api_client, capture, point=None, emergency_type='D'):
+        data = {'emergency_type': emergency_type, 'description': 'a', 'location': 'b'}
+        if point:
+            data.update(latitude=point[0], longitude=point[1])
+        with capture(execute=True):
+            response = api_client.post('/emergency/create/', data)
+        assert response.status_code == 201
+        return response
+
+    def test_new_emergency_reaches_matching_subscribers_only(self, api_client, authenticate, django_capture_on_commit_callbacks):
+        authenticate()
+        create = sync_to_async(self.create)
+
+        async def run():
+            near_gaza = await subscribe({'types': ['D'], 'lat': GAZA[0], 'lng': GAZA[1], 'radius': 5})
+            medical = await subscribe({'types': ['M']})
+            everything = await subscribe()
+
+            await create(api_client, django_capture_on_commit_callbacks, GAZA)
+            await create(api_client, django_capture_on_commit_callbacks, RAFAH)
+
+            received = {
+                'near_gaza': [json.loads(await near_gaza.receive_from())],
+                'everything': [json.loads(await everything.receive_from()) for _ in range(2)],
+            }
+            assert await near_gaza.receive_nothing()
+            assert await medical.receive_nothing()
+            for communicator in (near_gaza, medical, everything):
+                await communicator.disconnect()
+            return received
+
+        received = async_to_sync(run)()
+        assert [item['latitude'] for item in received['near_gaza']] == [GAZA[0]]
+        assert [item['latitude'] for item in received['everything']] == [GAZA[0], RAFAH[0]]
+        assert received['near_gaza'][0]['emergency_type'] == EmergencyType.DANGER_ALERT
+
+    def test_area_subscribers_skip_emergencies_without_coordinates(self, api_client, authenticate, django_capture_on_commit_callbacks):
+        authenticate()
+        create = sync_to_async(self.create)
+
+        async def run():
+            in_box = await subscribe({'bbox': [34.2, 31.2, 34.6, 31.6]})
+            await create(api_client, django_capture_on_commit_callbacks)
+            nothing = await in_box.receive_nothing()
+            await in_box.disconnect()
+            return nothing
+
+        assert async_to_sync(run)()
+
+    def test_radius_subscription_across_the_antimeridian(self, api_client, authenticate, django_capture_on_commit_callbacks):
+        authenticate()
+        create = sync_to_async(self.create)
+
+        async def run():
+            near_the_line = await subscribe({'lat': -17.7, 'lng': 179.99, 'radius': 30})
+            await create(api_client, django_capture_on_commit_callbacks, (-17.7, -179.8))
+            item = json.loads(await near_the_line.receive_from())
+            await near_the_line.disconnect()
+            return item
+
+        assert async_to_sync(run)()['longitude'] == -179.8
+
+    @pytest.mark.parametrize('subscription', [
+        {'types': ['X']},
+        {'bbox': [1, 2, 3]},
+        {'lat': 31.5, 'lng': 34.4},
+        {'lat': 31.5, 'lng': 34.4, 'radius': 10000},
+        [],
+    ])
+    def test_invalid_subscription_returns_error(self, subscription):
+        async def run():
+            communicator = await subscribe()
+            await communicator.send_to(text_data=json.dumps(subscription))
+            response = json.loads(await communicator.receive_from())
+            await communicator.disconnect()
+            return response
+
+        assert 'error' in async_to_sync(run)()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestEmergencyFeedDelivery:
+    def test_failed_push_does_not_fail_the_create(self, api_client, authenticate, monkeypatch, caplog):
+        authenticate()
+
+        def broken_layer():
+            raise OSError("channel broker unreachable")
+
+        monkeypatch.setattr('emergency.feed.get_channel_layer', broken_layer)
+        response = api_client.post('/emergency/create/', {'emergency_type': 'D', 'description': 'a', 'location': 'b'})
+        assert response.status_code == 201
+        assert Emergency.objects.exists()
+        assert 'channel broker unreachable' in caplog.text
+
+    def test_feed_items_carry_the_absolute_image_urls_of_the_list(self, api_client, authenticate, settings, tmp_path, monkeypatch):
+        settings.MEDIA_ROOT = tmp_path
+        # renditions are written before MEDIA_ROOT is restored
+        monkeypatch.setattr(image_queue, 'eager', True)
+        authenticate()
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 48), 'red').save(buffer, format='JPEG')
+        data = {
+            'emergency_type': 'D', 'description': 'a', 'location': 'b',
+            'images': [SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')],
+        }
+
+        async def run():
+            everything = await subscribe()
+            await sync_to_async(api_client.post)('/emergency/create/', data, format='multipart')
+            item = json.loads(await everything.receive_from())
+            await everything.disconnect()
+            return item
+
+        item = async_to_sync(run)()
+        listed = Emergency.objects.get(pk=item['id'])
+        assert item['image'] == f'http://testserver{listed.cover_image.url}'
@@ -0,0 +1,36 @@
+import pytest
+from model_bakery import baker
+from emergency.models import EmergencyStatus
+
+
+@pytest.mark.django_db
+class TestEmergencyListQueryPlans:
+    """
+    The list endpoints read their pages in order from an index, whatever
+    the filters. Runs on SQLite, and on Postgres when the tests are
+    configured with it.
+    """
+
+    @pytest.fixture(autouse=True)
+    def emergencies(self):
+        for emergency in baker.make('emergency.Emergency', emergency_type='D', _quantity=3):
+            emergency.transition(EmergencyStatus.RESOLVED)
+        baker.make('emergency.Emergency', emergency_type='M', _quantity=3)
+
+    def test_active_list(self, assert_index_scan):
+        assert_index_scan('/emergency/', 'emergency_active_idx')
+
+    def test_active_list_by_type(self, assert_index_scan):
+        assert_index_scan('/emergency/', 'emergency_active_type_idx', {'emergency_type': 'M'})
+
+    def test_resolved_list(self, assert_index_scan):
+        assert_index_scan('/emergency/resolved/', 'emergency_resolved_idx')
+
+    def test_resolved_list_by_type(self, assert_index_scan):
+        assert_index_scan('/emergency/resolved/', 'emergency_resolved_type_idx', {'emergency_type': 'D'})
+
+    def test_reported_list(self, api_client, assert_index_scan):
+        user = baker.make('users.User')
+        baker.make('emergency.Emergency', user=user, _quantity=2)
+        api_client.force_authenticate(user=user)
+        assert_index_scan('/emergency/mine/', 'emergency_user_idx')
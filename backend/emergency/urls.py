@@ -2,11 +2,19 @@ from django.urls import path
 from .apis.views import (
     EmergencyListView,
     EmergencyDetailView,
-    EmergencyCreateView
+    EmergencyCreateView,
+    EmergencyTransitionView,
+    ReportedEmergencyListView,
+    ResolvedEmergencyListView,
 )
+from .models import EmergencyStatus
 
 urlpatterns = [
     path('', EmergencyListView.as_view(), name='emergency-list'),
     path('<int:pk>/', EmergencyDetailView.as_view(), name='emergency-detail'),
     path('create/', EmergencyCreateView.as_view(), name='emergency-create'),
+    path('mine/', ReportedEmergencyListView.as_view(), name='emergency-mine-list'),
+    path('resolved/', ResolvedEmergencyListView.as_view(), name='emergency-resolved-list'),
+    path('<int:pk>/acknowledge/', EmergencyTransitionView.as_view(status=EmergencyStatus.ACKNOWLEDGED), name='emergency-acknowledge'),
+    path('<int:pk>/resolve/', EmergencyTransitionView.as_view(status=EmergencyStatus.RESOLVED), name='emergency-resolve'),
 ]
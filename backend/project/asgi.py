@@ -2,7 +2,8 @@ import os
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
 from django.core.asgi import get_asgi_application
-from chat.routing import websocket_urlpatterns  
+from chat.routing import websocket_urlpatterns as chat_websocket_urlpatterns
+from emergency.routing import websocket_urlpatterns as emergency_websocket_urlpatterns
 from .middleware import JwtAuthMiddlewareStack as AuthMiddlewareStack 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings.debug')
@@ -11,7 +12,7 @@ application = ProtocolTypeRouter(
     {
         "http": get_asgi_application(),
         "websocket": AllowedHostsOriginValidator(
-            AuthMiddlewareStack(URLRouter(websocket_urlpatterns)),
+            AuthMiddlewareStack(URLRouter(chat_websocket_urlpatterns + emergency_websocket_urlpatterns)),
         ),
     }
 )
\ No newline at end of file
@@ -0,0 +1,234 @@
+"""
+Cache backends for running several workers.
+
+`SQLiteCache` keeps the cache in one SQLite file that every worker process
+on the host shares, for deployments without Redis. `TieredCache` puts a
+small in-process cache in front of the shared one (`SQLiteCache` or
+Django's `RedisCache`), but only for keys whose value never changes once
+written, so no worker can read a stale counter or reset code from it.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+MISSING = object()
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache stored in a SQLite file, `LOCATION` is its path. Every operation
+    is a single statement or an immediate transaction, so `add` and `incr`
+    are atomic across processes.
+    """
+
+    # count the rows, and cull if needed, once every this many writes
+    cull_every = 100
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def _db(self):
+        # one connection per thread, and a new one after a fork
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _live(self, key):
+        return self._db.execute(
+            'SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone()
+
+    def get(self, key, default=None, version=None):
+        row = self._live(self.make_and_validate_key(key, version=version))
+        return default if row is None else pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not keys:
+            return {}
+        rows = self._db.execute(
+            f"SELECT key, value FROM cache WHERE key IN ({','.join('?' * len(keys))}) "
+            "AND (expires IS NULL OR expires > ?)",
+            (*keys, time.time()),
+        )
+        return {keys[key]: pickle.loads(value) for key, value in rows}
+
+    def has_key(self, key, version=None):
+        return self._live(self.make_and_validate_key(key, version=version)) is not None
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._db.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self.get_backend_timeout(timeout)),
+        )
+        self._wrote()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        # only replaces a row that has expired
+        cursor = self._db.execute(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires '
+            'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self.get_backend_timeout(timeout), time.time()),
+        )
+        self._wrote()
+        return cursor.rowcount == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._db.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        db = self._db
+        # take the write lock first, so no other process can read in between
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = self._live(key)
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            db.execute('UPDATE cache SET value = ? WHERE key = ?', (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key))
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._db.execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount == 1
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def _wrote(self):
+        self._writes += 1
+        if self._writes % self.cull_every == 0:
+            self._cull()
+
+    def _cull(self):
+        db = self._db
+        db.execute('DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+        (count,) = db.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count > self._max_entries:
+            # drop the entries closest to expiring, then the ones that never expire
+            db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,),
+            )
+
+    def close(self, **kwargs):
+        # connections are kept for the life of the thread
+        pass
+
+
+class TieredCache(BaseCache):
+    """
+    Reads and writes go to the shared cache named by the `SHARED` option.
+    Keys starting with one of `LOCAL_KEY_PREFIXES` are also kept in a
+    process-local LRU (`LOCAL_MAX_ENTRIES`, `LOCAL_TIMEOUT`). These must be
+    keys whose value is never replaced, like the versioned emergency
+    responses, since a change made by another worker is not seen locally.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options['SHARED']
+        self.local_prefixes = tuple(options.get('LOCAL_KEY_PREFIXES', ()))
+        self.local = LocMemCache(f'tiered-{location or self.shared_alias}', {
+            'TIMEOUT': options.get('LOCAL_TIMEOUT', 60),
+            'OPTIONS': {'MAX_ENTRIES': options.get('LOCAL_MAX_ENTRIES', 1000)},
+        })
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def is_local(self, key):
+        return key.startswith(self.local_prefixes)
+
+    def get(self, key, default=None, version=None):
+        if not self.is_local(key):
+            return self.shared.get(key, default, version=version)
+        value = self.local.get(key, MISSING, version=version)
+        if value is MISSING:
+            value = self.shared.get(key, MISSING, version=version)
+            if value is MISSING:
+                return default
+            self.local.set(key, value, version=version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        remote = []
+        for key in keys:
+            if self.is_local(key):
+                value = self.local.get(key, MISSING, version=version)
+                if value is not MISSING:
+                    found[key] = value
+                    continue
+            remote.append(key)
+        fetched = self.shared.get_many(remote, version=version) if remote else {}
+        for key, value in fetched.items():
+            if self.is_local(key):
+                self.local.set(key, value, version=version)
+        return {**found, **fetched}
+
+    def has_key(self, key, version=None):
+        if self.is_local(key) and self.local.has_key(key, version=version):
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        if self.is_local(key):
+            self.local.set(key, value, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added and self.is_local(key):
+            self.local.set(key, value, version=version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self.local.delete(key, version=version)
+        return self.shared.incr(key, delta, version=version)
+
+    def delete(self, key, version=None):
+        self.local.delete(key, version=version)
+        return self.shared.delete(key, version=version)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
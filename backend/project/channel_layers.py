@@ -0,0 +1,218 @@
+"""
+Channel layer for running several workers on one host without Redis.
+
+One broker process (`python manage.py run_channel_broker`) keeps the
+channels and groups in an `InMemoryChannelLayer` and every worker talks to
+it over a Unix socket with length-prefixed msgpack frames, so events are
+subject to the same serialization rules as with `channels_redis`.
+"""
+import asyncio
+import itertools
+import os
+import random
+import string
+import struct
+
+import msgpack
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer, InMemoryChannelLayer
+
+HEADER = struct.Struct('!I')
+
+
+async def read_frame(reader):
+    header = await reader.readexactly(HEADER.size)
+    (size,) = HEADER.unpack(header)
+    return msgpack.unpackb(await reader.readexactly(size), raw=False)
+
+
+def write_frame(writer, payload):
+    data = msgpack.packb(payload, use_bin_type=True)
+    writer.write(HEADER.pack(len(data)) + data)
+
+
+class ChannelBroker:
+    """
+    Serves a single `InMemoryChannelLayer` to every worker connected to
+    the socket. Each request runs in its own task so a pending `receive`
+    never blocks the other requests of the same worker.
+    """
+
+    OPERATIONS = {'send', 'receive', 'group_add', 'group_discard', 'group_send', 'flush'}
+
+    def __init__(self, path, **layer_config):
+        self.path = path
+        self.layer = InMemoryChannelLayer(**layer_config)
+
+    async def serve(self, ready=None):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self.handle, path=self.path)
+        if ready is not None:
+            ready()
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader, writer):
+        pending = {}
+        try:
+            while True:
+                op, request_id, args = await read_frame(reader)
+                if op == 'cancel':
+                    task = pending.pop(args[0], None)
+                    if task is not None:
+                        task.cancel()
+                    continue
+                task = asyncio.create_task(self.dispatch(writer, op, request_id, args))
+                pending[request_id] = task
+                task.add_done_callback(lambda _, request_id=request_id: pending.pop(request_id, None))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for task in pending.values():
+                task.cancel()
+            writer.close()
+
+    async def dispatch(self, writer, op, request_id, args):
+        if op not in self.OPERATIONS:
+            write_frame(writer, [request_id, 'error', f"unknown operation {op!r}"])
+            return
+        try:
+            result = await getattr(self.layer, op)(*args)
+        except ChannelFull:
+            write_frame(writer, [request_id, 'full', None])
+        except Exception as exc:
+            write_frame(writer, [request_id, 'error', str(exc)])
+        else:
+            write_frame(writer, [request_id, 'ok', result])
+
+
+class BrokerConnection:
+    """
+    A worker's connection to the broker, requests are multiplexed over it
+    and matched to their responses by id.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.closed = False
+        self._ids = itertools.count()
+        self._waiting = {}
+        self._listener = None
+        self._ready = asyncio.ensure_future(self._open())
+
+    async def _open(self):
+        try:
+            self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+        except OSError:
+            self.closed = True
+            raise
+        self._listener = asyncio.ensure_future(self._listen())
+
+    async def _listen(self):
+        try:
+            while True:
+                request_id, status, result = await read_frame(self.reader)
+                future = self._waiting.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if status == 'ok':
+                    future.set_result(result)
+                elif status == 'full':
+                    future.set_exception(ChannelFull())
+                else:
+                    future.set_exception(RuntimeError(result))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.closed = True
+            for future in self._waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("channel broker went away"))
+            self._waiting.clear()
+
+    async def request(self, op, *args):
+        await self._ready
+        if self.closed:
+            raise ConnectionError("channel broker went away")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[request_id] = future
+        write_frame(self.writer, [op, request_id, list(args)])
+        try:
+            await self.writer.drain()
+            return await future
+        except asyncio.CancelledError:
+            # tell the broker, or a cancelled receive would eat the next message
+            if self._waiting.pop(request_id, None) is not None and not self.closed:
+                write_frame(self.writer, ['cancel', None, [request_id]])
+            raise
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+        if not self._ready.done():
+            self._ready.cancel()
+        elif self._ready.exception() is None:
+            self.writer.close()
+        self.closed = True
+
+
+class SocketChannelLayer(BaseChannelLayer):
+    """
+    Client side of `ChannelBroker`. Keeps one broker connection per event
+    loop, the same way `channels_redis` keeps its connection pools.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path, expiry=60, capacity=100, channel_capacity=None, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.path = path
+        self._connections = {}
+
+    def _connection(self):
+        loop = asyncio.get_running_loop()
+        connection = self._connections.get(loop)
+        if connection is None or connection.closed:
+            for old_loop in [old_loop for old_loop in self._connections if old_loop.is_closed()]:
+                del self._connections[old_loop]
+            connection = self._connections[loop] = BrokerConnection(self.path)
+        return connection
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        await self._connection().request('send', channel, message)
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        return await self._connection().request('receive', channel)
+
+    async def new_channel(self, prefix='specific.'):
+        suffix = ''.join(random.choice(string.ascii_letters) for _ in range(12))
+        return f"{prefix}socket!{suffix}"
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        await self._connection().request('group_add', group, channel)
+
+    async def group_discard(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        await self._connection().request('group_discard', group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        assert self.valid_group_name(group), "Group name not valid"
+        await self._connection().request('group_send', group, message)
+
+    async def flush(self):
+        await self._connection().request('flush')
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        connection = self._connections.pop(loop, None)
+        if connection is not None:
+            await connection.close()
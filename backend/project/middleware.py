@@ -1,44 +1,101 @@
-
 from channels.db import database_sync_to_async
-from django.contrib.auth import get_user_model
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import UntypedToken
 from channels.middleware import BaseMiddleware
 from channels.auth import AuthMiddlewareStack
 from django.db import close_old_connections
 from urllib.parse import parse_qs
-from jwt import decode as jwt_decode
-from django.conf import settings
+from users.authentication import get_cached_user
+from users.tokens import get_stateless_auth_settings, has_profile_claims, revocation_list
 
 
 @database_sync_to_async
 def get_user(validated_token):
-    try:
-        return get_user_model().objects.get(id=validated_token["user_id"])
-    except Exception:
+    user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+    user = get_cached_user(user_id) if user_id is not None else None
+    if user is None or not user.is_active:
         return AnonymousUser()
+    return user
+
+
+async def get_principal(validated_token):
+    """
+    A `TokenUser` straight from the claims when the token has the profile
+    claims and they are still valid, else the user from `get_user`.
+    """
+    if get_stateless_auth_settings()['ENABLED'] and has_profile_claims(validated_token):
+        if revocation_list.needs_sync():
+            await database_sync_to_async(revocation_list.sync)()
+        if not revocation_list.is_revoked(validated_token):
+            return api_settings.TOKEN_USER_CLASS(validated_token)
+    return await get_user(validated_token)
+
 
+def compact_websockets():
+    return getattr(settings, 'COMPACT_WEBSOCKETS', False)
+
+
+class WebsocketPrincipal:
+    """
+    The few user fields the websocket consumers read, kept for the life of
+    a connection instead of a whole `User` or `TokenUser` when
+    `COMPACT_WEBSOCKETS` is on.
+    """
+    __slots__ = ('id', 'first_name', 'is_superuser')
+
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+
+    def __init__(self, user):
+        self.id = user.id
+        self.first_name = user.first_name
+        self.is_superuser = user.is_superuser
+
+    @property
+    def pk(self):
+        return self.id
 
 
 class JwtAuthMiddleware(BaseMiddleware):
+    """
+    Sets `scope['user']` from the `?token=` access token. Without a valid
+    token the user is anonymous and the consumer decides what to do.
+    """
     def __init__(self, inner):
         self.inner = inner
 
     async def __call__(self, scope, receive, send):
         close_old_connections()
-        
-        token = parse_qs(scope["query_string"].decode("utf8"))["token"][0]
+        # set on the scope we were given rather than a copy, which would be
+        # one more dict kept per connection
+        scope["user"] = await self.authenticate(scope)
+        return await self.inner(scope, receive, send)
 
+    async def authenticate(self, scope):
+        # kept apart from __call__, whose frame lives as long as the
+        # connection, so the token and its payload can be freed
+        token = parse_qs(scope["query_string"].decode("utf8")).get("token", [None])[0]
+        if not token:
+            return AnonymousUser()
         try:
-            UntypedToken(token)
-        except Exception as e:
-            return None
-        else:
-            decoded_data = jwt_decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-            scope["user"] = await get_user(validated_token=decoded_data)
-        return await super().__call__(scope, receive, send)
+            # validates and decodes the token, once
+            validated_token = UntypedToken(token)
+        except TokenError:
+            return AnonymousUser()
+
+        user = await get_principal(validated_token)
+        if compact_websockets() and user.is_authenticated:
+            return WebsocketPrincipal(user)
+        return user
 
 
 def JwtAuthMiddlewareStack(inner):
-    return JwtAuthMiddleware(AuthMiddlewareStack(inner))
\ No newline at end of file
+    if compact_websockets():
+        # the session middleware would only put a session user under the
+        # JWT one, which always wins, and costs memory per connection
+        return JwtAuthMiddleware(inner)
+    return JwtAuthMiddleware(AuthMiddlewareStack(inner))
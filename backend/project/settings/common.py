@@ -122,6 +122,18 @@ STATICFILES_STORAGE="whitenoise.storage.CompressedManifestStaticFilesStorage"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# thumbnails/previews of emergency photos, see emergency/processing.py
+EMERGENCY_IMAGE_PROCESSING = {
+    'WORKERS': 2,
+    'EAGER': False,
+}
+
+# cached emergency list/detail responses, see emergency/cache.py
+EMERGENCY_RESPONSE_CACHE = {
+    'CACHE': 'default',
+    'TIMEOUT': 3600,
+}
+
 
 INTERNAL_IPS = [
     # ...
@@ -138,7 +150,7 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'COERCE_DECIMAL_TO_STRING': False,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 50
@@ -156,8 +168,25 @@ AUTHENTICATION_BACKENDS = [
 ]
 
 
+# opt in to websocket auth from the token claims alone, see users/tokens.py
+STATELESS_WEBSOCKET_AUTH = {
+    'ENABLED': os.environ.get('STATELESS_WEBSOCKET_AUTH') == '1',
+    'SYNC_INTERVAL': 5,
+}
+
+# opt-in: keep only what websocket consumers need per open connection, see
+# project/middleware.py. Drops session auth from every websocket route (only
+# ?token= JWTs authenticate) and empties chat consumers' scope after connect.
+COMPACT_WEBSOCKETS = os.environ.get('COMPACT_WEBSOCKETS', '0') == '1'
+
+# users behind JWTs are cached this long, see users/authentication.py
+USER_AUTH_CACHE = {
+    'TIMEOUT': 60,
+}
+
 SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_OBTAIN_SERIALIZER': 'users.tokens.ProfileTokenObtainPairSerializer',
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
         "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
 }
@@ -208,6 +237,15 @@ EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD")
+# emails are queued and sent in the background, see users/outbox.py
+EMAIL_OUTBOX = {
+    'BATCH_SIZE': 50,
+    'MAX_ATTEMPTS': 5,
+    'BACKOFF': 30,
+    'MAX_BACKOFF': 3600,
+    'EAGER': False,
+    'RETENTION_DAYS': 7,
+}
 # Social
 
 def custom_save_data(*args, **kwargs) : 
@@ -235,18 +273,85 @@ SOCIAL_AUTH = {
 
 
 #cache
-CACHES = {
-    'default': {
+# "locmem" only works with a single worker process (reset codes and cached
+# responses would be per worker), run more than one with "redis" or with
+# "sqlite", a cache file shared by the workers of one host
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
-    }
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/0'),
+    },
+    'sqlite': {
+        'BACKEND': 'project.cache.SQLiteCache',
+        'LOCATION': os.environ.get('CACHE_SQLITE_PATH', os.path.join(BASE_DIR, 'cache.sqlite3')),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
 }
+if CACHE_BACKEND == 'locmem':
+    CACHES = {'default': CACHE_BACKENDS['locmem']}
+else:
+    CACHES = {
+        # the shared cache, with the immutable cached responses also kept in process
+        'default': {
+            'BACKEND': 'project.cache.TieredCache',
+            'OPTIONS': {
+                'SHARED': 'shared',
+                'LOCAL_KEY_PREFIXES': ['emergency:response:'],
+                'LOCAL_MAX_ENTRIES': 500,
+                'LOCAL_TIMEOUT': 60,
+            },
+        },
+        'shared': CACHE_BACKENDS[CACHE_BACKEND],
+    }
 
 
 # WSGI_APPLICATION = 'project.wsgi.application'
 ASGI_APPLICATION = 'project.asgi.application'
-CHANNEL_LAYERS = {
-    'default': {
+# "memory" only works with a single worker process, run more than one with
+# "redis" or with "socket" and `python manage.py run_channel_broker`
+CHANNEL_LAYER = os.environ.get('CHANNEL_LAYER', 'memory')
+CHANNEL_BROKER_SOCKET = os.environ.get('CHANNEL_BROKER_SOCKET', '/tmp/emergency-channels.sock')
+CHANNEL_LAYER_BACKENDS = {
+    'memory': {
         'BACKEND': 'channels.layers.InMemoryChannelLayer',
     },
+    'redis': {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {
+            'hosts': [os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/0')],
+        },
+    },
+    'socket': {
+        'BACKEND': 'project.channel_layers.SocketChannelLayer',
+        'CONFIG': {
+            'path': CHANNEL_BROKER_SOCKET,
+        },
+    },
 }
+CHANNEL_LAYERS = {
+    'default': CHANNEL_LAYER_BACKENDS[CHANNEL_LAYER],
+}
+
+# chat messages are written behind the websocket, see chat/buffer.py.
+# Frames only carry the message id with STRICT, which waits for the commit.
+CHAT_MESSAGE_BUFFER = {
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 0.05,
+    'ORDERED': True,
+    'STRICT': False,
+}
+# chat messages past this age move to the archive table, see chat/retention.py
+CHAT_MESSAGE_RETENTION = {
+    'DAYS': 90,
+    'BATCH_SIZE': 1000,
+    'PAUSE': 0.1,
+    'INTERVAL': 3600,
+}
+# use the async ORM for chat reads and writes, see chat/rooms.py
+CHAT_ASYNC_ORM = os.environ.get('CHAT_ASYNC_ORM') == '1'
+
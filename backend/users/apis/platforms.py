@@ -7,7 +7,7 @@ from django.contrib.auth import get_user_model
 from django.conf import settings
 from rest_framework.exceptions import ValidationError
 import requests
-from rest_framework_simplejwt.tokens import RefreshToken
+from ..tokens import tokens_for_user
 
 User = get_user_model()
 
@@ -24,7 +24,7 @@ class BaseSocialPlatform(ABC) :
 
 
 def generate_tokens_for_user(user) -> dict:
-    tokens = RefreshToken.for_user(user)
+    tokens = tokens_for_user(user)
 
     return {
         'refresh_token':str(tokens),
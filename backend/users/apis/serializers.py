@@ -1,9 +1,9 @@
 from rest_framework import serializers
-from rest_framework_simplejwt.tokens import RefreshToken
+from ..tokens import tokens_for_user
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from django.core.cache import cache
-from django.core.mail import send_mail
+from ..outbox import queue_mail
 import random
 from .platforms import GoogleAuth, generate_tokens_for_user
 
@@ -40,7 +40,7 @@ class UserSerializer(serializers.ModelSerializer):
         
     
     def to_representation(self, instance):
-        refresh = RefreshToken.for_user(instance)
+        refresh = tokens_for_user(instance)
         access = refresh.access_token
         user_representation = super().to_representation(instance)
         return {
@@ -132,7 +132,7 @@ class PasswordResetRequestSerializer(basePasswordResetSerializer):
             code = f"{random.randint(100000, 999999)}"
             cache.set(email, code, timeout=3600)
             
-        send_mail(
+        queue_mail(
             subject="Password Reset Code",
             message=f"You can reset your password throught this link:\n {redirect_url}?code={code}&email={email} \nIf you did not make this request then please ignore this email.",
             from_email=None,  # Uses DEFAULT_FROM_EMAIL in settings.py
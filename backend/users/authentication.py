@@ -0,0 +1,87 @@
+"""
+JWT authentication without a user query per request.
+
+The user a token belongs to is kept in the cache for a short while under
+its id, and dropped whenever the user is saved or deleted (see
+users/signals.py), which covers password changes and deactivation.
+
+Only `CACHED_FIELDS` go to the cache, never the password hash: a user
+read from the cache loads its other fields from the database on first
+access, and `save()` leaves them alone. Revoked tokens are told apart by
+the digest of the hash the token carries anyway.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+User = get_user_model()
+
+DEFAULTS = {
+    # seconds a user stays cached, a bound on staleness should an
+    # invalidation ever be missed (e.g. a queryset.update())
+    'TIMEOUT': 60,
+}
+
+
+def get_user_cache_settings():
+    return {**DEFAULTS, **getattr(settings, 'USER_AUTH_CACHE', {})}
+
+
+# enough to authenticate and authorize a request and to answer /users/me/
+CACHED_FIELDS = ('id', 'email', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser')
+
+
+def user_cache_key(user_id):
+    return f'users:auth-fields:{user_id}'
+
+
+def get_cached_user(user_id):
+    """The user with this id, from the cache when possible, else None."""
+    key = user_cache_key(user_id)
+    values = cache.get(key)
+    if values is None:
+        user = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+        if user is None:
+            return None
+        values = {field: getattr(user, field) for field in CACHED_FIELDS}
+        values['password_md5'] = get_md5_hash_password(user.password)
+        cache.set(key, values, get_user_cache_settings()['TIMEOUT'])
+    else:
+        # the fields left out are deferred, as with .only(); from_db()
+        # wants the values in the order of the model's fields
+        fields = [field.attname for field in User._meta.concrete_fields if field.attname in CACHED_FIELDS]
+        user = User.from_db(User.objects.db, fields, [values[field] for field in fields])
+    user._password_md5 = values['password_md5']
+    return user
+
+
+def invalidate_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """`JWTAuthentication` reading the user through `get_cached_user`."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != user._password_md5:
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from users.models import OutboxEmail
+from users.outbox import prune_finished, send_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Send the queued emails that are due, e.g. the ones left behind when every worker restarted, "
+        "and delete the finished ones past their retention."
+    )
+
+    def handle(self, *args, **options):
+        sent = send_pending()
+        pruned = prune_finished()
+        pending = OutboxEmail.objects.filter(status=OutboxEmail.Status.PENDING).count()
+        self.stdout.write(f"Sent {sent} emails, {pending} waiting for a retry, deleted {pruned} finished ones")
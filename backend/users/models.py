@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 from .managers import UserManager
 # Create your models here.
 class User(AbstractUser):
@@ -12,4 +13,45 @@ class User(AbstractUser):
     
     @property
     def is_admin(self):
-        return self.is_staff or self.is_superuser
\ No newline at end of file
+        return self.is_staff or self.is_superuser
+
+class OutboxEmail(models.Model):
+    """
+    An email waiting to be sent by `users.outbox`, so requests never wait
+    on the SMTP server.
+    """
+    class Status(models.TextChoices):
+        PENDING = "P", "Pending"
+        SENT = "S", "Sent"
+        FAILED = "F", "Failed"
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=1, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # a sender owns the row until then, so two workers never send it twice
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='users_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)}"
+
+
+class TokenRevocation(models.Model):
+    """
+    The profile claims in tokens issued for this user before `revoked_at`
+    are outdated, see users/tokens.py. Not a foreign key, the row has to
+    outlive a deleted user.
+    """
+    user_id = models.BigIntegerField()
+    revoked_at = models.DateTimeField(db_index=True)
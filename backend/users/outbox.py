@@ -0,0 +1,194 @@
+"""
+Outgoing email, sent off the request.
+
+`queue_mail` stores the email as an `OutboxEmail` and returns. A sender
+thread in each worker picks up due emails in batches and sends a batch
+over one SMTP connection, kept open while more mail keeps coming. Failed
+sends are retried with exponential backoff. `manage.py send_outbox_emails`
+sends whatever is due, e.g. after every worker was restarted.
+
+Bodies hold password reset codes, so a row's body is blanked as soon as
+it is sent or given up on, and finished rows are deleted after
+`RETENTION_DAYS` by the sender thread and by the management command.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BATCH_SIZE': 50,
+    'MAX_ATTEMPTS': 5,
+    # seconds before the first retry, doubled for every further one
+    'BACKOFF': 30,
+    'MAX_BACKOFF': 3600,
+    # seconds a sender owns the batch it claimed
+    'LEASE': 300,
+    # close the SMTP connection after this many seconds without new mail
+    'IDLE_TIMEOUT': 30,
+    # look for retries that became due this often
+    'POLL_INTERVAL': 60,
+    # send on commit in the calling thread, for tests and management commands
+    'EAGER': False,
+    # sent and failed rows are deleted this many days after they were queued
+    'RETENTION_DAYS': 7,
+    # seconds between two prunes by the sender thread
+    'PRUNE_INTERVAL': 3600,
+}
+
+
+def get_outbox_settings():
+    return {**DEFAULTS, **getattr(settings, 'EMAIL_OUTBOX', {})}
+
+
+def queue_mail(subject, message, recipient_list, from_email=None):
+    """Same arguments as `send_mail`, but only stores the email."""
+    email = OutboxEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or '',
+        to=list(recipient_list),
+    )
+    transaction.on_commit(outbox_sender.wake)
+    return email
+
+
+def claim_batch(size, lease):
+    now = timezone.now()
+    available = Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+    due = OutboxEmail.objects.filter(available, status=OutboxEmail.Status.PENDING, next_attempt_at__lte=now)
+    ids = list(due.order_by('next_attempt_at').values_list('pk', flat=True)[:size])
+    if not ids:
+        return []
+    # rows another sender claimed, sent or rescheduled in the meantime no
+    # longer match
+    locked_until = now + timedelta(seconds=lease)
+    due.filter(pk__in=ids).update(locked_until=locked_until)
+    return list(OutboxEmail.objects.filter(pk__in=ids, locked_until=locked_until))
+
+
+def send_pending(connection=None):
+    """
+    Send every due email in batches and return how many were sent. The
+    connection is closed at the end unless it was passed in.
+    """
+    conf = get_outbox_settings()
+    own_connection = connection is None
+    if own_connection:
+        connection = get_connection()
+    sent = 0
+    try:
+        while batch := claim_batch(conf['BATCH_SIZE'], conf['LEASE']):
+            sent += send_batch(batch, connection, conf)
+    finally:
+        if own_connection:
+            connection.close()
+    return sent
+
+
+def send_batch(emails, connection, conf):
+    sent_ids = []
+    for email in emails:
+        try:
+            # the SMTP backend sets `connection` once it is open
+            if getattr(connection, 'connection', None) is None:
+                connection.open()
+            EmailMessage(
+                email.subject, email.body, email.from_email or None, email.to, connection=connection,
+            ).send()
+        except Exception as exc:
+            logger.warning("Failed to send outbox email %s: %s", email.pk, exc)
+            record_failure(email, exc, conf)
+            # start over with a fresh connection for the rest
+            connection.close()
+        else:
+            sent_ids.append(email.pk)
+
+    OutboxEmail.objects.filter(pk__in=sent_ids).update(
+        status=OutboxEmail.Status.SENT, sent_at=timezone.now(), locked_until=None, body='',
+    )
+    return len(sent_ids)
+
+
+def record_failure(email, exc, conf):
+    attempts = email.attempts + 1
+    backoff = min(conf['BACKOFF'] * 2 ** (attempts - 1), conf['MAX_BACKOFF'])
+    update = {}
+    if attempts >= conf['MAX_ATTEMPTS']:
+        # given up on, nobody needs the body any more
+        update = {'status': OutboxEmail.Status.FAILED, 'body': ''}
+    OutboxEmail.objects.filter(pk=email.pk).update(
+        attempts=attempts,
+        next_attempt_at=timezone.now() + timedelta(seconds=backoff),
+        locked_until=None,
+        last_error=str(exc),
+        **update,
+    )
+
+
+def prune_finished(days=None):
+    """Delete the sent and failed emails queued more than `days` ago, return how many."""
+    days = get_outbox_settings()['RETENTION_DAYS'] if days is None else days
+    finished = OutboxEmail.objects.exclude(status=OutboxEmail.Status.PENDING)
+    deleted, _ = finished.filter(created_at__lt=timezone.now() - timedelta(days=days)).delete()
+    return deleted
+
+
+class OutboxSender:
+    """
+    The sender thread of this process, started by the first `wake()`.
+    It holds on to one SMTP connection between batches and lets it go
+    once no mail came for `IDLE_TIMEOUT` seconds.
+    """
+
+    def __init__(self):
+        self.thread = None
+        self._next_prune = 0
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+
+    def wake(self):
+        if get_outbox_settings()['EAGER']:
+            send_pending()
+            return
+        self._start()
+        self._wakeup.set()
+
+    def _start(self):
+        with self._lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='email-outbox', daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        connection = get_connection()
+        while True:
+            conf = get_outbox_settings()
+            self._wakeup.clear()
+            try:
+                close_old_connections()
+                send_pending(connection)
+                if time.monotonic() >= self._next_prune:
+                    prune_finished()
+                    self._next_prune = time.monotonic() + conf['PRUNE_INTERVAL']
+            except Exception:
+                logger.exception("Failed to send outbox emails")
+            finally:
+                close_old_connections()
+
+            if not self._wakeup.wait(conf['IDLE_TIMEOUT']):
+                connection.close()
+                self._wakeup.wait(max(conf['POLL_INTERVAL'] - conf['IDLE_TIMEOUT'], 0))
+
+
+outbox_sender = OutboxSender()
@@ -1,6 +1,12 @@
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
 from drf_spectacular.utils import extend_schema, OpenApiParameter, inline_serializer,OpenApiExample
 from rest_framework import serializers
 
+
+class CachedJWTScheme(SimpleJWTScheme):
+    # documents `CachedJWTAuthentication` as the bearer JWT it is
+    target_class = 'users.authentication.CachedJWTAuthentication'
+
 # Documentation for `CustomProviderAuthView` - GET for Authorization URL
 custom_provider_auth_view_get_schema = extend_schema(
     description="This Endpoint returns an `authorization_url` for signing in with Google, redirecting with `state` and `code` parameters.",
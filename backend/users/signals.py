@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_user
+from .tokens import PROFILE_CLAIMS, get_stateless_auth_settings, revocation_list
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # covers password changes, set_password() is always followed by save()
+    invalidate_user(instance.pk)
+    # and again on commit, a request may have cached the old row meanwhile
+    transaction.on_commit(lambda: invalidate_user(instance.pk))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def revoke_profile_claims(sender, instance, created=False, update_fields=None, **kwargs):
+    if created or not get_stateless_auth_settings()['ENABLED']:
+        return
+    # tokens carry these, or are only good while they hold
+    watched = {*PROFILE_CLAIMS, 'is_active', 'password'}
+    if update_fields is not None and not watched & set(update_fields):
+        return
+    transaction.on_commit(lambda: revocation_list.revoke(instance.pk))
@@ -0,0 +1,37 @@
+"""
+A worker process for the shared cache tests.
+
+Runs the cache operations given on the command line against the default
+cache, and prints each result as a JSON line:
+
+    python -m users.tests.cache_worker set:reset@example.com:123456 get:reset@example.com incr:counter:300
+"""
+import json
+import os
+import sys
+
+
+def run(operation, cache):
+    name, key, *args = operation.split(':')
+    if name == 'set':
+        cache.set(key, args[0])
+        return True
+    if name == 'get':
+        return cache.get(key)
+    if name == 'delete':
+        return cache.delete(key)
+    if name == 'incr':
+        for _ in range(int(args[0])):
+            value = cache.incr(key)
+        return value
+    raise ValueError(f"unknown operation {name!r}")
+
+
+if __name__ == '__main__':
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings.debug')
+    import django
+    django.setup()
+    from django.core.cache import cache
+
+    for operation in sys.argv[1:]:
+        print(json.dumps(run(operation, cache)), flush=True)
@@ -2,6 +2,7 @@ from rest_framework.test import APIClient
 import pytest
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from users.tests.smtp_stub import SMTPStub
 
 User = get_user_model()
 
@@ -23,3 +24,15 @@ def authenticate(api_client):
         
     return do_authenticate
 
+
+
+@pytest.fixture
+def smtp_server(settings):
+    server = SMTPStub().start()
+    settings.EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+    settings.EMAIL_HOST = '127.0.0.1'
+    settings.EMAIL_PORT = server.port
+    settings.EMAIL_USE_TLS = False
+    settings.EMAIL_HOST_USER = settings.EMAIL_HOST_PASSWORD = ''
+    yield server
+    server.stop()
@@ -0,0 +1,80 @@
+"""
+A local SMTP server standing in for the real one in tests.
+
+Accepts every message and keeps it in `messages`, and counts the SMTP
+sessions opened in `connections`. `delay` holds back the greeting, the way
+connecting and the TLS handshake to a remote server do, and `fail_next`
+makes that many DATA commands answer with a temporary failure.
+"""
+import email
+import socketserver
+import threading
+
+
+class SMTPStub:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.fail_next = 0
+        self.messages = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                stub.session(self.rfile, self.wfile)
+
+        self._server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def session(self, rfile, wfile):
+        def reply(line):
+            wfile.write(f'{line}\r\n'.encode())
+            wfile.flush()
+
+        with self._lock:
+            self.connections += 1
+        threading.Event().wait(self.delay)
+        reply('220 localhost SMTP stub')
+        for raw in rfile:
+            command = raw.decode().strip().split(' ', 1)[0].upper()
+            if command == 'EHLO':
+                reply('250-localhost')
+                reply('250 8BITMIME')
+            elif command in ('HELO', 'MAIL', 'RCPT', 'RSET', 'NOOP'):
+                reply('250 OK')
+            elif command == 'DATA':
+                with self._lock:
+                    failing = self.fail_next > 0
+                    self.fail_next -= failing
+                if failing:
+                    reply('451 Try again later')
+                    continue
+                reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                for line in rfile:
+                    if line == b'.\r\n':
+                        break
+                    lines.append(line)
+                data = b''.join(lines)
+                with self._lock:
+                    self.messages.append(email.message_from_bytes(data))
+                reply('250 OK')
+            elif command == 'QUIT':
+                reply('221 Bye')
+                return
+            else:
+                reply('502 Command not implemented')
@@ -1,10 +1,26 @@
 # tests/test_jwt_token_obtain.py
+import json
 import pytest
 from rest_framework import status
+from rest_framework_simplejwt import tokens as simplejwt_tokens
 from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
 from datetime import timedelta
 import time
 from datetime import datetime
+from asgiref.sync import async_to_sync
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from project.middleware import JwtAuthMiddlewareStack
+from django.utils import timezone
+import pickle
+from django.core.cache import cache
+from users import authentication
+from users.authentication import get_cached_user, user_cache_key
+from users.models import TokenRevocation
+from users.tokens import has_profile_claims, revocation_list, tokens_for_user
+
+User = get_user_model()
 
 @pytest.mark.django_db
 class TestJWTObtainToken:
@@ -128,4 +144,192 @@ class TestProtectedEndpoints:
     def _extracted_from_test_access_protected_endpoint_with_expired_token_6(self, api_client, arg1):
         response = api_client.get(arg1, format='json')
         assert response.status_code == status.HTTP_401_UNAUTHORIZED
-        assert 'detail' in response.data
\ No newline at end of file
+        assert 'detail' in response.data
+
+@pytest.mark.django_db
+class TestCachedJWTAuthentication:
+    def login(self, api_client, authenticate):
+        user = authenticate()
+        api_client.force_authenticate(user=None)
+        api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return user
+
+    def test_repeated_requests_do_not_query_the_user(self, api_client, authenticate, django_assert_num_queries):
+        self.login(api_client, authenticate)
+        assert api_client.get('/users/me/').status_code == status.HTTP_200_OK
+
+        with django_assert_num_queries(0):
+            response = api_client.get('/users/me/')
+        assert response.data['email'] == 'testuser@gmail.com'
+
+    def test_saved_user_is_not_served_stale(self, api_client, authenticate):
+        user = self.login(api_client, authenticate)
+        api_client.get('/users/me/')
+
+        user.first_name = 'Renamed'
+        user.save()
+        assert api_client.get('/users/me/').data['first_name'] == 'Renamed'
+
+        user.is_active = False
+        user.save()
+        assert api_client.get('/users/me/').status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_password_change_drops_the_cached_user(self, api_client, authenticate):
+        self.login(api_client, authenticate)
+        api_client.get('/users/me/')
+
+        response = api_client.post('/users/changepassword/', {
+            'current_password': 'ILoveDjango', 'password': 'N3w-Passw0rd!', 'password2': 'N3w-Passw0rd!',
+        })
+        assert response.status_code < 300
+        assert get_cached_user(User.objects.get().pk).check_password('N3w-Passw0rd!')
+
+    def test_cache_holds_no_password_hash(self, api_client, authenticate):
+        user = self.login(api_client, authenticate)
+        api_client.get('/users/me/')
+
+        cached = cache.get(user_cache_key(user.pk))
+        assert 'password' not in cached
+        assert user.password.encode() not in pickle.dumps(cached)
+
+    def test_saving_a_cached_user_keeps_the_fields_left_out(self, authenticate):
+        user = authenticate()
+        user.last_name = 'Doe'
+        user.save()
+        get_cached_user(user.pk)
+
+        cached = get_cached_user(user.pk)
+        cached.first_name = 'Renamed'
+        cached.save()
+
+        user.refresh_from_db()
+        assert (user.first_name, user.last_name) == ('Renamed', 'Doe')
+        assert user.check_password('ILoveDjango')
+
+    def test_revoke_token_check_works_from_the_cache(self, api_client, authenticate, monkeypatch, django_assert_num_queries):
+        # simplejwt swaps its settings object on reload, patch the ones in use
+        for module in (authentication, simplejwt_tokens):
+            monkeypatch.setattr(module.api_settings, 'CHECK_REVOKE_TOKEN', True)
+        user = self.login(api_client, authenticate)
+        assert api_client.get('/users/me/').status_code == status.HTTP_200_OK
+        with django_assert_num_queries(0):
+            assert api_client.get('/users/me/').status_code == status.HTTP_200_OK
+
+        user.set_password('N3w-Passw0rd!')
+        user.save()
+        assert api_client.get('/users/me/').status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_deleted_user_is_rejected(self, api_client, authenticate):
+        user = self.login(api_client, authenticate)
+        api_client.get('/users/me/')
+
+        user.delete()
+        assert api_client.get('/users/me/').status_code == status.HTTP_401_UNAUTHORIZED
+
+
+class ScopeUserConsumer(AsyncWebsocketConsumer):
+    async def connect(self):
+        await self.accept()
+        user = self.scope['user']
+        await self.send(text_data=json.dumps({
+            'id': user.pk if user.is_authenticated else None,
+            'class': type(user).__name__,
+            'name': getattr(user, 'first_name', None),
+        }))
+
+
+def connect_as(query_string):
+    async def run():
+        communicator = WebsocketCommunicator(JwtAuthMiddlewareStack(ScopeUserConsumer.as_asgi()), f'/ws/?{query_string}')
+        connected, _ = await communicator.connect()
+        assert connected
+        user = json.loads(await communicator.receive_from())
+        await communicator.disconnect()
+        return user
+
+    return async_to_sync(run)()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestJwtAuthMiddleware:
+    def test_valid_token_sets_the_user(self, authenticate):
+        user = authenticate()
+        assert connect_as(f'token={AccessToken.for_user(user)}')['id'] == user.pk
+
+    @pytest.mark.parametrize('query_string', ['', 'token=', 'token=invalid'])
+    def test_missing_or_invalid_token_is_anonymous(self, query_string):
+        assert connect_as(query_string)['id'] is None
+
+    def test_compact_mode_keeps_a_small_principal(self, authenticate, settings):
+        settings.COMPACT_WEBSOCKETS = True
+        user = authenticate()
+        assert connect_as(f'token={AccessToken.for_user(user)}')['class'] == 'WebsocketPrincipal'
+
+        settings.COMPACT_WEBSOCKETS = False
+        assert connect_as(f'token={AccessToken.for_user(user)}')['class'] == 'User'
+
+
+@pytest.fixture
+def stateless_auth(settings):
+    settings.STATELESS_WEBSOCKET_AUTH = {'ENABLED': True, 'SYNC_INTERVAL': 60}
+    # keep the TokenUser or User in the scope, to tell them apart
+    settings.COMPACT_WEBSOCKETS = False
+    revocation_list.clear()
+    yield
+    revocation_list.clear()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestStatelessWebsocketAuth:
+    def make_user(self, **kwargs):
+        return User.objects.create_user(email='sam@example.com', password='ILoveDjango', first_name='Sam', **kwargs)
+
+    def test_issued_tokens_carry_profile_claims(self, api_client, stateless_auth):
+        self.make_user(is_superuser=True)
+        response = api_client.post('/auth/jwt/create/', {'email': 'sam@example.com', 'password': 'ILoveDjango'})
+        access = AccessToken(response.data['access'])
+        assert access['first_name'] == 'Sam'
+        assert access['is_superuser'] is True
+
+        response = api_client.post('/users/', {'email': 'kim@example.com', 'password': 'ILoveDjango', 'password2': 'ILoveDjango'})
+        assert has_profile_claims(AccessToken(response.data['access']))
+
+        refreshed = RefreshToken(response.data['refresh']).access_token
+        assert has_profile_claims(refreshed)
+
+    def test_connect_builds_user_from_claims_without_queries(self, stateless_auth, django_assert_num_queries):
+        user = self.make_user()
+        token = tokens_for_user(user).access_token
+        revocation_list.sync()
+
+        with django_assert_num_queries(0):
+            principal = connect_as(f'token={token}')
+
+        assert principal == {'id': user.pk, 'class': 'TokenUser', 'name': 'Sam'}
+
+    def test_changed_user_falls_back_to_the_database(self, stateless_auth):
+        user = self.make_user()
+        token = tokens_for_user(user).access_token
+        user.first_name = 'Samantha'
+        user.save()
+
+        assert connect_as(f'token={token}') == {'id': user.pk, 'class': 'User', 'name': 'Samantha'}
+
+        user.is_active = False
+        user.save()
+        assert connect_as(f'token={token}')['id'] is None
+
+    def test_revocations_from_other_workers_are_synced(self, stateless_auth, settings):
+        user = self.make_user()
+        token = tokens_for_user(user).access_token
+        revocation_list.sync()
+        # written by another worker, not seen until the next sync
+        TokenRevocation.objects.create(user_id=user.pk, revoked_at=timezone.now())
+        assert connect_as(f'token={token}')['class'] == 'TokenUser'
+
+        settings.STATELESS_WEBSOCKET_AUTH = {'ENABLED': True, 'SYNC_INTERVAL': 0}
+        assert connect_as(f'token={token}')['class'] == 'User'
+
+    def test_disabled_by_default(self, api_client):
+        user = self.make_user()
+        assert not has_profile_claims(tokens_for_user(user))
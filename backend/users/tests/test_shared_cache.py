@@ -0,0 +1,89 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from django.conf import settings as django_settings
+from django.core.cache import caches
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / 'cache.sqlite3')
+
+
+@pytest.fixture
+def tiered_cache(cache_path, settings):
+    settings.CACHES = {
+        'default': {
+            'BACKEND': 'project.cache.TieredCache',
+            'OPTIONS': {'SHARED': 'shared', 'LOCAL_KEY_PREFIXES': ['immutable:']},
+        },
+        'shared': {'BACKEND': 'project.cache.SQLiteCache', 'LOCATION': cache_path},
+    }
+    return caches['default']
+
+
+def start_worker(cache_path, *operations):
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': 'project.settings.debug',
+        'CACHE_BACKEND': 'sqlite',
+        'CACHE_SQLITE_PATH': cache_path,
+    }
+    return subprocess.Popen(
+        [sys.executable, '-m', 'users.tests.cache_worker', *operations],
+        cwd=django_settings.BASE_DIR,
+        env=env,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+
+
+def run_worker(cache_path, *operations):
+    worker = start_worker(cache_path, *operations)
+    output, _ = worker.communicate(timeout=30)
+    assert worker.returncode == 0
+    return [json.loads(line) for line in output.splitlines()]
+
+
+class TestSharedCacheAcrossWorkers:
+    def test_reset_code_issued_by_one_worker_is_seen_by_another(self, cache_path):
+        assert run_worker(cache_path, 'set:reset@example.com:123456') == [True]
+        assert run_worker(cache_path, 'get:reset@example.com', 'delete:reset@example.com') == ['123456', True]
+        assert run_worker(cache_path, 'get:reset@example.com') == [None]
+
+    def test_concurrent_increments_are_not_lost(self, cache_path, tiered_cache):
+        tiered_cache.set('counter', 0)
+        workers = [start_worker(cache_path, 'incr:counter:300') for _ in range(2)]
+        for worker in workers:
+            worker.communicate(timeout=60)
+            assert worker.returncode == 0
+
+        assert tiered_cache.get('counter') == 600
+
+
+class TestTieredCache:
+    def test_only_immutable_keys_are_kept_in_process(self, tiered_cache):
+        tiered_cache.set('immutable:response', 'page')
+        tiered_cache.set('counter', 1)
+        # another worker changing the shared cache behind our back
+        caches['shared'].delete('immutable:response')
+        caches['shared'].set('counter', 2)
+
+        assert tiered_cache.get('immutable:response') == 'page'
+        assert tiered_cache.get('counter') == 2
+
+    def test_add_and_incr_go_through_the_shared_cache(self, tiered_cache):
+        assert tiered_cache.add('generation', 10)
+        assert not tiered_cache.add('generation', 20)
+        assert tiered_cache.incr('generation') == 11
+        assert caches['shared'].get('generation') == 11
+        assert tiered_cache.get_many(['generation', 'missing']) == {'generation': 11}
+        with pytest.raises(ValueError):
+            tiered_cache.incr('missing')
+
+    def test_expired_entries_are_gone(self, tiered_cache):
+        tiered_cache.set('short', 'value', timeout=0)
+        assert tiered_cache.get('short') is None
+        assert tiered_cache.add('short', 'again')
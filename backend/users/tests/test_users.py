@@ -3,6 +3,11 @@ from django.contrib.auth import get_user_model
 from django.conf import settings
 from rest_framework import status
 from model_bakery import baker
+from datetime import timedelta
+from django.utils import timezone
+from users.models import OutboxEmail
+from users import outbox
+from users.outbox import claim_batch, prune_finished, queue_mail, send_pending
 import pytest
 
 User = get_user_model()
@@ -96,6 +101,8 @@ class TestRequestResetPassword():
         response = api_client.post('/users/request-reset-password/', {"email":'testuser@gmail.com'})
         
         assert response.status_code == status.HTTP_201_CREATED
+        assert len(mail.outbox) == 0
+        assert send_pending() == 1
         assert len(mail.outbox) == 1
         email = mail.outbox[0]
         assert email.subject == "Password Reset Code"
@@ -111,6 +118,99 @@ class TestRequestResetPassword():
         assert response.status_code == status.HTTP_400_BAD_REQUEST
         
         
+@pytest.mark.django_db
+class TestEmailOutbox:
+    def queue(self, count):
+        for i in range(count):
+            queue_mail("Password Reset Code", "code", [f'user{i}@example.com'])
+
+    def test_batch_is_sent_over_one_connection(self, smtp_server):
+        self.queue(5)
+
+        assert send_pending() == 5
+        assert smtp_server.connections == 1
+        assert sorted(message['To'] for message in smtp_server.messages) == [f'user{i}@example.com' for i in range(5)]
+        assert not OutboxEmail.objects.exclude(status=OutboxEmail.Status.SENT).exists()
+
+    def test_sent_emails_do_not_keep_their_body(self, smtp_server):
+        self.queue(1)
+
+        send_pending()
+        assert 'code' in smtp_server.messages[0].get_payload()
+        assert OutboxEmail.objects.get().body == ''
+
+    def test_failed_send_is_retried_with_backoff(self, smtp_server, settings):
+        settings.EMAIL_OUTBOX = {'BACKOFF': 30, 'MAX_ATTEMPTS': 3}
+        self.queue(2)
+        smtp_server.fail_next = 1
+
+        assert send_pending() == 1
+        failed = OutboxEmail.objects.get(status=OutboxEmail.Status.PENDING)
+        assert failed.attempts == 1
+        assert failed.next_attempt_at > timezone.now() + timedelta(seconds=25)
+        assert '451' in failed.last_error
+
+        # not due yet
+        assert send_pending() == 0
+        OutboxEmail.objects.filter(pk=failed.pk).update(next_attempt_at=timezone.now())
+        assert send_pending() == 1
+        assert len(smtp_server.messages) == 2
+
+    def test_gives_up_after_max_attempts(self, smtp_server, settings):
+        settings.EMAIL_OUTBOX = {'BACKOFF': 0, 'MAX_ATTEMPTS': 2}
+        self.queue(1)
+        smtp_server.fail_next = 2
+
+        send_pending()
+        send_pending()
+
+        email = OutboxEmail.objects.get()
+        assert email.status == OutboxEmail.Status.FAILED
+        assert email.attempts == 2
+        assert email.body == ''
+        assert send_pending() == 0
+
+    @pytest.mark.parametrize('fail_next', [0, 1])
+    def test_rows_handled_between_select_and_lease_are_not_claimed(self, smtp_server, settings, monkeypatch, fail_next):
+        settings.EMAIL_OUTBOX = {'BACKOFF': 30}
+        self.queue(1)
+        smtp_server.fail_next = fail_next
+        other_sender = {}
+
+        def timedelta_after_other_sender(*args, **kwargs):
+            # sender A has selected its ids, sender B claims and sends (or
+            # fails and reschedules) the same rows before A takes its lease
+            if not other_sender:
+                other_sender['sent'] = None  # B's own claim passes through here too
+                other_sender['sent'] = send_pending()
+            return timedelta(*args, **kwargs)
+
+        monkeypatch.setattr(outbox, 'timedelta', timedelta_after_other_sender)
+        assert claim_batch(10, 300) == []
+        assert other_sender['sent'] == 1 - fail_next
+        assert len(smtp_server.messages) == 1 - fail_next
+
+    def test_finished_emails_are_pruned_after_retention(self, smtp_server, settings):
+        settings.EMAIL_OUTBOX = {'RETENTION_DAYS': 7}
+        self.queue(3)
+        send_pending()
+        self.queue(1)
+        old, recent, _, pending = OutboxEmail.objects.order_by('pk')
+        OutboxEmail.objects.filter(pk=old.pk).update(status=OutboxEmail.Status.FAILED)
+        OutboxEmail.objects.filter(pk__in=[old.pk, pending.pk]).update(created_at=timezone.now() - timedelta(days=8))
+
+        assert prune_finished() == 1
+        assert not OutboxEmail.objects.filter(pk=old.pk).exists()
+        assert OutboxEmail.objects.filter(pk__in=[recent.pk, pending.pk]).count() == 2
+
+    def test_claimed_emails_are_not_sent_twice(self, smtp_server):
+        self.queue(1)
+        OutboxEmail.objects.update(locked_until=timezone.now() + timedelta(minutes=5))
+
+        assert send_pending() == 0
+        assert smtp_server.messages == []
+
+
 @pytest.mark.django_db
 class TestUserInfo:
     def test_if_user_is_annonymous_returns_401(self, api_client):
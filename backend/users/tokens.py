@@ -0,0 +1,104 @@
+"""
+Tokens carrying the profile claims the websockets need.
+
+With `STATELESS_WEBSOCKET_AUTH['ENABLED']`, tokens are issued with the
+user's `first_name` and `is_superuser`, and `JwtAuthMiddleware` turns such
+a token into a `TokenUser` without looking the user up. A token whose
+claims may be outdated, because the user changed since it was issued, is
+caught by the in-memory `RevocationList` and the user is then looked up
+as usual.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import TokenRevocation
+
+DEFAULTS = {
+    'ENABLED': False,
+    # seconds between two reads of the revocations made by other workers
+    'SYNC_INTERVAL': 5,
+}
+
+PROFILE_CLAIMS = ('first_name', 'is_superuser')
+# when the claims were read from the user, copied into refreshed access tokens
+PROFILE_ISSUED_AT_CLAIM = 'profile_iat'
+
+
+def get_stateless_auth_settings():
+    return {**DEFAULTS, **getattr(settings, 'STATELESS_WEBSOCKET_AUTH', {})}
+
+
+def add_profile_claims(token, user):
+    if get_stateless_auth_settings()['ENABLED']:
+        for claim in PROFILE_CLAIMS:
+            token[claim] = getattr(user, claim)
+        token[PROFILE_ISSUED_AT_CLAIM] = time.time()
+    return token
+
+
+def tokens_for_user(user):
+    """`RefreshToken.for_user`, with the profile claims when enabled."""
+    return add_profile_claims(RefreshToken.for_user(user), user)
+
+
+def has_profile_claims(token):
+    return PROFILE_ISSUED_AT_CLAIM in token
+
+
+class ProfileTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_profile_claims(super().get_token(user), user)
+
+
+class RevocationList:
+    """
+    User id -> the time before which that user's profile claims can't be
+    trusted. Checks are a dict lookup. Revocations made by other workers
+    are read from `TokenRevocation` at most once every `SYNC_INTERVAL`
+    seconds, so until then their tokens may still be trusted here.
+    """
+
+    def __init__(self):
+        self._revoked = {}
+        self._synced_at = None
+        self._lock = threading.Lock()
+
+    def revoke(self, user_id):
+        now = timezone.now()
+        self._revoked[user_id] = now.timestamp()
+        TokenRevocation.objects.create(user_id=user_id, revoked_at=now)
+        # no token older than a refresh token's lifetime is still valid
+        TokenRevocation.objects.filter(revoked_at__lt=now - api_settings.REFRESH_TOKEN_LIFETIME).delete()
+
+    def needs_sync(self):
+        return self._synced_at is None or time.monotonic() - self._synced_at > get_stateless_auth_settings()['SYNC_INTERVAL']
+
+    def sync(self):
+        with self._lock:
+            now = timezone.now()
+            oldest = (now - api_settings.REFRESH_TOKEN_LIFETIME).timestamp()
+            rows = TokenRevocation.objects.filter(revoked_at__gte=now - api_settings.REFRESH_TOKEN_LIFETIME)
+            revoked = {}
+            for user_id, revoked_at in rows.values_list('user_id', 'revoked_at'):
+                revoked[user_id] = max(revoked.get(user_id, oldest), revoked_at.timestamp())
+            self._revoked = revoked
+            self._synced_at = time.monotonic()
+
+    def is_revoked(self, token):
+        revoked_at = self._revoked.get(token.get(api_settings.USER_ID_CLAIM))
+        return revoked_at is not None and token[PROFILE_ISSUED_AT_CLAIM] <= revoked_at
+
+    def clear(self):
+        with self._lock:
+            self._revoked = {}
+            self._synced_at = None
+
+
+revocation_list = RevocationList()